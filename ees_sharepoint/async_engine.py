@@ -0,0 +1,344 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""async_engine module allows to fetch the items of SharePoint lists with asyncio.
+
+The pages of items of all the lists are fetched concurrently over aiohttp, with up
+to sharepoint_async_concurrency requests in flight, instead of one request per
+thread. Each page is then turned into documents by SyncSharepoint, on a pool of
+threads, so the documents and ids are the same as the ones of the threaded crawl.
+
+The engine is optional, it requires the aiohttp package."""
+import asyncio
+import hashlib
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dateutil.parser import parse
+from ntlm_auth import ntlm
+from requests.utils import requote_uri
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+from .rate_limiter import MAX_THROTTLE_RETRIES, backoff, get_request_class, get_retry_after, is_throttled
+from .sharepoint_client import PAGE_SIZE, PageFetchException, parse_page
+
+
+# Hash algorithms of the signature algorithms of certificates, by object identifier. The certificates signed
+# with MD5 or SHA-1 are hashed with SHA-256 for the channel bindings, as set by RFC 5929 section 4.1
+SIGNATURE_HASHES = {
+    "1.2.840.113549.1.1.4": "sha256",
+    "1.2.840.113549.1.1.5": "sha256",
+    "1.2.840.113549.1.1.11": "sha256",
+    "1.2.840.113549.1.1.12": "sha384",
+    "1.2.840.113549.1.1.13": "sha512",
+    "1.2.840.113549.1.1.14": "sha224",
+    "1.2.840.10045.4.1": "sha256",
+    "1.2.840.10045.4.3.1": "sha224",
+    "1.2.840.10045.4.3.2": "sha256",
+    "1.2.840.10045.4.3.3": "sha384",
+    "1.2.840.10045.4.3.4": "sha512",
+    "1.2.840.10040.4.3": "sha256",
+    "2.16.840.1.101.3.4.3.2": "sha256",
+}
+RSASSA_PSS = "1.2.840.113549.1.1.10"
+# Hash algorithms of the RSASSA-PSS parameters, SHA-1 being their default
+PSS_HASHES = {
+    "1.3.14.3.2.26": "sha256",
+    "2.16.840.1.101.3.4.2.1": "sha256",
+    "2.16.840.1.101.3.4.2.2": "sha384",
+    "2.16.840.1.101.3.4.2.3": "sha512",
+    "2.16.840.1.101.3.4.2.4": "sha224",
+}
+
+
+def read_der_element(data, offset):
+    """Reads the header of a DER encoded element
+    :param data: DER encoded data
+    :param offset: offset of the element
+    Returns:
+        tag of the element, offset of its content and offset of its end
+    """
+    tag, length = data[offset], data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[offset: offset + size], "big")
+        offset += size
+    return tag, offset, offset + length
+
+
+def decode_oid(content):
+    """Decodes the content of a DER encoded object identifier into its dotted form"""
+    parts = [content[0] // 40, content[0] % 40]
+    value = 0
+    for byte in content[1:]:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            parts.append(value)
+            value = 0
+    return ".".join(map(str, parts))
+
+
+def get_certificate_hash(certificate):
+    """Returns the hash of the certificate of the server binding the NTLM authentication to the TLS channel,
+    computed with the hash algorithm of the signature of the certificate as set by RFC 5929
+    :param certificate: DER encoded certificate
+    Returns:
+        hexadecimal hash of the certificate, or None if its signature algorithm is unknown
+    """
+    try:
+        _, offset, _ = read_der_element(certificate, 0)
+        _, _, offset = read_der_element(certificate, offset)
+        _, offset, algorithm_end = read_der_element(certificate, offset)
+        _, oid_start, oid_end = read_der_element(certificate, offset)
+        algorithm = decode_oid(certificate[oid_start: oid_end])
+        hash_name = SIGNATURE_HASHES.get(algorithm)
+        if algorithm == RSASSA_PSS:
+            # SHA-1 is the default hash algorithm of the parameters, replaced by SHA-256
+            hash_name = "sha256"
+            if oid_end < algorithm_end:
+                _, offset, parameters_end = read_der_element(certificate, oid_end)
+                tag, offset, _ = read_der_element(certificate, offset)
+                if offset < parameters_end and tag == 0xA0:
+                    _, offset, _ = read_der_element(certificate, offset)
+                    _, oid_start, oid_end = read_der_element(certificate, offset)
+                    hash_name = PSS_HASHES.get(decode_oid(certificate[oid_start: oid_end]))
+    except IndexError:
+        return None
+    if hash_name is None:
+        return None
+    return hashlib.new(hash_name, certificate).hexdigest().upper()
+
+
+def is_available():
+    """Returns whether the packages required by the asyncio engine are installed"""
+    return aiohttp is not None
+
+
+class AsyncSharePoint:
+    """This class fetches pages of results from the SharePoint server with aiohttp.
+
+    NTLM authenticates a connection rather than a request, so the client keeps a pool of
+    sessions holding a single keep-alive connection each, authenticated on its first request.
+    The size of the pool bounds the number of requests in flight. Requests go through the rate
+    limiter of the blocking client, so that both clients share the same limits."""
+
+    def __init__(self, config, logger, concurrency, rate_limiter):
+        self.logger = logger
+        self.rate_limiter = rate_limiter
+        self.retry_count = int(config.get_value("retry_count"))
+        self.host = config.get_value("sharepoint.host_url")
+        self.domain = config.get_value("sharepoint.domain")
+        self.username = config.get_value("sharepoint.username")
+        self.password = config.get_value("sharepoint.password")
+        self.concurrency = int(concurrency)
+        self.odata_metadata = config.get_value("sharepoint_odata_metadata")
+        secure_connection = config.get_value("sharepoint.secure_connection")
+        certificate_path = config.get_value("sharepoint.certificate_path")
+        if secure_connection and certificate_path:
+            self.ssl = ssl.create_default_context(cafile=certificate_path)
+        else:
+            self.ssl = None if secure_connection else False
+        self.sessions = None
+        self.session_count = 0
+        self.stats = {"sessions": 0, "requests": 0}
+
+    async def __aenter__(self):
+        self.sessions = asyncio.LifoQueue()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        while not self.sessions.empty():
+            await self.sessions.get_nowait().close()
+
+    async def acquire_session(self):
+        """Returns an idle session, creating one while the pool is not full"""
+        if self.sessions.empty() and self.session_count < self.concurrency:
+            self.session_count += 1
+            self.stats["sessions"] += 1
+            connector = aiohttp.TCPConnector(limit=1, ssl=self.ssl)
+            return aiohttp.ClientSession(
+                connector=connector,
+                headers={"accept": f"application/json;odata={self.odata_metadata}", "Connection": "Keep-Alive"},
+            )
+        return await self.sessions.get()
+
+    async def request(self, session, url):
+        """Invokes a GET call, going through the NTLM handshake when the server asks for it
+        :param session: session holding the connection the request is sent on
+        :param url: absolute url of the request
+        Returns:
+            status, reason, headers and body of the response
+        """
+        url = yarl.URL(requote_uri(url), encoded=True)
+        self.stats["requests"] += 1
+        async with session.get(url) as response:
+            if response.status != 401 or "NTLM" not in response.headers.get("WWW-Authenticate", ""):
+                return response.status, response.reason, response.headers, await response.read()
+            # The hash of the certificate of the server binds the authentication to the TLS channel
+            certificate = None
+            transport = response.connection and response.connection.transport
+            ssl_object = transport and transport.get_extra_info("ssl_object")
+            if ssl_object:
+                certificate = get_certificate_hash(ssl_object.getpeercert(True))
+            await response.read()
+        context = ntlm.Ntlm()
+        negotiate_message = context.create_negotiate_message(self.domain).decode("ascii")
+        async with session.get(url, headers={"Authorization": f"NTLM {negotiate_message}"}) as response:
+            await response.read()
+            challenge = next((
+                value.strip()[len("NTLM "):]
+                for value in response.headers.get("WWW-Authenticate", "").split(",")
+                if value.strip().startswith("NTLM ")
+            ), None)
+            if challenge is None:
+                return response.status, response.reason, response.headers, None
+        context.parse_challenge_message(challenge)
+        authenticate_message = context.create_authenticate_message(
+            self.username, self.password, self.domain, server_certificate_hash=certificate
+        ).decode("ascii")
+        async with session.get(url, headers={"Authorization": f"NTLM {authenticate_message}"}) as response:
+            return response.status, response.reason, response.headers, await response.read()
+
+    async def acquire_slot(self):
+        """Waits until the rate limiter allows a request to be sent"""
+        while True:
+            delay = self.rate_limiter.try_acquire()
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+
+    async def fetch(self, url):
+        """Invokes a GET call to the given url, retrying in case of server errors or throttling
+        :param url: absolute url of the request
+        Returns:
+            body of the response, or None if the request failed
+        """
+        retry, throttle_retry = 0, 0
+        while retry <= self.retry_count:
+            await self.acquire_slot()
+            session = await self.acquire_session()
+            start_time = time.monotonic()
+            status, reason, headers, body = None, None, {}, None
+            try:
+                status, reason, headers, body = await self.request(session, url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exception:
+                reason = exception
+            finally:
+                self.sessions.put_nowait(session)
+                retry_after = get_retry_after(headers)
+                self.rate_limiter.release(time.monotonic() - start_time, status, retry_after, get_request_class(url))
+            if is_throttled(status, retry_after) and throttle_retry < MAX_THROTTLE_RETRIES:
+                self.logger.warning(
+                    f"The sharepoint server throttled the request, url: {url}. Throttle Retry Count: {throttle_retry}."
+                )
+                throttle_retry += 1
+                continue
+            if status is not None and status < 400:
+                return body
+            if status is not None and status < 500:
+                self.logger.error(f"Error: {reason}. Error while fetching from the sharepoint, url: {url}.")
+                return None
+            self.logger.error(
+                f"Error while fetching from the sharepoint, url: {url}. Retry Count: {retry}. Error: {reason}"
+            )
+            # This condition is to avoid sleeping for the last time
+            if retry < self.retry_count:
+                await asyncio.sleep(backoff(retry))
+            retry += 1
+        return None
+
+    async def get_pages(self, rel_url, query):
+        """Invokes paginated GET calls following the next links of the results
+        :param rel_url: relative url to the sharepoint farm
+        :param query: query for passing arguments to the url
+        Yields:
+            List of results of a page
+        Raises:
+            PageFetchException: if a page could not be fetched
+        """
+        url = f"{self.host}/{rel_url}{query}&$top={PAGE_SIZE}"
+        while url:
+            body = await self.fetch(url)
+            if body is None:
+                raise PageFetchException(url)
+            results, url = parse_page(body)
+            yield results
+
+
+class AsyncItemCrawler:
+    """This class fetches the list items or drive items of the partitions of lists concurrently.
+
+    Every partition is crawled by its own task, the number of pages being fetched or waiting to
+    be turned into documents being bounded by a global semaphore. The documents of a page are
+    built by SyncSharepoint on a pool of thread_count threads, as their permissions and files
+    are fetched by the blocking client."""
+
+    def __init__(self, config, logger, sync_sharepoint, thread_count):
+        self.config = config
+        self.logger = logger
+        self.sync_sharepoint = sync_sharepoint
+        self.thread_count = thread_count
+        self.concurrency = int(config.get_value("sharepoint_async_concurrency"))
+
+    def crawl(self, key, partitions, ids):
+        """Fetches and appends the items of the partitions to the queue
+        :param key: LIST_ITEMS or DRIVE_ITEMS
+        :param partitions: list of dictionaries holding a list, along with the range of item Ids to be fetched
+        :param ids: structure containing id's of all objects
+        Returns:
+            statistics of the client
+        """
+        return asyncio.run(self.crawl_partitions(key, partitions, ids))
+
+    async def crawl_partitions(self, key, partitions, ids):
+        """Crawls all the partitions concurrently"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        schema = self.sync_sharepoint.get_document_schema(key)
+        rate_limiter = self.sync_sharepoint.sharepoint_client.rate_limiter
+        async with AsyncSharePoint(self.config, self.logger, self.concurrency, rate_limiter) as client:
+            with ThreadPoolExecutor(max_workers=self.thread_count) as executor:
+                await asyncio.gather(*(
+                    self.crawl_list(client, semaphore, executor, key, list_id, value, ids, schema)
+                    for partition in partitions
+                    for list_id, value in partition.items()
+                ))
+            return client.stats
+
+    async def crawl_list(self, client, semaphore, executor, key, list_id, value, ids, schema):
+        """Fetches the pages of items of a list, handing each of them to SyncSharepoint"""
+        if parse(self.sync_sharepoint.start_time) > parse(value[2]):
+            return
+        rel_url, query = self.sync_sharepoint.get_items_request(key, list_id, value, ids)
+        self.logger.info("Fetching the items for list: %s from url: %s" % (value[1], rel_url))
+        loop = asyncio.get_running_loop()
+        pages = client.get_pages(rel_url, query)
+        while True:
+            async with semaphore:
+                try:
+                    response_data = await pages.__anext__()
+                except StopAsyncIteration:
+                    return
+                except PageFetchException as exception:
+                    self.logger.error(f"The items of the list {value[1]} could not all be fetched. Error: {exception}")
+                    return
+                if response_data:
+                    await loop.run_in_executor(
+                        executor, self.append_page_to_queue, key, response_data, list_id, value, ids, schema
+                    )
+
+    def append_page_to_queue(self, key, response_data, list_id, value, ids, schema):
+        """Builds the documents of a page of items and appends them to the queue"""
+        if key == "list_items":
+            document = self.sync_sharepoint.get_list_item_documents(response_data, list_id, value, ids, schema)
+        else:
+            document = self.sync_sharepoint.get_drive_item_documents(response_data, list_id, value, ids, schema)
+        self.sync_sharepoint.append_to_queue(key, document)
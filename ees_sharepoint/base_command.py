@@ -21,7 +21,8 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from .configuration import Configuration
 from .enterprise_search_wrapper import EnterpriseSearchWrapper
-from .local_storage import LocalStorage
+from .extraction import Extractor
+from .local_storage import BinaryStorage, FingerprintStorage, LocalStorage, SqliteStorage
 from .sharepoint_client import SharePoint
 
 
@@ -78,6 +79,11 @@ class BaseCommand:
         """Get the sharepoint client instance for the running command."""
         return SharePoint(self.config, self.logger)
 
+    @cached_property
+    def extractor(self):
+        """Get the extractor instance parsing the files fetched by the running command."""
+        return Extractor(self.config, self.logger)
+
     @staticmethod
     def producer(thread_count, func, args, items, wait=False):
         """Apply async calls using multithreading to the targeted function
@@ -106,4 +112,16 @@ class BaseCommand:
     @cached_property
     def local_storage(self):
         """Get the object for local storage to fetch and update ids stored locally"""
+        if self.config.get_value("ids_storage") == "sqlite":
+            return SqliteStorage(self.logger)
+        if self.config.get_value("ids_storage") == "binary":
+            return BinaryStorage(self.logger)
         return LocalStorage(self.logger)
+
+    @cached_property
+    def fingerprint_storage(self):
+        """Get the object keeping the fingerprints of the indexed documents, None if unchanged documents
+        are sent again"""
+        if self.config.get_value("skip_unchanged_documents"):
+            return FingerprintStorage(self.logger)
+        return None
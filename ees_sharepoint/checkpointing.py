@@ -16,6 +16,8 @@ import os
 import json
 
 CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), "checkpoint.json")
+# Key of the change tokens of the collections in the checkpoint file
+CHANGE_TOKENS = "change_tokens"
 
 
 class Checkpoint:
@@ -128,3 +130,48 @@ class Checkpoint:
                     "Error while updating the existing checkpoint json file. Adding the new content directly instead of updating. Error: %s"
                     % exception
                 )
+
+    def get_change_token(self, collection):
+        """This method fetches the change token of the last change synced from the change log
+        of a collection, stored in the checkpoint file.
+        :param collection: collection name
+        Returns:
+            change token, or None if it was never stored"""
+        if not (os.path.exists(CHECKPOINT_PATH) and os.path.getsize(CHECKPOINT_PATH) > 0):
+            return None
+        with open(CHECKPOINT_PATH) as checkpoint_store:
+            try:
+                checkpoint_list = json.load(checkpoint_store)
+            except ValueError as exception:
+                self.logger.exception(
+                    "Error while parsing the json file of the checkpoint store from path: %s. Error: %s"
+                    % (CHECKPOINT_PATH, exception)
+                )
+                return None
+        return checkpoint_list.get(CHANGE_TOKENS, {}).get(collection)
+
+    def set_change_token(self, collection, change_token):
+        """This method stores the change token of the last change synced from the change log
+        of a collection, along with the checkpoints in the checkpoint file.
+        :param collection: collection name
+        :param change_token: change token"""
+        checkpoint_list = {}
+        if os.path.exists(CHECKPOINT_PATH) and os.path.getsize(CHECKPOINT_PATH) > 0:
+            with open(CHECKPOINT_PATH) as checkpoint_store:
+                try:
+                    checkpoint_list = json.load(checkpoint_store)
+                except ValueError as exception:
+                    self.logger.exception(
+                        "Error while parsing the json file of the checkpoint store from path: %s. Error: %s"
+                        % (CHECKPOINT_PATH, exception)
+                    )
+        checkpoint_list.setdefault(CHANGE_TOKENS, {})[collection] = change_token
+        with open(CHECKPOINT_PATH, "w") as checkpoint_store:
+            try:
+                json.dump(checkpoint_list, checkpoint_store, indent=4)
+                self.logger.info("Successfully saved the change token")
+            except ValueError as exception:
+                self.logger.exception(
+                    "Error while updating the change token in the checkpoint json file. Error: %s"
+                    % exception
+                )
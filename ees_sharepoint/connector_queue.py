@@ -4,18 +4,14 @@
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
 import multiprocessing
+import queue
 from multiprocessing.queues import Queue
 
 BATCH_SIZE = 100
 
 
-class ConnectorQueue(Queue):
-    """Class to support additional queue operations specific to the connector"""
-
-    def __init__(self, logger):
-        ctx = multiprocessing.get_context()
-        self.logger = logger
-        super(ConnectorQueue, self).__init__(ctx=ctx)
+class ConnectorQueueMixin:
+    """Queue operations specific to the connector, shared by all the queue implementations"""
 
     def end_signal(self):
         """Send an terminate signal to indicate the queue can be closed"""
@@ -23,16 +19,66 @@ class ConnectorQueue(Queue):
         signal_close = {"type": "signal_close"}
         self.put(signal_close)
 
-    def put_checkpoint(self, key, checkpoint_time, indexing_type):
+    def put_checkpoint(self, key, checkpoint_time, indexing_type, change_token=None):
         """Put the checkpoint object in the queue which will be used by the consumer to update the checkpoint file
 
         :param key: The key of the checkpoint dictionary
         :param checkpoint_time: The end time that will be stored in the checkpoint as {'key': 'checkpoint_time'}
         :param indexing_type: The type of the indexing i.e. Full or Incremental
+        :param change_token: The change token of the last change synced from the change log, if any
         """
 
         checkpoint = {
             "type": "checkpoint",
-            "data": (key, checkpoint_time, indexing_type),
+            "data": (key, checkpoint_time, indexing_type, change_token),
         }
         self.put(checkpoint)
+
+
+class ConnectorQueue(ConnectorQueueMixin, queue.Queue):
+    """Bounded queue shared by the producer and consumer threads of a sync.
+
+    Documents are passed by reference, without being pickled. Once the queue reaches
+    its high watermark (maxsize), producers stay blocked until the consumers drained it
+    down to the low watermark, instead of waking up for every single free slot."""
+
+    def __init__(self, logger, maxsize=0, low_watermark=None):
+        super(ConnectorQueue, self).__init__(maxsize=maxsize)
+        self.logger = logger
+        self.low_watermark = maxsize // 2 if low_watermark is None else low_watermark
+        self.draining = False
+
+    def put(self, item, block=True, timeout=None):
+        """Put an item into the queue, waiting for the queue to drain to the low watermark if it is full"""
+        with self.not_full:
+            if self.draining:
+                if not block:
+                    raise queue.Full
+                self.logger.debug("Queue reached its maximum size, waiting for the consumers to drain it")
+                if not self.not_full.wait_for(lambda: not self.draining, timeout):
+                    raise queue.Full
+        super(ConnectorQueue, self).put(item, block, timeout)
+
+    def _put(self, item):
+        super(ConnectorQueue, self)._put(item)
+        if self.maxsize > 0 and self._qsize() >= self.maxsize:
+            self.draining = True
+
+    def _get(self):
+        item = super(ConnectorQueue, self)._get()
+        if self.draining and self._qsize() <= self.low_watermark:
+            self.draining = False
+            self.not_full.notify_all()
+        return item
+
+
+class MultiprocessingConnectorQueue(ConnectorQueueMixin, Queue):
+    """Queue that can be shared with other processes.
+
+    Every item is pickled and sent through a pipe, hence it should only be used
+    when producers or consumers run in separate processes."""
+
+    def __init__(self, logger, maxsize=0):
+        ctx = multiprocessing.get_context()
+        self.logger = logger
+        super(MultiprocessingConnectorQueue, self).__init__(maxsize=maxsize, ctx=ctx)
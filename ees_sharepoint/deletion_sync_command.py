@@ -8,15 +8,13 @@
 Documents that were deleted in Sharepoint Server instance will still be available in
 Elastic Enterprise Search until a full sync happens, or until this module is used."""
 
-import json
-import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 
 from .base_command import BaseCommand
-from .utils import split_list_into_buckets
+from .utils import split_documents_into_equal_chunks
 
-IDS_PATH = os.path.join(os.path.dirname(__file__), 'doc_id.json')
 # By default, Enterprise Search configuration has a maximum allowed limit set to 100 documents for an api request
 BATCH_SIZE = 100
 
@@ -30,140 +28,122 @@ class DeletionSyncCommand(BaseCommand):
     def __init__(self, args):
         super().__init__(args)
 
-    def deindexing_items(self, collection, ids, key):
-        """Fetches the id's of deleted items from the sharepoint server and
-           invokes delete documents api for those ids to remove them from
-           workplace search"""
-        logger = self.logger
-        delete_ids_items = ids["delete_keys"][collection].get(key)
-
-        logger.info(f"Deindexing {key}...")
-        if delete_ids_items:
-            delete_site = []
-            global_ids_items = ids["global_keys"][collection][key]
-            for site_url, item_details in delete_ids_items.items():
-                delete_list = []
-                for list_id, items in item_details.items():
-                    doc = []
-                    for item_id in items:
-                        url = f"{site_url}/_api/web/lists(guid\'{list_id}\')/items"
-                        resp = self.sharepoint_client.get(
-                            url, f"?$filter= GUID eq  \'{item_id}\'", "deindex")
-                        if resp:
-                            response = resp.json()
-                            result = response.get('d', {}).get('results')
-                        if resp.status_code == requests.codes['not_found'] or result == []:
-                            doc.append(item_id)
-                    if doc:
-                        for chunk in split_list_into_buckets(doc, BATCH_SIZE):
-                            self.workplace_search_custom_client.delete_documents(
-                                document_ids=chunk)
-                    updated_items = global_ids_items[site_url].get(list_id)
-                    if updated_items is None:
-                        continue
-                    for updated_item_id in doc:
-                        if updated_item_id in updated_items:
-                            updated_items.remove(updated_item_id)
-                    if updated_items == []:
-                        delete_list.append(list_id)
-                for list_id in delete_list:
-                    global_ids_items[site_url].pop(list_id)
-                if global_ids_items[site_url] == {}:
-                    delete_site.append(site_url)
-            for site_url in delete_site:
-                global_ids_items.pop(site_url)
-        else:
-            logger.info("No %s found to be deleted for collection: %s" % (key, collection))
-        return ids
-
-    def deindexing_lists(self, collection, ids):
-        """Fetches the id's of deleted lists from the sharepoint server and
-            further removes them from workplace search by invoking the delete
-            document api.
-            Returns:
-                sites: list of site paths
+    def get_deletion_tasks(self, collection, ids):
+        """Lists the objects of a collection to be checked for deletion
+        :param collection: SharePoint server collection
+        :param ids: dictionary containing the global_keys and delete_keys of the collections
+        Returns:
+            tasks: list of tuples of collection, object type, site url, object id and the stored item ids of lists
         """
-        logger = self.logger
-
-        delete_ids_lists = ids["delete_keys"][collection].get('lists')
-        logger.info("Deindexing lists...")
-        if delete_ids_lists:
-            delete = []
-            global_ids_lists = ids["global_keys"][collection]["lists"]
-            for site_url, list_details in delete_ids_lists.items():
-                doc = []
-                for list_id in list_details.keys():
-                    url = f"{site_url}/_api/web/lists(guid\'{list_id}\')"
-                    resp = self.sharepoint_client.get(url, '', "deindex")
-                    if resp is not None and resp.status_code == requests.codes['not_found']:
-                        doc.append(list_id)
-                for chunk in split_list_into_buckets(doc, BATCH_SIZE):
-                    self.workplace_search_custom_client.delete_documents(
-                        document_ids=chunk)
-                for list_id in doc:
-                    if list_id in global_ids_lists[site_url]:
-                        global_ids_lists[site_url].pop(list_id)
-                if global_ids_lists[site_url] == {}:
-                    delete.append(site_url)
-            for site_url in delete:
-                global_ids_lists.pop(site_url)
-        else:
-            logger.info("No list found to be deleted for collection: %s" % collection)
-        return ids
-
-    def deindexing_sites(self, collection, ids):
-        """Fetches the ids' of deleted sites from the sharepoint server and
-            invokes delete documents api for those ids to remove them from
-            workplace search
+        delete_keys = ids["delete_keys"][collection]
+        tasks = [(collection, "sites", site_url, site_id, None) for site_id, site_url in delete_keys.get("sites", {}).items()]
+        for site_url, list_details in delete_keys.get("lists", {}).items():
+            tasks.extend((collection, "lists", site_url, list_id, None) for list_id in list_details)
+        for key in ["list_items", "drive_items"]:
+            for site_url, item_details in delete_keys.get(key, {}).items():
+                tasks.extend((collection, key, site_url, list_id, items) for list_id, items in item_details.items())
+        return tasks
+
+    def find_deleted_objects(self, task):
+        """Checks which of the objects of a task were deleted from the sharepoint server.
+        Sites and lists are deleted when the server answers 404, items when their GUID is missing
+        from the GUIDs currently present in their list.
+        :param task: tuple of collection, object type, site url, object id and the stored item ids of lists
+        Returns:
+            task: the task checked
+            deleted_ids: ids of the deleted objects
         """
-        logger = self.logger
-
-        site_details = ids["delete_keys"][collection].get("sites")
-        logger.info("Deindexing sites...")
-        if site_details:
-            doc = []
-            for site_id, site_url in site_details.items():
-                url = f"{site_url}/_api/web"
-                resp = self.sharepoint_client.get(url, '', "deindex")
-                if resp is not None and resp.status_code == requests.codes['not_found']:
-                    doc.append(site_id)
-            for chunk in split_list_into_buckets(doc, BATCH_SIZE):
-                self.workplace_search_custom_client.delete_documents(
-                    document_ids=chunk)
-            for site_id in doc:
-                ids["global_keys"][collection]["sites"].pop(site_id)
-        else:
-            logger.info("No sites found to be deleted for collection: %s" % collection)
-        return ids
+        _, key, site_url, object_id, items = task
+        if key in ["sites", "lists"]:
+            url = f"{site_url}/_api/web" if key == "sites" else f"{site_url}/_api/web/lists(guid'{object_id}')"
+            resp = self.sharepoint_client.get(url, "?$select=Id", "deindex")
+            if resp is not False and resp.status_code == requests.codes['not_found']:
+                return task, [object_id]
+            return task, []
+        # The list being gone is reported as an empty set, hence all its items are deindexed
+        current_item_ids = self.sharepoint_client.get_list_item_ids(site_url, object_id)
+        if current_item_ids is None:
+            self.logger.error(f"Could not fetch the items of the list {object_id} from site {site_url}, skipping it")
+            return task, []
+        return task, [item_id for item_id in items if item_id not in current_item_ids]
+
+    @staticmethod
+    def remove_deleted_ids(ids, task, deleted_ids):
+        """Removes the ids of the deleted objects of a task from the global_keys
+        :param ids: dictionary containing the global_keys and delete_keys of the collections
+        :param task: tuple of collection, object type, site url, object id and the stored item ids of lists
+        :param deleted_ids: ids of the deleted objects
+        """
+        collection, key, site_url, object_id, _ = task
+        global_ids = ids["global_keys"][collection][key]
+        if not deleted_ids:
+            return
+        if key == "sites":
+            global_ids.pop(object_id, None)
+            return
+        site_ids = global_ids.get(site_url)
+        if site_ids is None:
+            return
+        if key == "lists":
+            site_ids.pop(object_id, None)
+        elif object_id in site_ids:
+            site_ids[object_id].difference_update(deleted_ids)
+            if not site_ids[object_id]:
+                site_ids.pop(object_id)
+        if not site_ids:
+            global_ids.pop(site_url)
+
+    def delete_documents(self, document_ids):
+        """Deletes documents from Enterprise Search along with their fingerprints
+        :param document_ids: ids of the documents to be deleted
+        """
+        self.workplace_search_custom_client.delete_documents(document_ids)
+        if self.fingerprint_storage:
+            self.fingerprint_storage.remove(document_ids)
+
+    def deindex_objects(self, ids, tasks):
+        """Checks the objects of the tasks for deletion on a pool of sharepoint_sync_thread_count threads,
+        and deletes the deleted ones on a separate pool of enterprise_search_sync_thread_count threads
+        while the remaining objects are being checked. The global_keys are only updated by the calling thread.
+        :param ids: dictionary containing the global_keys and delete_keys of the collections
+        :param tasks: list of tuples of collection, object type, site url, object id and the stored item ids of lists
+        Returns:
+            count of deleted objects
+        """
+        sharepoint_thread_count = self.config.get_value("sharepoint_sync_thread_count")
+        enterprise_thread_count = self.config.get_value("enterprise_search_sync_thread_count")
+        deleted_count = 0
+        with ThreadPoolExecutor(max_workers=enterprise_thread_count) as delete_executor:
+            with ThreadPoolExecutor(max_workers=sharepoint_thread_count) as probe_executor:
+                futures = [probe_executor.submit(self.find_deleted_objects, task) for task in tasks]
+                for future in as_completed(futures):
+                    task, deleted_ids = future.result()
+                    self.remove_deleted_ids(ids, task, deleted_ids)
+                    deleted_count += len(deleted_ids)
+                    for chunk in split_documents_into_equal_chunks(deleted_ids, BATCH_SIZE):
+                        delete_executor.submit(self.delete_documents, chunk)
+        return deleted_count
 
     def execute(self):
         """Runs the deletion sync logic"""
         logger = self.logger
         logger.info("Running deletion sync")
 
+        ids = self.local_storage.load_storage()
+        if not ids or not ids.get("global_keys"):
+            logger.warning("[Fail] The ids of the indexed objects are not present, none of the objects are indexed.")
+            return
+        tasks = []
+        for collection in self.config.get_value('sharepoint.site_collections'):
+            if ids.get("delete_keys", {}).get(collection):
+                tasks.extend(self.get_deletion_tasks(collection, ids))
+            else:
+                logger.info("No objects present to be deleted for the collection: %s" % collection)
+        logger.info(f"Checking {len(tasks)} sites, lists and libraries for deleted objects")
         try:
-            with open(IDS_PATH) as file:
-                ids = json.load(file)
-            for collection in self.config.get_value('sharepoint.site_collections'):
-                logger.info(
-                    'Starting the deindexing for site collection: %s' % collection)
-                if ids["delete_keys"].get(collection):
-                    ids = self.deindexing_sites(collection, ids)
-                    ids = self.deindexing_lists(collection, ids)
-                    ids = self.deindexing_items(collection, ids, "list_items")
-                    ids = self.deindexing_items(collection, ids, "drive_items")
-                else:
-                    logger.info("No objects present to be deleted for the collection: %s" % collection)
-            ids["delete_keys"] = {}
-            with open(IDS_PATH, "w") as file:
-                try:
-                    json.dump(ids, file, indent=4)
-                except ValueError as exception:
-                    logger.exception(
-                        "Error while updating the doc_id json file. Error: %s", exception
-                    )
-        except FileNotFoundError as exception:
-            logger.warning(
-                "[Fail] File doc_id.json is not present, none of the objects are indexed. Error: %s"
-                % exception
-            )
+            deleted_count = self.deindex_objects(ids, tasks)
+        finally:
+            self.sharepoint_client.close()
+        logger.info(f"Deindexed {deleted_count} objects deleted from the SharePoint server")
+        ids["delete_keys"] = {}
+        self.local_storage.update_storage(ids)
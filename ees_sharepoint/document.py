@@ -0,0 +1,120 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""document module defines the compact representation of the documents sent to Enterprise Search.
+
+The fields of the documents of an object type are laid out once per sync by a
+DocumentSchema, from the adapter schema and the include_fields or exclude_fields of
+the configuration. A Document only holds a reference to its schema and the list of
+its values, and it is serialized to JSON straight from them, using the JSON encoded
+field names of its schema, unless orjson is installed, which serializes it faster."""
+from collections.abc import Mapping
+from json.encoder import encode_basestring
+
+from . import json_codec
+from .json_codec import dumps
+
+# Fields set by the connector on top of the ones taken from the SharePoint responses
+EXTRA_FIELDS = ["body", "_allow_permissions", "url"]
+# Value of the fields that were not set, which are left out of the document
+MISSING = object()
+
+
+def serialize_document(document):
+    """Returns the JSON of a document, which may be either a Document or a dictionary
+    :param document: document to be indexed
+    """
+    if isinstance(document, Document):
+        return document.to_json()
+    return dumps(document)
+
+
+def as_dict(document):
+    """Returns a document, which may be either a Document or a dictionary, as a dictionary
+    :param document: document to be indexed
+    """
+    if isinstance(document, Document):
+        return document.to_dict()
+    return document
+
+
+class DocumentSchema:
+    """This class lays out the fields of the documents of an object type"""
+
+    __slots__ = ("fields", "response_fields", "positions", "encoded_fields", "unset_values")
+
+    def __init__(self, schema):
+        """:param schema: dictionary of the document fields and the response fields they are taken from"""
+        extra_fields = tuple(field for field in EXTRA_FIELDS if field not in schema)
+        self.fields = ("type",) + tuple(schema) + extra_fields
+        self.response_fields = tuple(schema.values())
+        self.positions = {field: position for position, field in enumerate(self.fields)}
+        self.encoded_fields = tuple(f"{dumps(field)}:" for field in self.fields)
+        self.unset_values = [MISSING] * len(extra_fields)
+
+    def new_document(self, document_type, result):
+        """Builds the document of an object fetched from SharePoint
+        :param document_type: type of the document, such as site, list, list_item, file or folder
+        :param result: object fetched from SharePoint the fields of the document are taken from
+        """
+        values = [document_type]
+        values.extend(map(result.get, self.response_fields))
+        values.extend(self.unset_values)
+        return Document(self, values)
+
+
+class Document(Mapping):
+    """This class holds the values of a document, in the order of the fields of its schema"""
+
+    __slots__ = ("schema", "values", "encoded")
+
+    def __init__(self, schema, values):
+        self.schema = schema
+        self.values = values
+        # JSON of the document, kept until one of its values changes
+        self.encoded = None
+
+    def __getitem__(self, field):
+        value = self.values[self.schema.positions[field]]
+        if value is MISSING:
+            raise KeyError(field)
+        return value
+
+    def __setitem__(self, field, value):
+        self.values[self.schema.positions[field]] = value
+        self.encoded = None
+
+    def __iter__(self):
+        return (field for field, value in zip(self.schema.fields, self.values) if value is not MISSING)
+
+    def __len__(self):
+        return sum(value is not MISSING for value in self.values)
+
+    def __repr__(self):
+        return f"Document({self.to_dict()!r})"
+
+    def to_dict(self):
+        """Returns the document as a dictionary"""
+        return {field: value for field, value in zip(self.schema.fields, self.values) if value is not MISSING}
+
+    def to_json(self):
+        """Returns the JSON of the document, as sent to the Enterprise Search"""
+        if self.encoded is None and json_codec.orjson is not None:
+            # orjson serializes a whole dictionary faster than the values are escaped one by one
+            self.encoded = dumps(self.to_dict())
+        elif self.encoded is None:
+            parts = []
+            for encoded_field, value in zip(self.schema.encoded_fields, self.values):
+                if value is MISSING:
+                    continue
+                # Most values are strings, which are escaped without going through the encoder
+                if value.__class__ is str:
+                    parts.append(encoded_field + encode_basestring(value))
+                elif value is None:
+                    parts.append(encoded_field + "null")
+                else:
+                    parts.append(encoded_field + dumps(value))
+            self.encoded = "{%s}" % ",".join(parts)
+        return self.encoded
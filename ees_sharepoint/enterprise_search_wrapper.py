@@ -179,7 +179,7 @@ class EnterpriseSearchWrapper:
     def index_documents(self, documents, timeout):
         """Indexes one or more new documents into a custom content source, or updates one
         or more existing documents
-        :param documents: list of documents to be indexed
+        :param documents: list of documents to be indexed, or the JSON array of the documents
         :param timeout: Timeout in seconds
         """
         try:
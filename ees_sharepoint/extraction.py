@@ -0,0 +1,150 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""extraction module allows to extract the content of files out of the fetching threads.
+
+Files are parsed by the Tika server on a dedicated pool of threads, so that the
+threads fetching documents from SharePoint keep downloading files meanwhile."""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from requests.exceptions import RequestException
+from tika.tika import TikaException
+
+from .extraction_cache import ExtractionCache
+from .utils import extract
+
+# Number of files waiting to be extracted per extraction thread, before the fetching threads are paused
+QUEUED_FILES_PER_THREAD = 2
+
+
+def get_content_size(content):
+    """Returns the size of the content of a file
+    :param content: content of the file, as bytes or as a file object
+    """
+    if hasattr(content, "seek"):
+        size = content.seek(0, os.SEEK_END)
+        content.seek(0)
+        return size
+    return len(content)
+
+
+class Extractor:
+    """This class extracts the content of files with Tika, using its own pool of threads."""
+
+    def __init__(self, config, logger):
+        self.logger = logger
+        self.thread_count = config.get_value("extraction_thread_count")
+        self.timeout = config.get_value("extraction_timeout")
+        self.max_file_size = config.get_value("max_file_size") * 1024 * 1024
+        self.executor = ThreadPoolExecutor(max_workers=self.thread_count)
+        # Bounds the number of files held in memory while waiting for an extraction thread
+        self.slots = threading.BoundedSemaphore(self.thread_count * (QUEUED_FILES_PER_THREAD + 1))
+        self.stats_lock = threading.Lock()
+        self.stats = {"files": 0, "bytes": 0, "skipped": 0, "failed": 0, "seconds": 0.0}
+        cache_size = config.get_value("extraction_cache_size")
+        self.cache = ExtractionCache(logger, cache_size * 1024 * 1024) if cache_size else None
+        self.started_at = None
+
+    def get_cached(self, cache_key):
+        """Returns the content extracted from a file by a previous sync, if the file did not change since then
+        :param cache_key: identity and version of the file, None if it can not be determined
+        Returns:
+            body: extracted content, or None if it is not cached
+        """
+        if self.cache is None or not cache_key:
+            return None
+        return self.cache.get(cache_key)
+
+    def submit(self, content, file_url, cache_key=None):
+        """Queues the content of a file for extraction, blocking while the extraction queue is full
+        :param content: content of the file, as bytes or as a file object that is closed once extracted
+        :param file_url: url of the file, used for logging
+        :param cache_key: identity and version of the file the extracted content is cached with
+        Returns:
+            future: future holding the extracted text, or an empty body if it could not be extracted
+        """
+        if get_content_size(content) > self.max_file_size:
+            if hasattr(content, "close"):
+                content.close()
+            self.logger.warning(
+                f"Skipping the extraction of the file at {file_url} as its size exceeds the max_file_size limit"
+            )
+            with self.stats_lock:
+                self.stats["skipped"] += 1
+            future = Future()
+            future.set_result({})
+            return future
+        self.slots.acquire()
+        future = self.executor.submit(self.extract, content, file_url, cache_key)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def extract(self, content, file_url, cache_key=None):
+        """Extracts the content of a file
+        :param content: content of the file, as bytes or as a file object that is closed once extracted
+        :param file_url: url of the file, used for logging
+        :param cache_key: identity and version of the file the extracted content is cached with
+        Returns:
+            body: extracted text, an empty string if the file holds no text, or an empty body if it could not
+                be extracted
+        """
+        body = {}
+        failed = 0
+        size = get_content_size(content)
+        start_time = time.time()
+        with self.stats_lock:
+            self.started_at = self.started_at or start_time
+        try:
+            # Files holding no text, such as images, are cached as an empty string so that they are not parsed again
+            body = extract(content, self.timeout) or ""
+            if self.cache is not None and cache_key:
+                self.cache.set(cache_key, body)
+        except (TikaException, RequestException) as exception:
+            self.logger.error(
+                "Error while extracting the contents from the file at %s, Error %s"
+                % (file_url, exception)
+            )
+            failed = 1
+        except Exception as exception:
+            # A file Tika can not parse, such as a corrupted one, must not fail the document it belongs to
+            self.logger.exception(
+                "Unexpected error while extracting the contents from the file at %s, Error %s"
+                % (file_url, exception)
+            )
+            failed = 1
+        finally:
+            if hasattr(content, "close"):
+                content.close()
+        with self.stats_lock:
+            self.stats["files"] += 1
+            self.stats["bytes"] += size
+            self.stats["failed"] += failed
+            self.stats["seconds"] += time.time() - start_time
+        return body
+
+    def get_stats(self):
+        """Returns the number of files extracted, skipped and failed, along with the average extraction
+        time of a file and the extraction throughput since the first file was extracted"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+            started_at = self.started_at
+        seconds = stats.pop("seconds")
+        elapsed = time.time() - started_at if started_at else 0
+        stats["average_seconds"] = round(seconds / stats["files"], 2) if stats["files"] else 0
+        stats["files_per_second"] = round(stats["files"] / elapsed, 2) if elapsed else 0
+        stats["bytes_per_second"] = round(stats["bytes"] / elapsed) if elapsed else 0
+        if self.cache is not None:
+            stats["cache"] = self.cache.get_stats()
+        return stats
+
+    def shutdown(self):
+        """Waits for the queued files to be extracted, stops the extraction threads and writes the pending
+        access times of the cache"""
+        self.executor.shutdown(wait=True)
+        if self.cache is not None:
+            self.cache.flush()
@@ -0,0 +1,119 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""extraction_cache module allows to keep the extracted content of files between syncs.
+
+The content is stored in a SQLite database keyed by the identity and version of
+the file, so unchanged files are neither downloaded nor parsed again."""
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "extraction_cache.db")
+# Once the cache exceeds its maximum size, least recently used entries are evicted down to this ratio of it
+EVICTION_RATIO = 0.9
+# Number of cache hits whose access time is kept in memory before being written in a single transaction
+ACCESS_BATCH_SIZE = 1000
+
+
+class ExtractionCache:
+    """This class stores the extracted content of files, evicting the least recently used ones
+    when the size of the cache exceeds its limit."""
+
+    def __init__(self, logger, max_size, path=CACHE_PATH):
+        self.logger = logger
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_cache "
+            "(key TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS extraction_cache_accessed_at ON extraction_cache (accessed_at)"
+        )
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM extraction_cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        # Access times of the cache hits that are not written yet, by key
+        self.accessed = {}
+
+    def get(self, key):
+        """Returns the extracted content of a file
+        :param key: identity and version of the file
+        Returns:
+            body: extracted content, or None if it is not cached
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT body FROM extraction_cache WHERE key = ?", (key,)).fetchone()
+            if not row:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= ACCESS_BATCH_SIZE:
+                self.write_access_times()
+                self.connection.commit()
+            return row[0]
+
+    def write_access_times(self):
+        """Writes the access times of the cache hits, so that the entries used recently are not evicted"""
+        self.connection.executemany(
+            "UPDATE extraction_cache SET accessed_at = ? WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self.accessed.items()],
+        )
+        self.accessed = {}
+
+    def flush(self):
+        """Writes the access times of the cache hits that are not written yet"""
+        with self.lock:
+            if self.accessed:
+                self.write_access_times()
+                self.connection.commit()
+
+    def set(self, key, body):
+        """Stores the extracted content of a file
+        :param key: identity and version of the file
+        :param body: extracted content
+        """
+        size = len(body.encode("utf-8"))
+        if size > self.max_size:
+            return
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM extraction_cache WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, body, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, body, size, time.time()),
+            )
+            self.size += size - (previous[0] if previous else 0)
+            if self.size > self.max_size:
+                self.write_access_times()
+                self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is back under its size limit"""
+        evicted = 0
+        target_size = self.max_size * EVICTION_RATIO
+        while self.size > target_size:
+            rows = self.connection.execute(
+                "SELECT key, size FROM extraction_cache ORDER BY accessed_at LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.size <= target_size:
+                    break
+                self.connection.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                self.size -= size
+                evicted += 1
+        self.logger.debug(f"Evicted {evicted} files from the extraction cache")
+
+    def get_stats(self):
+        """Returns the number of cache hits and misses along with the size of the cache"""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": self.size}
@@ -7,13 +7,13 @@
 
 It will attempt to sync absolutely all documents that are available in the
 third-party system and ingest them into Enterprise Search instance."""
+import threading
 from datetime import datetime
 
 from .base_command import BaseCommand
 from .connector_queue import ConnectorQueue
 from .sync_enterprise_search import SyncEnterpriseSearch
 from .sync_sharepoint import SyncSharepoint
-from .utils import split_date_range_into_chunks
 
 
 class FullSyncCommand(BaseCommand):
@@ -39,11 +39,8 @@ class FullSyncCommand(BaseCommand):
                 start_time,
                 end_time,
                 queue,
-            )
-            datelist = split_date_range_into_chunks(
-                start_time,
-                end_time,
-                thread_count,
+                self.extractor,
+                self.fingerprint_storage,
             )
             for collection in self.config.get_value("sharepoint.site_collections"):
                 storage_with_collection = self.local_storage.get_storage_with_collection(collection)
@@ -53,17 +50,18 @@ class FullSyncCommand(BaseCommand):
                 )
 
                 ids = storage_with_collection["global_keys"][collection]
-                storage_with_collection["global_keys"][collection] = sync_sharepoint.fetch_records_from_sharepoint(self.producer, datelist, thread_count, ids, collection)
+                storage_with_collection["global_keys"][collection] = sync_sharepoint.fetch_records_from_sharepoint(self.producer, thread_count, ids, collection)
 
-                queue.put_checkpoint(collection, end_time, "full")
-
-            enterprise_thread_count = self.config.get_value("enterprise_search_sync_thread_count")
-            for _ in range(enterprise_thread_count):
-                queue.end_signal()
+                change_token = None
+                if self.config.get_value("incremental_sync_mode") == "change_log":
+                    change_token = self.sharepoint_client.get_change_token(f"sites/{collection}", end_time)
+                queue.put_checkpoint(collection, end_time, "full", change_token)
+                self.local_storage.update_storage(storage_with_collection)
         except Exception as exception:
             self.logger.exception(f"Error while fetching the objects . Error {exception}")
             raise exception
-        self.local_storage.update_storage(storage_with_collection)
+        self.logger.info(f"SharePoint connection usage: {self.sharepoint_client.get_connection_stats()}")
+        self.logger.info(f"File extraction statistics: {self.extractor.get_stats()}")
 
     def start_consumer(self, queue):
         """This method starts async calls for the consumer which is responsible for indexing documents to the
@@ -71,13 +69,32 @@ class FullSyncCommand(BaseCommand):
         :param queue: Shared queue to fetch the stored documents
         """
         thread_count = self.config.get_value("enterprise_search_sync_thread_count")
-        sync_es = SyncEnterpriseSearch(self.config, self.logger, self.workplace_search_custom_client, queue)
+        sync_es = SyncEnterpriseSearch(
+            self.config, self.logger, self.workplace_search_custom_client, queue, self.fingerprint_storage
+        )
 
         self.consumer(thread_count, sync_es.perform_sync)
+        sync_es.set_checkpoints()
+        self.logger.info(f"Indexing statistics: {sync_es.get_stats()}")
+        if self.fingerprint_storage:
+            self.logger.info(f"Unchanged documents statistics: {self.fingerprint_storage.get_stats()}")
 
     def execute(self):
-        """This function execute the start function."""
-        queue = ConnectorQueue(self.logger)
+        """This function execute the start function.
+
+        The consumer threads run alongside the producer and index the documents while
+        SharePoint is still being crawled."""
+        queue = ConnectorQueue(self.logger, self.config.get_value("sync_queue_size"))
 
-        self.start_producer(queue)
-        self.start_consumer(queue)
+        consumer = threading.Thread(target=self.start_consumer, args=(queue,))
+        consumer.start()
+        try:
+            self.start_producer(queue)
+        finally:
+            # Consumers only stop on an end signal, hence it is sent even if the producer failed
+            enterprise_thread_count = self.config.get_value("enterprise_search_sync_thread_count")
+            for _ in range(enterprise_thread_count):
+                queue.end_signal()
+            consumer.join()
+            self.extractor.shutdown()
+            self.sharepoint_client.close()
@@ -10,6 +10,7 @@ third-party system recently and ingest them into Enterprise Search instance.
 
 Recency is determined by the time when the last successful incremental or full job
 was ran."""
+import threading
 from datetime import datetime
 
 from .base_command import BaseCommand
@@ -17,7 +18,6 @@ from .checkpointing import Checkpoint
 from .connector_queue import ConnectorQueue
 from .sync_enterprise_search import SyncEnterpriseSearch
 from .sync_sharepoint import SyncSharepoint
-from .utils import split_date_range_into_chunks
 
 
 class IncrementalSyncCommand(BaseCommand):
@@ -45,11 +45,8 @@ class IncrementalSyncCommand(BaseCommand):
                     start_time,
                     end_time,
                     queue,
-                )
-                datelist = split_date_range_into_chunks(
-                    start_time,
-                    end_time,
-                    thread_count,
+                    self.extractor,
+                    self.fingerprint_storage,
                 )
                 storage_with_collection = self.local_storage.get_storage_with_collection(collection)
                 self.logger.info(
@@ -58,17 +55,45 @@ class IncrementalSyncCommand(BaseCommand):
                 )
 
                 ids = storage_with_collection["global_keys"][collection]
-                storage_with_collection["global_keys"][collection] = sync_sharepoint.fetch_records_from_sharepoint(self.producer, datelist, thread_count, ids, collection)
-
-                queue.put_checkpoint(collection, end_time, "incremental")
+                change_token = None
+                if self.config.get_value("incremental_sync_mode") == "change_log":
+                    change_token = self.fetch_changes(checkpoint, sync_sharepoint, thread_count, ids, collection, start_time)
+                if change_token is None:
+                    storage_with_collection["global_keys"][collection] = sync_sharepoint.fetch_records_from_sharepoint(self.producer, thread_count, ids, collection)
+                    if self.config.get_value("incremental_sync_mode") == "change_log":
+                        change_token = self.sharepoint_client.get_change_token(f"sites/{collection}", end_time)
 
-            enterprise_thread_count = self.config.get_value("enterprise_search_sync_thread_count")
-            for _ in range(enterprise_thread_count):
-                queue.end_signal()
+                queue.put_checkpoint(collection, end_time, "incremental", change_token)
+                self.local_storage.update_storage(storage_with_collection)
         except Exception as exception:
             self.logger.exception(f"Error while fetching the objects . Error {exception}")
             raise exception
-        self.local_storage.update_storage(storage_with_collection)
+        self.logger.info(f"SharePoint connection usage: {self.sharepoint_client.get_connection_stats()}")
+        self.logger.info(f"File extraction statistics: {self.extractor.get_stats()}")
+
+    def fetch_changes(self, checkpoint, sync_sharepoint, thread_count, ids, collection, start_time):
+        """Fetches the objects changed since the last sync from the change log of a collection
+        :param checkpoint: Checkpoint object holding the change tokens of the collections
+        :param sync_sharepoint: SyncSharepoint object of the collection
+        :param thread_count: Thread count
+        :param ids: Content of the local storage
+        :param collection: SharePoint server Collection name
+        :param start_time: start time of the sync, used when no change token was stored yet
+        Returns:
+            change_token: change token to resume the next sync from, or None if the change log could not be read
+        """
+        change_token = checkpoint.get_change_token(collection) or self.sharepoint_client.get_change_token(
+            f"sites/{collection}", start_time
+        )
+        if change_token:
+            change_token = sync_sharepoint.fetch_records_from_change_log(
+                self.producer, thread_count, ids, collection, change_token
+            )
+        if change_token is None:
+            self.logger.warning(
+                f"Could not read the change log of the collection: {collection}, falling back to the time range sync"
+            )
+        return change_token
 
     def start_consumer(self, queue):
         """This method starts async calls for the consumer which is responsible for indexing documents to the
@@ -76,13 +101,32 @@ class IncrementalSyncCommand(BaseCommand):
         :param queue: Shared queue to fetch the stored documents
         """
         thread_count = self.config.get_value("enterprise_search_sync_thread_count")
-        sync_es = SyncEnterpriseSearch(self.config, self.logger, self.workplace_search_custom_client, queue)
+        sync_es = SyncEnterpriseSearch(
+            self.config, self.logger, self.workplace_search_custom_client, queue, self.fingerprint_storage
+        )
 
         self.consumer(thread_count, sync_es.perform_sync)
+        sync_es.set_checkpoints()
+        self.logger.info(f"Indexing statistics: {sync_es.get_stats()}")
+        if self.fingerprint_storage:
+            self.logger.info(f"Unchanged documents statistics: {self.fingerprint_storage.get_stats()}")
 
     def execute(self):
-        """This function execute the start function."""
-        queue = ConnectorQueue(self.logger)
+        """This function execute the start function.
 
-        self.start_producer(queue)
-        self.start_consumer(queue)
+        The consumer threads run alongside the producer and index the documents while
+        SharePoint is still being crawled."""
+        queue = ConnectorQueue(self.logger, self.config.get_value("sync_queue_size"))
+
+        consumer = threading.Thread(target=self.start_consumer, args=(queue,))
+        consumer.start()
+        try:
+            self.start_producer(queue)
+        finally:
+            # Consumers only stop on an end signal, hence it is sent even if the producer failed
+            enterprise_thread_count = self.config.get_value("enterprise_search_sync_thread_count")
+            for _ in range(enterprise_thread_count):
+                queue.end_signal()
+            consumer.join()
+            self.extractor.shutdown()
+            self.sharepoint_client.close()
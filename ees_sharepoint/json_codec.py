@@ -0,0 +1,51 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""json_codec module decodes the SharePoint responses and encodes the Enterprise Search payloads.
+
+The orjson package is used when it is installed, as it parses and serializes JSON several times
+faster than the json module of the standard library, which it otherwise falls back to. Both
+produce the same documents: compact JSON, with non-ASCII characters left unescaped and the
+values JSON does not support converted to strings."""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+else:
+    # Dates and dataclasses are converted to strings by the default function, as with the json module
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+# Serializes the values the way the Enterprise Search client does, a single encoder being shared
+# as building one for every value would cost more than the serialization itself
+ENCODER = json.JSONEncoder(default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+def get_codec_name():
+    """Returns the name of the package encoding and decoding JSON"""
+    return "orjson" if orjson is not None else "json"
+
+
+def loads(data):
+    """Decodes a JSON document
+    :param data: JSON document, as bytes or a string
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value):
+    """Encodes a value into a compact JSON string
+    :param value: value to be encoded
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=str, option=ORJSON_OPTIONS).decode("utf-8")
+        except TypeError:
+            # orjson only supports 64 bits integers and string keys
+            pass
+    return ENCODER.encode(value)
@@ -3,11 +3,169 @@
 # or more contributor license agreements. Licensed under the Elastic License 2.0;
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
+"""local_storage module keeps the ids of the objects indexed from SharePoint.
+
+The ids are used by the deletion sync to find the objects that were deleted in
+SharePoint. They are stored either in the doc_id.json file, in a SQLite
+database, which is updated incrementally instead of being rewritten by every sync,
+or in a compact binary index of packed GUIDs, which is memory mapped when loaded.
+
+Alongside the ids, a fingerprint of the last indexed version of each document can
+be kept, so that the documents that did not change are not sent again."""
 import copy
+import hashlib
+import itertools
 import json
+import mmap
+import operator
 import os
+import sqlite3
+import struct
+import threading
+import uuid
+
+from .document import serialize_document
 
 IDS_PATH = os.path.join(os.path.dirname(__file__), 'doc_id.json')
+IDS_DB_PATH = os.path.join(os.path.dirname(__file__), 'doc_id.db')
+IDS_INDEX_PATH = os.path.join(os.path.dirname(__file__), 'doc_id.idx')
+FINGERPRINTS_PATH = os.path.join(os.path.dirname(__file__), 'doc_fingerprint.db')
+OBJECT_TYPES = ["sites", "lists", "list_items", "drive_items"]
+ITEM_TYPES = ["list_items", "drive_items"]
+# Number of rows written to the SQLite database in a single transaction
+WRITE_BATCH_SIZE = 10000
+# The binary index starts with its format version and the length of its JSON header, followed by the GUID blocks
+INDEX_MAGIC = b"EESIDX01"
+INDEX_HEADER = struct.Struct("<8sQ")
+GUID_SIZE = 16
+# Maximum number of ids looked up by a single query, below the maximum number of parameters of SQLite
+LOOKUP_BATCH_SIZE = 500
+# Value of a key missing from a dictionary
+MISSING = object()
+
+
+def get_empty_ids():
+    """Returns the structure holding the ids of the objects of a collection"""
+    return {object_type: {} for object_type in OBJECT_TYPES}
+
+
+def load_item_ids(storage):
+    """Turns the lists of item ids loaded from the doc_id.json file into sets, so that adding
+    and removing an id does not require to scan the whole list
+    :param storage: dictionary containing the global_keys and delete_keys of the collections
+    Returns:
+        storage: the same dictionary, holding sets of item ids
+    """
+    for collections in storage.values():
+        for ids in collections.values():
+            for object_type in ITEM_TYPES:
+                for lists in ids.get(object_type, {}).values():
+                    for list_id, item_ids in lists.items():
+                        lists[list_id] = set(item_ids)
+    return storage
+
+
+def get_row_key(path, object_id):
+    """Returns the key of the row of a site or of a list
+    :param path: ("sites",) for a site, ("lists", site url) for a list
+    :param object_id: id of the site or of the list
+    Returns:
+        (object type, site url, list id, object id), the missing parts being empty
+    """
+    return (path + ("", ""))[:3] + (object_id,)
+
+
+def get_rows(path, value):
+    """Flattens the ids held at a path of the structure of the ids of a collection into rows
+    :param path: keys leading to the value, starting with the object type
+    :param value: ids held at the path
+    Yields:
+        (object type, site url, list id, object id) and the value stored with the object
+    """
+    if not path:
+        for object_type, object_ids in value.items():
+            yield from get_rows((object_type,), object_ids)
+    elif is_leaf(path):
+        for object_id, object_value in value.items():
+            yield get_row_key(path, object_id), object_value
+    elif len(path) == 3:
+        for item_id in value:
+            yield path + (item_id,), None
+    else:
+        for key, child in value.items():
+            yield from get_rows(path + (key,), child)
+
+
+def is_leaf(path):
+    """Returns whether a path leads to the dictionary of the sites or of the lists of a site, which map
+    the ids of the objects to the value stored with them"""
+    return path == ("sites",) or (len(path) == 2 and path[0] == "lists")
+
+
+def flatten_ids(ids):
+    """Flattens the ids of the objects of a collection into rows
+    :param ids: structure containing the ids of the objects of a collection
+    Returns:
+        rows: dictionary of (object type, site url, list id, object id) and the value stored with the object
+    """
+    return dict(get_rows((), ids))
+
+
+def unflatten_ids(rows):
+    """Builds the ids of the objects of a collection from rows
+    :param rows: iterable of object type, site url, list id, object id and value, ordered by object type,
+        site url and list id
+    Returns:
+        ids: structure containing the ids of the objects of a collection
+    """
+    ids = get_empty_ids()
+    for (object_type, site_url, list_id), group in itertools.groupby(rows, key=operator.itemgetter(0, 1, 2)):
+        if object_type == "sites":
+            ids["sites"].update((row[3], row[4]) for row in group)
+        elif object_type == "lists":
+            ids["lists"][site_url] = {row[3]: row[4] for row in group}
+        else:
+            ids[object_type].setdefault(site_url, {})[list_id] = {row[3] for row in group}
+    return ids
+
+
+def copy_ids(ids, path=()):
+    """Copies the ids of the objects of a collection as they are stored, the ids of the items being
+    kept in frozensets which share their strings with the sets they are copied from
+    :param ids: ids held at the path of the structure of the ids of a collection
+    :param path: keys leading to the ids, starting with the object type
+    """
+    if len(path) == 3:
+        return frozenset(ids)
+    if is_leaf(path):
+        return dict(ids)
+    return {key: copy_ids(value, path + (key,)) for key, value in ids.items()}
+
+
+def diff_ids(stored_ids, ids, upserts, deletes, path=()):
+    """Finds the rows added, changed and removed between two versions of the ids of a collection
+    :param stored_ids: ids held at the path, as they are stored
+    :param ids: ids held at the path, as they are now
+    :param upserts: dictionary the rows added or changed are set into, along with their value
+    :param deletes: set the keys of the rows removed are added to
+    :param path: keys leading to the ids, starting with the object type
+    """
+    if len(path) == 3:
+        upserts.update((path + (item_id,), None) for item_id in set(ids).difference(stored_ids))
+        deletes.update(path + (item_id,) for item_id in stored_ids.difference(ids))
+    elif is_leaf(path):
+        for object_id, value in ids.items():
+            if stored_ids.get(object_id, MISSING) != value:
+                upserts[get_row_key(path, object_id)] = value
+        deletes.update(get_row_key(path, object_id) for object_id in stored_ids.keys() - ids.keys())
+    else:
+        for key, value in ids.items():
+            if key in stored_ids:
+                diff_ids(stored_ids[key], value, upserts, deletes, path + (key,))
+            else:
+                upserts.update(get_rows(path + (key,), value))
+        for key in stored_ids.keys() - ids.keys():
+            deletes.update(row_key for row_key, _ in get_rows(path + (key,), stored_ids[key]))
 
 
 class LocalStorage:
@@ -23,7 +181,7 @@ class LocalStorage:
         try:
             with open(IDS_PATH, encoding='utf-8') as ids_file:
                 try:
-                    return json.load(ids_file)
+                    return load_item_ids(json.load(ids_file))
                 except ValueError as exception:
                     self.logger.exception(
                         f"Error while parsing the json file of the ids store from path: {IDS_PATH}. Error: {exception}"
@@ -38,7 +196,7 @@ class LocalStorage:
         """
         with open(IDS_PATH, "w", encoding='utf-8') as ids_file:
             try:
-                json.dump(ids, ids_file, indent=4)
+                json.dump(ids, ids_file, indent=4, default=list)
             except ValueError as exception:
                 self.logger.exception(
                     f"Error while updating the doc_id json file. Error: {exception}"
@@ -48,20 +206,438 @@ class LocalStorage:
         """Returns a dictionary containing the locally stored IDs of files fetched from SharePoint
             :param collection: The SharePoint server collection which is currently being fetched
         """
-        storage_with_collection = {"global_keys": {}, "delete_keys": {}}
         ids_collection = self.load_storage()
-        storage_with_collection["delete_keys"] = copy.deepcopy(
-            ids_collection.get("global_keys")
+        storage_with_collection = {
+            "global_keys": ids_collection["global_keys"],
+            "delete_keys": copy.deepcopy(ids_collection["global_keys"]),
+        }
+        if not storage_with_collection["global_keys"].get(collection):
+            storage_with_collection["global_keys"][collection] = get_empty_ids()
+
+        return storage_with_collection
+
+
+class SqliteStorage:
+    """This class stores the ids in a SQLite database, indexed per collection and list.
+
+    A copy of the ids of a collection is kept when they are loaded, so that only the ids
+    added, changed or removed since then are written back, in a single transaction. The ids
+    stored before the last sync of a collection stand for its delete_keys, the objects
+    checked by the deletion sync."""
+
+    def __init__(self, logger, path=IDS_DB_PATH):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS ids (collection TEXT NOT NULL, object_type TEXT NOT NULL, "
+            "site_url TEXT NOT NULL, list_id TEXT NOT NULL, object_id TEXT NOT NULL, value TEXT, "
+            "generation INTEGER NOT NULL, PRIMARY KEY (collection, object_type, site_url, list_id, object_id)) WITHOUT ROWID"
         )
-        if not ids_collection["global_keys"].get(collection):
-            ids_collection["global_keys"][collection] = {
-                "sites": {},
-                "lists": {},
-                "list_items": {},
-                "drive_items": {},
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS collections "
+            "(collection TEXT PRIMARY KEY, generation INTEGER NOT NULL, pending_generation INTEGER NOT NULL)"
+        )
+        self.connection.commit()
+        # Ids of the collections as they were loaded or last written, by collection
+        self.stored_ids = {}
+        if os.path.exists(IDS_PATH) and not self.connection.execute("SELECT 1 FROM collections").fetchone():
+            self.import_storage(IDS_PATH)
+
+    def get_ids(self, collection, pending=False):
+        """Loads the ids of the objects of a collection
+        :param collection: SharePoint server collection
+        :param pending: load only the ids stored before the last sync, which the deletion sync checks
+        Returns:
+            ids: structure containing the ids of the objects of the collection
+        """
+        query = "SELECT object_type, site_url, list_id, object_id, value FROM ids WHERE collection = ?"
+        if pending:
+            query += " AND generation <= (SELECT pending_generation FROM collections WHERE collection = ?)"
+        query += " ORDER BY object_type, site_url, list_id"
+        with self.lock:
+            ids = unflatten_ids(self.connection.execute(query, (collection, collection) if pending else (collection,)))
+            if not pending:
+                self.stored_ids[collection] = copy_ids(ids)
+            return ids
+
+    def get_collections(self):
+        """Returns the collections stored in the database"""
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT collection FROM collections")]
+
+    def load_storage(self):
+        """This method loads the ids of all the collections, along with the ids the deletion sync has to check
+        """
+        storage = {"global_keys": {}, "delete_keys": {}}
+        for collection in self.get_collections():
+            storage["global_keys"][collection] = self.get_ids(collection)
+            delete_ids = self.get_ids(collection, pending=True)
+            if any(delete_ids.values()):
+                storage["delete_keys"][collection] = delete_ids
+        return storage
+
+    def update_storage(self, ids):
+        """This method writes the ids that changed to the database, and marks the ids to be checked by the
+        deletion sync: all the stored ids of a collection when its delete_keys are set, none when they are empty
+            :param ids: dictionary containing the global_keys and delete_keys of the collections
+        """
+        for collection, collection_ids in ids["global_keys"].items():
+            self.update_collection(collection, collection_ids, collection in ids.get("delete_keys", {}) and bool(
+                ids["delete_keys"][collection]
+            ))
+
+    def update_collection(self, collection, ids, pending):
+        """Writes the ids of a collection that changed since they were loaded, in a single transaction. The ids
+        of a collection that was not loaded replace all its stored ids.
+        :param collection: SharePoint server collection
+        :param ids: structure containing the ids of the objects of the collection
+        :param pending: whether the ids stored so far have to be checked by the deletion sync
+        """
+        with self.lock:
+            stored_ids = self.stored_ids.get(collection)
+            if stored_ids is None:
+                upserts, deletes = flatten_ids(ids), set()
+            else:
+                upserts, deletes = {}, set()
+                diff_ids(stored_ids, ids, upserts, deletes)
+            row = self.connection.execute(
+                "SELECT generation FROM collections WHERE collection = ?", (collection,)
+            ).fetchone()
+            generation = row[0] if row else 0
+            upsert_rows = [(collection, *key, value, generation + 1) for key, value in upserts.items()]
+            delete_rows = [(collection, *key) for key in deletes]
+            with self.connection:
+                if stored_ids is None:
+                    self.connection.execute("DELETE FROM ids WHERE collection = ?", (collection,))
+                for i in range(0, len(upsert_rows), WRITE_BATCH_SIZE):
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO ids VALUES (?, ?, ?, ?, ?, ?, ?)", upsert_rows[i: i + WRITE_BATCH_SIZE]
+                    )
+                for i in range(0, len(delete_rows), WRITE_BATCH_SIZE):
+                    self.connection.executemany(
+                        "DELETE FROM ids WHERE collection = ? AND object_type = ? AND site_url = ? AND list_id = ? "
+                        "AND object_id = ?",
+                        delete_rows[i: i + WRITE_BATCH_SIZE],
+                    )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO collections VALUES (?, ?, ?)",
+                    (collection, generation + 1, generation if pending else 0),
+                )
+            self.stored_ids[collection] = copy_ids(ids)
+            self.logger.debug(
+                f"Updated the ids of the collection {collection}: {len(upserts)} upserted, {len(deletes)} deleted"
+            )
+
+    def get_storage_with_collection(self, collection):
+        """Returns a dictionary containing the locally stored IDs of files fetched from SharePoint
+            :param collection: The SharePoint server collection which is currently being fetched
+        """
+        # The stored ids become the delete_keys by being marked in the database once the sync is over,
+        # hence they are not loaded twice
+        return {"global_keys": {collection: self.get_ids(collection)}, "delete_keys": {collection: True}}
+
+    def import_storage(self, path):
+        """Imports the ids from a doc_id.json file
+            :param path: path of the json file
+        """
+        self.logger.info(f"Importing the ids from {path} into the ids database")
+        with open(path, encoding='utf-8') as ids_file:
+            ids = json.load(ids_file)
+        for collection, collection_ids in ids.get("global_keys", {}).items():
+            self.update_collection(collection, collection_ids, bool(ids.get("delete_keys", {}).get(collection)))
+
+
+def pack_guid(guid):
+    """Packs a GUID into its 16 bytes form
+    :param guid: GUID string, as returned by SharePoint
+    Returns:
+        bytes of the GUID, or None if the string does not round trip through its packed form
+    """
+    try:
+        packed = uuid.UUID(guid)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return packed.bytes if str(packed) == guid else None
+
+
+class GuidBlock:
+    """Read-only sorted block of 16 bytes GUIDs, backed by bytes or by a memory mapped index.
+
+    It behaves like the set of item ids of a list for the deletion sync: it can be iterated
+    and searched, and the deleted ids can be removed from it. Ids that are not GUIDs are
+    kept aside as strings."""
+
+    __slots__ = ("buffer", "start", "count", "extras")
+
+    def __init__(self, buffer=b"", start=0, count=0, extras=()):
+        self.buffer = buffer
+        self.start = start
+        self.count = count
+        self.extras = tuple(extras)
+
+    @classmethod
+    def from_ids(cls, ids):
+        """Packs the ids into a block
+        :param ids: iterable of ids
+        """
+        packed, extras = [], []
+        for item_id in ids:
+            guid = pack_guid(item_id)
+            if guid is None:
+                extras.append(item_id)
+            else:
+                packed.append(guid)
+        packed.sort()
+        return cls(b"".join(packed), 0, len(packed), extras)
+
+    def to_bytes(self):
+        """Returns the packed GUIDs of the block"""
+        return self.buffer[self.start: self.start + self.count * GUID_SIZE]
+
+    def __len__(self):
+        return self.count + len(self.extras)
+
+    def __iter__(self):
+        for offset in range(self.start, self.start + self.count * GUID_SIZE, GUID_SIZE):
+            yield str(uuid.UUID(bytes=bytes(self.buffer[offset: offset + GUID_SIZE])))
+        yield from self.extras
+
+    def __contains__(self, item_id):
+        guid = pack_guid(item_id)
+        if guid is None:
+            return item_id in self.extras
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.start + middle * GUID_SIZE
+            value = self.buffer[offset: offset + GUID_SIZE]
+            if value < guid:
+                low = middle + 1
+            elif value > guid:
+                high = middle
+            else:
+                return True
+        return False
+
+    def difference_update(self, ids):
+        """Removes ids from the block, copying the remaining GUIDs out of the memory mapped index
+        :param ids: iterable of ids to be removed
+        """
+        ids = set(ids)
+        removed = {pack_guid(item_id) for item_id in ids}
+        data = self.to_bytes()
+        remaining = [
+            data[offset: offset + GUID_SIZE]
+            for offset in range(0, len(data), GUID_SIZE)
+            if data[offset: offset + GUID_SIZE] not in removed
+        ]
+        self.buffer, self.start, self.count = b"".join(remaining), 0, len(remaining)
+        self.extras = tuple(item_id for item_id in self.extras if item_id not in ids)
+
+
+class BinaryStorage:
+    """This class stores the ids in a compact binary index.
+
+    The site urls and list ids are interned in a string table of a JSON header, and the
+    item ids of each list are stored as a sorted block of 16 bytes GUIDs. The index is
+    memory mapped when loaded, so the deletion sync reads the item ids without building
+    a Python object per id."""
+
+    def __init__(self, logger, path=IDS_INDEX_PATH):
+        self.logger = logger
+        self.path = path
+        self.index = None
+
+    def close(self):
+        """Unmaps the index loaded last, the blocks read from it must not be used afterwards"""
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+    def load_storage(self):
+        """This method loads the ids from the index, the item ids being blocks of the memory mapped index.
+        The ids of an existing doc_id.json file are loaded when there is no index yet.
+        """
+        if not os.path.exists(self.path):
+            self.logger.debug("Binary index of the ids was not found, loading the ids from the json storage.")
+            return LocalStorage(self.logger).load_storage()
+        self.close()
+        with open(self.path, "rb") as index_file:
+            self.index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = INDEX_HEADER.unpack_from(self.index)
+        if magic != INDEX_MAGIC:
+            self.logger.error(f"The binary index of the ids at {self.path} has an unknown format.")
+            return {"global_keys": {}}
+        header = json.loads(self.index[INDEX_HEADER.size: INDEX_HEADER.size + header_size])
+        data_start = INDEX_HEADER.size + header_size
+        strings = header["strings"]
+
+        def decode(collections):
+            decoded = {}
+            for collection, collection_ids in collections.items():
+                ids = get_empty_ids()
+                ids["sites"] = collection_ids["sites"]
+                for site_ref, lists in collection_ids["lists"].items():
+                    ids["lists"][strings[int(site_ref)]] = {
+                        strings[int(list_ref)]: title for list_ref, title in lists.items()
+                    }
+                for object_type in ITEM_TYPES:
+                    for site_ref, lists in collection_ids[object_type].items():
+                        ids[object_type][strings[int(site_ref)]] = {
+                            strings[int(list_ref)]: GuidBlock(self.index, data_start + offset, count, extras)
+                            for list_ref, (offset, count, extras) in lists.items()
+                        }
+                decoded[collection] = ids
+            return decoded
+
+        return {"global_keys": decode(header["global_keys"]), "delete_keys": decode(header["delete_keys"])}
+
+    def update_storage(self, ids):
+        """This method writes the ids to a new index, replacing the previous one
+            :param ids: dictionary containing the global_keys and delete_keys of the collections
+        """
+        strings, string_refs, blocks = [], {}, []
+        # The global_keys and delete_keys mostly hold the same item ids, each distinct block is written once
+        offsets = {}
+        data_size = 0
+
+        def get_ref(value):
+            if value not in string_refs:
+                string_refs[value] = str(len(strings))
+                strings.append(value)
+            return string_refs[value]
+
+        def encode(collections):
+            nonlocal data_size
+            encoded = {}
+            for collection, collection_ids in collections.items():
+                encoded_ids = {"sites": collection_ids.get("sites", {}), "lists": {}}
+                for site_url, lists in collection_ids.get("lists", {}).items():
+                    encoded_ids["lists"][get_ref(site_url)] = {
+                        get_ref(list_id): title for list_id, title in lists.items()
+                    }
+                for object_type in ITEM_TYPES:
+                    encoded_ids[object_type] = {}
+                    for site_url, lists in collection_ids.get(object_type, {}).items():
+                        encoded_lists = encoded_ids[object_type][get_ref(site_url)] = {}
+                        for list_id, item_ids in lists.items():
+                            block = item_ids if isinstance(item_ids, GuidBlock) else GuidBlock.from_ids(item_ids)
+                            data = block.to_bytes()
+                            if data not in offsets:
+                                offsets[data] = data_size
+                                blocks.append(data)
+                                data_size += len(data)
+                            encoded_lists[get_ref(list_id)] = [offsets[data], block.count, list(block.extras)]
+                encoded[collection] = encoded_ids
+            return encoded
+
+        header = {"global_keys": encode(ids.get("global_keys", {})), "delete_keys": encode(ids.get("delete_keys", {}))}
+        header["strings"] = strings
+        header = json.dumps(header).encode("utf-8")
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "wb") as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, len(header)))
+            index_file.write(header)
+            for block in blocks:
+                index_file.write(block)
+        # The blocks are written from the previous index, which can only be replaced once it is unmapped
+        self.close()
+        os.replace(temporary_path, self.path)
+
+    def get_storage_with_collection(self, collection):
+        """Returns a dictionary containing the locally stored IDs of files fetched from SharePoint,
+        the item ids of the collection being fetched are turned into sets so they can be updated
+            :param collection: The SharePoint server collection which is currently being fetched
+        """
+        storage = self.load_storage()
+        global_keys = dict(storage["global_keys"])
+        stored_ids = global_keys.get(collection) or get_empty_ids()
+        ids = {
+            "sites": dict(stored_ids["sites"]),
+            "lists": {site_url: dict(lists) for site_url, lists in stored_ids["lists"].items()},
+        }
+        for object_type in ITEM_TYPES:
+            ids[object_type] = {
+                site_url: {list_id: set(item_ids) for list_id, item_ids in lists.items()}
+                for site_url, lists in stored_ids[object_type].items()
             }
-        storage_with_collection["global_keys"][collection] = copy.deepcopy(
-            ids_collection["global_keys"][collection]
+        global_keys[collection] = ids
+        return {"global_keys": global_keys, "delete_keys": storage["global_keys"]}
+
+
+def get_fingerprint(document):
+    """Returns a digest of a document as it is sent to the Enterprise Search, permissions included
+    :param document: document to be indexed
+    """
+    return hashlib.blake2b(serialize_document(document).encode("utf-8"), digest_size=16).digest()
+
+
+class FingerprintStorage:
+    """This class keeps the fingerprint of the last indexed version of each document in a SQLite database.
+
+    The fingerprints of the documents sent during a sync are only stored once the Enterprise Search
+    indexed them, so that a document failing to be indexed is sent again by the next sync."""
+
+    def __init__(self, logger, path=FINGERPRINTS_PATH):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (id TEXT PRIMARY KEY, fingerprint BLOB NOT NULL) WITHOUT ROWID"
         )
+        self.connection.commit()
+        self.pending = {}
+        self.stats = {"skipped": 0, "sent": 0}
 
-        return storage_with_collection
+    def get_changed_documents(self, documents):
+        """Returns the documents whose fingerprint differs from the one of their last indexed version
+        :param documents: documents to be indexed
+        """
+        fingerprints = {document["id"]: get_fingerprint(document) for document in documents}
+        document_ids = list(fingerprints)
+        with self.lock:
+            stored_fingerprints = {}
+            for i in range(0, len(document_ids), LOOKUP_BATCH_SIZE):
+                chunk = document_ids[i: i + LOOKUP_BATCH_SIZE]
+                stored_fingerprints.update(self.connection.execute(
+                    f"SELECT id, fingerprint FROM fingerprints WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ))
+            changed_documents = [
+                document for document in documents if stored_fingerprints.get(document["id"]) != fingerprints[document["id"]]
+            ]
+            for document in changed_documents:
+                self.pending[document["id"]] = fingerprints[document["id"]]
+            self.stats["skipped"] += len(documents) - len(changed_documents)
+            self.stats["sent"] += len(changed_documents)
+        return changed_documents
+
+    def commit(self, document_ids):
+        """Stores the fingerprints of documents that were indexed
+        :param document_ids: ids of the indexed documents
+        """
+        with self.lock:
+            rows = [
+                (document_id, self.pending.pop(document_id)) for document_id in document_ids
+                if document_id in self.pending
+            ]
+            if rows:
+                self.connection.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?)", rows)
+                self.connection.commit()
+
+    def remove(self, document_ids):
+        """Forgets the fingerprints of documents that were deleted from the Enterprise Search
+        :param document_ids: ids of the deleted documents
+        """
+        with self.lock:
+            for document_id in document_ids:
+                self.pending.pop(document_id, None)
+            self.connection.executemany(
+                "DELETE FROM fingerprints WHERE id = ?", [(document_id,) for document_id in document_ids]
+            )
+            self.connection.commit()
+
+    def get_stats(self):
+        """Returns the number of unchanged documents that were skipped and of documents sent to be indexed"""
+        with self.lock:
+            return dict(self.stats)
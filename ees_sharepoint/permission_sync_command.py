@@ -73,8 +73,9 @@ class PermissionSyncCommand(BaseCommand):
         for collection in self.site_collections:
             user_group_collection = {}
             rel_url = f"sites/{collection}/"
-            for name, user_id in user_ids[collection].items():
-                response = self.permissions.fetch_groups(rel_url, user_id)
+            names = list(user_ids[collection])
+            responses = self.permissions.fetch_groups_batch(rel_url, list(user_ids[collection].values()))
+            for name, response in zip(names, responses):
                 if response:
                     groups = get_results(self.logger, response.json(), "user_groups")
                     if groups:
@@ -127,4 +128,7 @@ class PermissionSyncCommand(BaseCommand):
         if not enable_permission:
             logger.warn("Exiting as the enable permission flag is set to False")
             raise PermissionSyncDisabledException
-        self.sync_permissions()
+        try:
+            self.sync_permissions()
+        finally:
+            self.sharepoint_client.close()
@@ -0,0 +1,198 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""rate_limiter module adapts the pace of the requests sent to the SharePoint server to its load.
+
+Every request takes a token from a bucket shared by all the threads, which caps the number of
+requests per second, and a slot below a concurrency limit adjusted with AIMD: the limit grows by
+one request per round trip while the server answers promptly, and it is halved when the server
+throttles the connector or when its latency sharply rises. The latency is compared to the usual
+latency of the same class of requests, as a page of 5000 items or a download takes far longer to be
+answered than a permission lookup. A throttled response pauses all the
+requests for the time given by its Retry-After header, or for an exponential backoff."""
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Waits longer than this number of seconds are capped
+MAX_RETRY_AFTER = 300
+# Number of times a throttled request is retried, on top of the retries of server errors
+MAX_THROTTLE_RETRIES = 8
+# Share of a wait added or removed at random, so that the threads do not all resume at once
+JITTER = 0.2
+DECREASE_FACTOR = 0.5
+# The latency sharply rises when its short term average exceeds its long term average by this factor
+LATENCY_TOLERANCE = 2
+# Number of responses observed before the latency drives the concurrency limit
+LATENCY_WARMUP = 20
+SHORT_TERM_WEIGHT = 0.2
+LONG_TERM_WEIGHT = 0.01
+# Time after which a request waiting for a free slot checks the limits again
+SLOT_WAIT = 0.05
+METADATA = "metadata"
+# Parts of the urls of the classes of requests whose latency differs from the one of the metadata requests
+REQUEST_CLASSES = [
+    ("downloads", ["/$value", "/openbinarystream", "/download.aspx"]),
+    ("permissions", ["roleassignments", "/sitegroups", "/siteusers", "effectivebasepermissions"]),
+    ("batches", ["/$batch"]),
+    ("items", ["/items"]),
+]
+
+
+def backoff(retry):
+    """Returns the number of seconds to wait before a retry, growing exponentially with some jitter
+    :param retry: number of the retry, starting at 0
+    """
+    return min(2 ** retry, MAX_RETRY_AFTER) * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def get_retry_after(headers):
+    """Returns the number of seconds the server asks to wait before the next request
+    :param headers: headers of the response
+    Returns:
+        The number of seconds, given either as a number or as a date, or None if the header is missing or invalid
+    """
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+
+def is_throttled(status_code, retry_after):
+    """Returns whether a response means that the server throttles the requests of the connector.
+    SharePoint answers 429 Too Many Requests, or 503 Server Too Busy along with a Retry-After header.
+    :param status_code: status code of the response
+    :param retry_after: number of seconds given by the Retry-After header of the response
+    """
+    return status_code == 429 or (status_code == 503 and retry_after is not None)
+
+
+def get_request_class(url, stream=False):
+    """Returns the class of a request, the latency of a request being compared to the one of its class
+    :param url: url of the request
+    :param stream: whether the body of the response is streamed, as for the downloads of files
+    """
+    if stream:
+        return "downloads"
+    url = url.lower()
+    for request_class, parts in REQUEST_CLASSES:
+        if any(part in url for part in parts):
+            return request_class
+    return METADATA
+
+
+class RateLimiter:
+    """This class paces the requests of all the threads to the SharePoint server"""
+
+    def __init__(self, max_concurrency, max_rate=0):
+        self.max_concurrency = max_concurrency
+        self.max_rate = max_rate
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        # The bucket holds up to one second worth of requests
+        self.tokens = float(max(max_rate, 1))
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0
+        self.consecutive_throttles = 0
+        # Short term average, long term average and number of responses of each class of requests
+        self.latencies = {}
+        self.decreased_at = 0
+        self.condition = threading.Condition()
+        self.stats = {"throttled": 0, "throttle_wait": 0.0, "concurrency_decreases": 0}
+
+    def try_acquire(self):
+        """Takes a slot and a token for a request if both are available
+        Returns:
+            None if the request can be sent, otherwise the number of seconds to wait before trying again
+        """
+        with self.condition:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.limit):
+                return SLOT_WAIT
+            if self.max_rate:
+                self.tokens = min(max(self.max_rate, 1), self.tokens + (now - self.refilled_at) * self.max_rate)
+                self.refilled_at = now
+                if self.tokens < 1:
+                    return (1 - self.tokens) / self.max_rate
+                self.tokens -= 1
+            self.in_flight += 1
+            return None
+
+    def acquire(self):
+        """Blocks the calling thread until a request can be sent"""
+        while True:
+            delay = self.try_acquire()
+            if delay is None:
+                return
+            with self.condition:
+                self.condition.wait(delay)
+
+    def release(self, latency, status_code=None, retry_after=None, request_class=METADATA):
+        """Frees the slot of a request and adjusts the limits to its outcome
+        :param latency: number of seconds the server took to answer
+        :param status_code: status code of the response, None if the request failed
+        :param retry_after: number of seconds given by the Retry-After header of the response
+        :param request_class: class of the request, as returned by get_request_class
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if is_throttled(status_code, retry_after):
+                self.stats["throttled"] += 1
+                if retry_after is None:
+                    retry_after = backoff(self.consecutive_throttles)
+                else:
+                    retry_after *= random.uniform(1, 1 + JITTER)
+                self.consecutive_throttles += 1
+                paused_until = max(self.paused_until, now + retry_after)
+                self.stats["throttle_wait"] += paused_until - max(self.paused_until, now)
+                self.paused_until = paused_until
+                self.decrease(now)
+            elif status_code is not None and status_code < 500:
+                self.consecutive_throttles = 0
+                self.observe_latency(latency, now, request_class)
+            self.condition.notify_all()
+
+    def observe_latency(self, latency, now, request_class=METADATA):
+        """Grows the concurrency limit by one request per round trip, unless the latency of the class of
+        the request sharply rises"""
+        if request_class not in self.latencies:
+            self.latencies[request_class] = [latency, latency, 0]
+        averages = self.latencies[request_class]
+        averages[0] += SHORT_TERM_WEIGHT * (latency - averages[0])
+        averages[1] += LONG_TERM_WEIGHT * (latency - averages[1])
+        averages[2] += 1
+        if averages[2] > LATENCY_WARMUP and averages[0] > LATENCY_TOLERANCE * averages[1]:
+            self.decrease(now)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def decrease(self, now):
+        """Halves the concurrency limit, at most once per round trip of a metadata request as the
+        requests in flight were sent before the previous decrease took effect"""
+        if now - self.decreased_at < self.latencies.get(METADATA, [1])[0]:
+            return
+        self.decreased_at = now
+        self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+        self.stats["concurrency_decreases"] += 1
+
+    def get_stats(self):
+        """Returns the current concurrency limit, the number of throttled requests, the number of seconds
+        the requests were paused and the number of times the concurrency limit was decreased"""
+        with self.condition:
+            stats = dict(self.stats, concurrency_limit=int(self.limit))
+        stats["throttle_wait"] = round(stats["throttle_wait"], 1)
+        return stats
@@ -187,6 +187,89 @@ schema = {
         'default': 5,
         'min': 1
     },
+    'extraction_thread_count': {
+        'required': False,
+        'type': 'integer',
+        'default': 5,
+        'min': 1
+    },
+    'extraction_timeout': {
+        'required': False,
+        'type': 'integer',
+        'default': 60,
+        'min': 1
+    },
+    'max_file_size': {
+        'required': False,
+        'type': 'integer',
+        'default': 100,
+        'min': 1
+    },
+    'file_size_policy': {
+        'required': False,
+        'type': 'string',
+        'default': 'skip',
+        'allowed': ['skip', 'truncate']
+    },
+    'extraction_cache_size': {
+        'required': False,
+        'type': 'integer',
+        'default': 1024,
+        'min': 0
+    },
+    'max_batch_payload_size': {
+        'required': False,
+        'type': 'integer',
+        'default': 10,
+        'min': 1
+    },
+    'skip_unchanged_documents': {
+        'required': False,
+        'type': 'boolean',
+        'default': False
+    },
+    'sync_queue_size': {
+        'required': False,
+        'type': 'integer',
+        'default': 50,
+        'min': 1
+    },
+    'sharepoint_sync_engine': {
+        'required': False,
+        'type': 'string',
+        'default': 'threads',
+        'allowed': ['threads', 'asyncio']
+    },
+    'sharepoint_async_concurrency': {
+        'required': False,
+        'type': 'integer',
+        'default': 100,
+        'min': 1
+    },
+    'sharepoint_max_requests_per_second': {
+        'required': False,
+        'type': 'number',
+        'default': 0,
+        'min': 0
+    },
+    'sharepoint_odata_metadata': {
+        'required': False,
+        'type': 'string',
+        'default': 'verbose',
+        'allowed': ['verbose', 'minimal', 'nometadata']
+    },
+    'incremental_sync_mode': {
+        'required': False,
+        'type': 'string',
+        'default': 'time_range',
+        'allowed': ['time_range', 'change_log']
+    },
+    'ids_storage': {
+        'required': False,
+        'type': 'string',
+        'default': 'json',
+        'allowed': ['json', 'sqlite', 'binary']
+    },
     'sharepoint_workplace_user_mapping': {
         'required': False,
         'type': 'string'
@@ -5,12 +5,90 @@
 #
 """sharepoint_client allows to call Sharepoint or make queries for it."""
 
+import queue
+import re
+import tempfile
+import threading
 import time
-import requests
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
+import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from requests.utils import requote_uri
 from requests_ntlm import HttpNtlmAuth
 
+from .json_codec import loads
+from .rate_limiter import MAX_THROTTLE_RETRIES, RateLimiter, backoff, get_request_class, get_retry_after, is_throttled
+
+PAGE_SIZE = 5000
+PAGINATED_OBJECTS = ["sites", "lists", "list_items", "drive_items"]
+# Maximum number of sub-requests sent in a single $batch request
+BATCH_REQUEST_SIZE = 100
+# Downloaded files are kept in memory up to this size, and spooled to a temporary file beyond it
+SPOOL_SIZE = 5 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Maximum number of changes returned by a single GetChanges call
+CHANGE_FETCH_LIMIT = 1000
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+VERBOSE = "verbose"
+# Status codes of the $batch requests meaning that the server does not provide the $batch endpoint at all,
+# unlike 400 Bad Request which is only returned for the request that was sent
+BATCH_UNSUPPORTED_STATUS_CODES = [404, 405, 501]
+
+
+class PageFetchException(Exception):
+    """Exception raised when a page of a paginated GET call could not be fetched, the results of the
+    previous pages being incomplete.
+
+    Attributes:
+        url - url of the page
+        response - response of the page, False if no response was received
+    """
+
+    def __init__(self, url, response=False):
+        super().__init__(f"Error while fetching a page of results from the sharepoint, url: {url}.")
+
+        self.url = url
+        self.response = response
+
+
+class BatchResponseException(Exception):
+    """Exception raised when a $batch response can not be matched with the sub-requests of its request.
+
+    Attributes:
+        expected_count - number of sub-requests of the $batch request
+        count - number of responses found in the $batch response
+    """
+
+    def __init__(self, expected_count, count):
+        super().__init__(f"The $batch response holds {count} responses for {expected_count} sub-requests.")
+
+        self.expected_count = expected_count
+        self.count = count
+
+
+def parse_page(content):
+    """Parses a page of results, returned either in the verbose format or in the lighter
+    minimal and nometadata formats, where the results are not wrapped in a "d" object and the
+    collections they embed are arrays rather than objects holding a "results" array
+    :param content: body of the response
+    Returns:
+        results: list of results of the page, embedded collections being laid out as in the verbose format
+        next_url: absolute url of the next page, or None for the last page
+    """
+    data = loads(content)
+    if "d" in data:
+        return data["d"].get("results", []), data["d"].get("__next")
+    results = data.get("value", [])
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, list):
+                result[key] = {"results": value}
+    return results, data.get("odata.nextLink")
+
 
 class SharePoint:
     """This class encapsulates all module logic."""
@@ -23,6 +101,141 @@ class SharePoint:
         self.password = config.get_value("sharepoint.password")
         self.secure_connection = config.get_value("sharepoint.secure_connection")
         self.certificate_path = config.get_value("sharepoint.certificate_path")
+        self.pool_size = int(config.get_value("sharepoint_sync_thread_count"))
+        # NTLM authenticates a connection rather than a request, so every session keeps its own
+        # handler and keep-alive connections. Idle sessions are parked here and reused by any thread.
+        self.session_pool = queue.LifoQueue(maxsize=self.pool_size)
+        self.stats_lock = threading.Lock()
+        self.stats = {"sessions": 0, "requests": 0, "connections": 0}
+        self.digests = {}
+        # The asyncio engine sends its requests on top of the ones of the threads, through the same rate limiter
+        max_concurrency = self.pool_size
+        if config.get_value("sharepoint_sync_engine") == "asyncio":
+            max_concurrency += int(config.get_value("sharepoint_async_concurrency"))
+        self.rate_limiter = RateLimiter(max_concurrency, float(config.get_value("sharepoint_max_requests_per_second")))
+        # The pages of objects may be requested with less metadata than the other requests, which are
+        # always sent in the verbose format, as the connector reads the types of the changes from it
+        self.odata_metadata = config.get_value("sharepoint_odata_metadata")
+        self.page_headers = None
+        if self.odata_metadata != VERBOSE:
+            self.page_headers = {"accept": f"application/json;odata={self.odata_metadata}"}
+        # $batch is not available on older farms, in which case sub-requests are sent one by one
+        self.batch_supported = True
+
+    def new_session(self):
+        """Creates a session that keeps its NTLM authenticated connections alive between requests"""
+        session = requests.Session()
+        session.auth = HttpNtlmAuth(self.domain + "\\" + self.username, self.password)
+        session.headers.update({
+            "accept": "application/json;odata=verbose",
+            "content-type": "application/json;odata=verbose"
+        })
+        if self.secure_connection and self.certificate_path:
+            session.verify = self.certificate_path
+        else:
+            session.verify = self.secure_connection
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        with self.stats_lock:
+            self.stats["sessions"] += 1
+        return session
+
+    @staticmethod
+    def session_usage(session):
+        """Returns the number of requests sent and connections opened by a session
+        :param session: session whose connection pools are inspected
+        """
+        requests_count, connections_count = 0, 0
+        # The same adapter is mounted for both http and https
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                if pool:
+                    requests_count += pool.num_requests
+                    connections_count += pool.num_connections
+        return requests_count, connections_count
+
+    @contextmanager
+    def session(self):
+        """Checks out an authenticated session for the calling thread and returns it to the pool afterwards.
+        A new session is created when all pooled sessions are in use, and the surplus ones are closed
+        on release so that at most `sharepoint_sync_thread_count` sessions are kept alive."""
+        try:
+            session = self.session_pool.get_nowait()
+        except queue.Empty:
+            session = self.new_session()
+        try:
+            yield session
+        finally:
+            try:
+                self.session_pool.put_nowait(session)
+            except queue.Full:
+                self.close_session(session)
+
+    def close_session(self, session):
+        """Closes a session and keeps track of its connection usage
+        :param session: session to be closed
+        """
+        requests_count, connections_count = self.session_usage(session)
+        with self.stats_lock:
+            self.stats["requests"] += requests_count
+            self.stats["connections"] += connections_count
+        session.close()
+
+    def get_connection_stats(self):
+        """Returns the number of sessions created, requests sent, connections opened and
+        requests that were served over an already established connection"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        for session in list(self.session_pool.queue):
+            requests_count, connections_count = self.session_usage(session)
+            stats["requests"] += requests_count
+            stats["connections"] += connections_count
+        stats["reused"] = stats["requests"] - stats["connections"]
+        stats.update(self.rate_limiter.get_stats())
+        return stats
+
+    def close(self):
+        """Closes all the pooled sessions along with their connections"""
+        while True:
+            try:
+                session = self.session_pool.get_nowait()
+            except queue.Empty:
+                break
+            self.close_session(session)
+
+    def send(self, method, url, **kwargs):
+        """ Sends a request once the rate limiter allows it, waiting and sending it again while the server throttles it
+            :param method: method of the request
+            :param url: absolute url of the request
+            Returns:
+                Response of the request"""
+        throttle_retry = 0
+        while True:
+            self.rate_limiter.acquire()
+            start_time = time.monotonic()
+            response = None
+            try:
+                with self.session() as session:
+                    response = session.request(method, url, **kwargs)
+            finally:
+                status_code, retry_after = None, None
+                if response is not None:
+                    status_code, retry_after = response.status_code, get_retry_after(response.headers)
+                self.rate_limiter.release(
+                    time.monotonic() - start_time, status_code, retry_after,
+                    get_request_class(url, kwargs.get("stream", False)),
+                )
+            if not is_throttled(status_code, retry_after) or throttle_retry >= MAX_THROTTLE_RETRIES:
+                return response
+            self.logger.warning(
+                f"The sharepoint server throttled the request, url: {url}. Throttle Retry Count: {throttle_retry}."
+            )
+            if kwargs.get("stream"):
+                response.close()
+            throttle_retry += 1
 
     def get(self, rel_url, query, param_name):
         """ Invokes a GET call to the Sharepoint server
@@ -30,81 +243,445 @@ class SharePoint:
             :param query: query for passing arguments to the url
             :param param_name: parameter name whether it is sites, lists, list_items, drive_items, permissions or deindex
             Returns:
-                Response of the GET call"""
-        request_headers = {
-            "accept": "application/json;odata=verbose",
-            "content-type": "application/json;odata=verbose"
-        }
+                Response of the GET call, the results of all the pages for the paginated objects, or the failed
+                response if a page could not be fetched"""
+        if param_name in PAGINATED_OBJECTS:
+            response_list = {"d": {"results": []}}
+            try:
+                for results in self.get_pages(rel_url, query, param_name):
+                    response_list["d"]["results"].extend(results)
+            except PageFetchException as exception:
+                return exception.response
+            return response_list
+        return self.fetch(f"{self.host}/{rel_url}{query}", param_name)
 
-        response_list = {"d": {"results": []}}
-        paginate_query = True
-        skip, top = 0, 5000
-        while paginate_query:
+    def get_pages(self, rel_url, query, param_name):
+        """ Invokes paginated GET calls to the Sharepoint server and lazily yields the results page by page,
+            so that only one page is held in memory at a time
+            :param rel_url: relative url to the sharepoint farm
+            :param query: query for passing arguments to the url
+            :param param_name: parameter name whether it is sites, lists, list_items or drive_items
+            Yields:
+                List of results of a page
+            Raises:
+                PageFetchException: if a page could not be fetched"""
+        skip = 0
+        if param_name in ["sites", "lists"]:
+            url = f"{self.host}/{rel_url}{query}&$skip={skip}&$top={PAGE_SIZE}"
+        else:
+            url = f"{self.host}/{rel_url}{query}&$top={PAGE_SIZE}"
+        while url:
+            response = self.fetch(url, param_name, headers=self.page_headers)
+            if not response:
+                raise PageFetchException(url, response)
+            results, next_url = parse_page(response.content)
+            yield results
             if param_name in ["sites", "lists"]:
-                paginate_query = query + f"&$skip={skip}&$top={top}"
-            elif skip == 0 and param_name in ["list_items", "drive_items"]:
-                paginate_query = query + f"&$top={top}"
-            elif param_name in ["permission_users", "permission_groups", "deindex", "attachment"]:
-                paginate_query = query
-            url = f"{self.host}/{rel_url}{paginate_query}"
-            skip += 5000
-            retry = 0
-            if self.secure_connection and self.certificate_path:
-                verify = self.certificate_path
+                skip += PAGE_SIZE
+                if len(results) < PAGE_SIZE:
+                    url = None
+                else:
+                    url = f"{self.host}/{rel_url}{query}&$skip={skip}&$top={PAGE_SIZE}"
             else:
-                verify = self.secure_connection
-            while retry <= self.retry_count:
-                try:
-                    response = requests.get(
-                        url,
-                        auth=HttpNtlmAuth(self.domain + "\\" + self.username, self.password),
-                        headers=request_headers,
-                        verify=verify,
-                    )
-                    if response.ok:
-                        if param_name in ["sites", "lists"] and response:
-                            response_data = response.json()
-                            response_result = response_data.get("d", {}).get("results")
-                            response_list["d"]["results"].extend(response_result)
-                            if len(response_result) < 5000:
-                                paginate_query = None
-                            break
-                        if param_name in ["list_items", "drive_items"] and response:
-                            response_data = response.json()
-                            response_list["d"]["results"].extend(response_data.get("d", {}).get("results"))
-                            paginate_query = response_data.get("d", {}).get("__next", False)
-                            break
-
-                        return response
+                # The next link is an absolute url that carries the skip token of the next page
+                url = next_url
+
+    def fetch(self, url, param_name, headers=None):
+        """ Invokes a GET call to the given url, retrying in case of server errors
+            :param url: absolute url of the request
+            :param param_name: parameter name whether it is sites, lists, list_items, drive_items, permissions or deindex
+            :param headers: headers overriding the ones of the session
+            Returns:
+                Response of the GET call"""
+        retry = 0
+        while retry <= self.retry_count:
+            try:
+                response = self.send("GET", url, headers=headers)
+                if response.ok:
+                    return response
 
+                if response.status_code >= 400 and response.status_code < 500:
+                    if not (param_name == 'deindex' and response.status_code == 404):
+                        self.logger.exception(
+                            f"Error: {response.reason}. Error while fetching from the sharepoint, url: {url}."
+                        )
+                    return response
+                self.logger.error(
+                    f"Error while fetching from the sharepoint, url: {url}. Retry Count: {retry}. Error: {response.reason}"
+                )
+                # This condition is to avoid sleeping for the last time
+                if retry < self.retry_count:
+                    time.sleep(backoff(retry))
+                retry += 1
+            except RequestException as exception:
+                self.logger.exception(
+                    f"Error while fetching from the sharepoint, url: {url}. Retry Count: {retry}. Error: {exception}"
+                )
+                # This condition is to avoid sleeping for the last time
+                if retry < self.retry_count:
+                    time.sleep(backoff(retry))
+                else:
+                    return False
+                retry += 1
+        return response
+
+    def download(self, rel_url, max_size, truncate=False):
+        """ Streams a file from the Sharepoint server, in chunks, into a temporary file that is only
+            written to the disk once it exceeds SPOOL_SIZE
+            :param rel_url: relative url of the file content to the sharepoint farm
+            :param max_size: maximum size of the file in bytes
+            :param truncate: whether files larger than max_size are truncated, they are skipped otherwise
+            Returns:
+                Temporary file positioned at its beginning, or None if the file was skipped or could not be fetched"""
+        url = f"{self.host}/{rel_url}"
+        retry = 0
+        while retry <= self.retry_count:
+            try:
+                with self.send("GET", url, stream=True) as response:
+                    if response.ok:
+                        return self.spool(response, url, max_size, truncate)
                     if response.status_code >= 400 and response.status_code < 500:
-                        if not (param_name == 'deindex' and response.status_code == 404):
-                            self.logger.exception(
-                                f"Error: {response.reason}. Error while fetching from the sharepoint, url: {url}."
-                            )
-                        return response
+                        self.logger.exception(
+                            f"Error: {response.reason}. Error while fetching from the sharepoint, url: {url}."
+                        )
+                        return None
+                self.logger.error(
+                    f"Error while fetching from the sharepoint, url: {url}. Retry Count: {retry}. Error: {response.reason}"
+                )
+            except RequestException as exception:
+                self.logger.exception(
+                    f"Error while fetching from the sharepoint, url: {url}. Retry Count: {retry}. Error: {exception}"
+                )
+            # This condition is to avoid sleeping for the last time
+            if retry < self.retry_count:
+                time.sleep(backoff(retry))
+            retry += 1
+        return None
+
+    def spool(self, response, url, max_size, truncate):
+        """ Reads a streamed response into a temporary file, up to max_size bytes
+            :param response: streamed response of the file content
+            :param url: url of the file, used for logging
+            :param max_size: maximum size of the file in bytes
+            :param truncate: whether files larger than max_size are truncated, they are skipped otherwise
+            Returns:
+                Temporary file positioned at its beginning, or None if the file was skipped"""
+        if int(response.headers.get("content-length", 0)) > max_size and not truncate:
+            self.logger.warning(f"Skipping the file at {url} as its size exceeds the max_file_size limit")
+            return None
+        spooled_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        size = 0
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            if size + len(chunk) > max_size:
+                if not truncate:
+                    self.logger.warning(f"Skipping the file at {url} as its size exceeds the max_file_size limit")
+                    spooled_file.close()
+                    return None
+                self.logger.warning(f"Truncating the file at {url} as its size exceeds the max_file_size limit")
+                spooled_file.write(chunk[:max_size - size])
+                break
+            spooled_file.write(chunk)
+            size += len(chunk)
+        spooled_file.seek(0)
+        return spooled_file
+
+    def post(self, rel_url, payload, param_name):
+        """ Invokes a POST call to the Sharepoint server
+            :param rel_url: relative url to the sharepoint farm, of an api of a site
+            :param payload: json body of the request
+            :param param_name: parameter name of the object posted, used for logging
+            Returns:
+                Response of the POST call"""
+        site_url = rel_url.split("/_api/")[0]
+        url = f"{self.host}/{rel_url}"
+        retry = 0
+        while retry <= self.retry_count:
+            try:
+                digest = self.get_form_digest(site_url)
+                response = self.send("POST", url, json=payload, headers={"X-RequestDigest": digest or ""})
+                if response.ok:
+                    return response
+                if response.status_code >= 400 and response.status_code < 500:
                     self.logger.error(
-                        f"Error while fetching from the sharepoint, url: {url}. Retry Count: {retry}. Error: {response.reason}"
+                        f"Error: {response.reason}. Error while posting {param_name} to the sharepoint, url: {url}."
                     )
-                    # This condition is to avoid sleeping for the last time
-                    if retry < self.retry_count:
-                        time.sleep(2 ** retry)
-                    retry += 1
-                    paginate_query = None
-                    continue
-                except RequestException as exception:
-                    self.logger.exception(
-                        f"Error while fetching from the sharepoint, url: {url}. Retry Count: {retry}. Error: {exception}"
+                    return response
+                self.logger.error(
+                    f"Error while posting {param_name} to the sharepoint, url: {url}. Retry Count: {retry}. Error: {response.reason}"
+                )
+                # This condition is to avoid sleeping for the last time
+                if retry < self.retry_count:
+                    time.sleep(backoff(retry))
+                retry += 1
+            except RequestException as exception:
+                self.logger.exception(
+                    f"Error while posting {param_name} to the sharepoint, url: {url}. Retry Count: {retry}. Error: {exception}"
+                )
+                # This condition is to avoid sleeping for the last time
+                if retry < self.retry_count:
+                    time.sleep(backoff(retry))
+                else:
+                    return False
+                retry += 1
+        return response
+
+    def get_changes(self, site_url, change_token, end_change_token):
+        """ Fetches the changes made to the sites, lists and items of a site collection from its change log
+            :param site_url: relative url of the site collection
+            :param change_token: change token the changes are fetched from
+            :param end_change_token: change token the changes are fetched up to
+            Returns:
+                List of changes in the order they were made, or None if the change log could not be fetched"""
+        changes = []
+        while True:
+            query = {
+                "query": {
+                    "__metadata": {"type": "SP.ChangeQuery"},
+                    "Add": True,
+                    "Update": True,
+                    "DeleteObject": True,
+                    "Restore": True,
+                    "Rename": True,
+                    "Move": True,
+                    "Item": True,
+                    "List": True,
+                    "Web": True,
+                    "FetchLimit": CHANGE_FETCH_LIMIT,
+                    "ChangeTokenStart": {"__metadata": {"type": "SP.ChangeToken"}, "StringValue": change_token},
+                    "ChangeTokenEnd": {"__metadata": {"type": "SP.ChangeToken"}, "StringValue": end_change_token},
+                }
+            }
+            response = self.post(f"{site_url}/_api/site/getChanges", query, "changes")
+            if not response:
+                return None
+            results = response.json().get("d", {}).get("results", [])
+            changes.extend(results)
+            if len(results) < CHANGE_FETCH_LIMIT:
+                return changes
+            change_token = results[-1]["ChangeToken"]["StringValue"]
+
+    def get_change_token(self, site_url, change_time):
+        """ Returns a change token of a site collection pointing at a point in time of its change log
+            :param site_url: relative url of the site collection
+            :param change_time: time of the change token, in the %Y-%m-%dT%H:%M:%SZ format
+            Returns:
+                The change token, or None if the id of the site collection could not be fetched"""
+        response = self.fetch(f"{self.host}/{site_url}/_api/site?$select=Id", "changes")
+        if not response:
+            return None
+        site_id = response.json().get("d", {}).get("Id")
+        # Change tokens are made of the version, scope, scope id, .NET ticks and change number of the change,
+        # -1 standing for any change number at that time
+        ticks = (datetime.strptime(change_time, DATETIME_FORMAT) - datetime(1, 1, 1)) // timedelta(microseconds=1) * 10
+        return f"1;1;{site_id};{ticks};-1"
+
+    def get_list_item_ids(self, site_url, list_id):
+        """ Fetches the GUIDs of all the items currently present in a list, page by page
+            :param site_url: relative url of the site the list belongs to
+            :param list_id: list guid
+            Returns:
+                Set of GUIDs, empty if the list does not exist anymore, or None if they could not be fetched"""
+        url = f"{self.host}/{site_url}/_api/web/lists(guid'{list_id}')/items?$select=GUID&$top={PAGE_SIZE}"
+        item_ids = set()
+        while url:
+            response = self.fetch(url, "deindex", headers=self.page_headers)
+            if response is not False and response.status_code == requests.codes["not_found"]:
+                return set()
+            if not response:
+                return None
+            results, url = parse_page(response.content)
+            item_ids.update(item["GUID"] for item in results)
+        return item_ids
+
+    def get_last_item_id(self, site_url, list_id):
+        """ Returns the highest Id of the items of a list
+            :param site_url: relative url of the site the list belongs to
+            :param list_id: list guid
+            Returns:
+                The Id, or None if it could not be fetched or the list is empty"""
+        response = self.fetch(
+            f"{self.host}/{site_url}/_api/web/lists(guid'{list_id}')/items?$select=Id&$orderby=Id desc&$top=1",
+            "list_items",
+        )
+        if not response:
+            return None
+        results = response.json().get("d", {}).get("results", [])
+        return results[0]["Id"] if results else None
+
+    def get_form_digest(self, site_url):
+        """ Returns the request digest required by the POST calls to a site, requesting a new one once it expired
+            :param site_url: relative url of the site
+            Returns:
+                The form digest value, or None if it could not be fetched"""
+        digest, expires_at = self.digests.get(site_url, (None, 0))
+        if digest and time.time() < expires_at:
+            return digest
+        url = f"{self.host}/{site_url}/_api/contextinfo"
+        try:
+            response = self.send("POST", url)
+        except RequestException as exception:
+            self.logger.exception(f"Error while fetching the request digest, url: {url}. Error: {exception}")
+            return None
+        if not response.ok:
+            self.logger.error(f"Error while fetching the request digest, url: {url}. Error: {response.reason}")
+            return None
+        context_info = response.json().get("d", {}).get("GetContextWebInformation", {})
+        digest = context_info.get("FormDigestValue")
+        # Renew the digest a minute before the server considers it expired
+        timeout = int(context_info.get("FormDigestTimeoutSeconds", 1800)) - 60
+        self.digests[site_url] = (digest, time.time() + timeout)
+        return digest
+
+    def get_batch(self, site_url, rel_urls, param_name):
+        """ Invokes GET calls to the Sharepoint server bundled into OData $batch requests of at most
+            BATCH_REQUEST_SIZE sub-requests. Sub-requests failing with a server error or throttled are retried like
+            the ones invoked by get, and they are sent one by one if the server does not support $batch, rejects
+            a $batch request or answers it with a response that does not match its sub-requests.
+            :param site_url: relative url of the site the $batch requests are sent to
+            :param rel_urls: relative urls to the sharepoint farm, including their query
+            :param param_name: parameter name whether it is permissions or deindex
+            Returns:
+                List of responses in the same order as the relative urls, False for the failed requests"""
+        responses = [False] * len(rel_urls)
+        for start in range(0, len(rel_urls), BATCH_REQUEST_SIZE):
+            pending = list(range(start, min(start + BATCH_REQUEST_SIZE, len(rel_urls))))
+            retry = 0
+            while pending and retry <= self.retry_count:
+                batch_responses = None
+                if self.batch_supported:
+                    batch_responses = self.send_batch(site_url, [rel_urls[index] for index in pending])
+                if batch_responses is None:
+                    for index in pending:
+                        responses[index] = self.fetch(f"{self.host}/{rel_urls[index]}", param_name)
+                    break
+                failed = []
+                for index, response in zip(pending, batch_responses):
+                    response.url = f"{self.host}/{rel_urls[index]}"
+                    responses[index] = response
+                    if response.status_code >= 500 or is_throttled(
+                        response.status_code, get_retry_after(response.headers)
+                    ):
+                        failed.append(index)
+                    elif not response.ok and not (param_name == "deindex" and response.status_code == 404):
+                        self.logger.error(
+                            f"Error: {response.reason}. Error while fetching from the sharepoint, url: {response.url}."
+                        )
+                if failed:
+                    self.logger.error(
+                        f"Error while fetching {len(failed)} requests of a batch from the sharepoint. Retry Count: {retry}."
                     )
                     # This condition is to avoid sleeping for the last time
                     if retry < self.retry_count:
-                        time.sleep(2 ** retry)
-                    else:
-                        return False
-                    retry += 1
-        if retry > self.retry_count:
-            return response
-        return response_list
+                        time.sleep(backoff(retry))
+                pending = failed
+                retry += 1
+        return responses
+
+    def send_batch(self, site_url, rel_urls):
+        """ Sends the GET calls as a single multipart $batch request
+            :param site_url: relative url of the site the $batch request is sent to
+            :param rel_urls: relative urls to the sharepoint farm, including their query
+            Returns:
+                List of responses, or None if the $batch request could not be sent"""
+        boundary = f"batch_{uuid.uuid4()}"
+        host = self.host.rstrip("/")
+        lines = []
+        for rel_url in rel_urls:
+            lines.extend([
+                f"--{boundary}",
+                "Content-Type: application/http",
+                "Content-Transfer-Encoding: binary",
+                "",
+                f"GET {requote_uri(host + '/' + rel_url.lstrip('/'))} HTTP/1.1",
+                "accept: application/json;odata=verbose",
+                "",
+                "",
+            ])
+        lines.append(f"--{boundary}--")
+        url = f"{self.host}/{site_url}/_api/$batch"
+        retry = 0
+        while retry <= self.retry_count:
+            try:
+                digest = self.get_form_digest(site_url)
+                response = self.send(
+                    "POST",
+                    url,
+                    data="\r\n".join(lines).encode("utf-8"),
+                    headers={
+                        "content-type": f"multipart/mixed; boundary={boundary}",
+                        "X-RequestDigest": digest or "",
+                    },
+                )
+                if response.ok:
+                    return self.parse_batch_response(response, len(rel_urls))
+                if response.status_code in BATCH_UNSUPPORTED_STATUS_CODES:
+                    self.logger.warning(
+                        f"The sharepoint server does not support $batch requests, url: {url}. Error: {response.reason}"
+                    )
+                    self.batch_supported = False
+                    return None
+                if response.status_code == 400:
+                    self.logger.warning(
+                        f"The sharepoint server rejected a batch request, its requests are sent one by one, url: {url}. "
+                        f"Error: {response.reason}"
+                    )
+                    return None
+                if response.status_code == 403:
+                    # The request digest may have been invalidated before its expiration time
+                    self.digests.pop(site_url, None)
+                self.logger.error(
+                    f"Error while sending a batch request to the sharepoint, url: {url}. Retry Count: {retry}. Error: {response.reason}"
+                )
+            except BatchResponseException as exception:
+                self.logger.warning(
+                    f"Error while reading a batch response from the sharepoint, its requests are sent one by one, url: {url}. "
+                    f"Error: {exception}"
+                )
+                return None
+            except RequestException as exception:
+                self.logger.exception(
+                    f"Error while sending a batch request to the sharepoint, url: {url}. Retry Count: {retry}. Error: {exception}"
+                )
+            # This condition is to avoid sleeping for the last time
+            if retry < self.retry_count:
+                time.sleep(backoff(retry))
+            retry += 1
+        return None
+
+    @staticmethod
+    def parse_batch_response(response, expected_count=None):
+        """ Splits a multipart $batch response into the responses of its sub-requests
+            :param response: response of the $batch request
+            :param expected_count: number of sub-requests of the $batch request, checked if given
+            Returns:
+                List of responses in the order of the sub-requests
+            Raises:
+                BatchResponseException: if the number of responses differs from the number of sub-requests"""
+        match = re.search(r"boundary=([^;\s]+)", response.headers.get("content-type", ""))
+        if match is None:
+            raise BatchResponseException(expected_count, 0)
+        boundary = match.group(1).strip('"')
+        responses = []
+        for part in response.text.split(f"--{boundary}")[1:]:
+            if part.startswith("--"):
+                break
+            # Each part holds its MIME headers, then the HTTP status line, headers and body of the sub-request
+            _, _, http_message = part.replace("\r\n", "\n").strip().partition("\n\n")
+            head, _, body = http_message.partition("\n\n")
+            status_line, *header_lines = head.split("\n")
+            _, status_code, reason = (status_line.split(" ", 2) + [""])[:3]
+            sub_response = requests.Response()
+            sub_response.status_code = int(status_code)
+            sub_response.reason = reason
+            for header_line in header_lines:
+                name, _, value = header_line.partition(":")
+                sub_response.headers[name.strip()] = value.strip()
+            sub_response.encoding = "utf-8"
+            sub_response._content = body.strip().encode("utf-8")
+            responses.append(sub_response)
+        if expected_count is not None and len(responses) != expected_count:
+            raise BatchResponseException(expected_count, len(responses))
+        return responses
 
     @staticmethod
     def get_query(start_time, end_time, param_name):
@@ -117,7 +694,7 @@ class SharePoint:
         if param_name == "sites":
             query = f"?$filter=(LastItemModifiedDate ge datetime'{start_time}') and (LastItemModifiedDate le datetime'{end_time}')"
         elif param_name == "lists":
-            query = f"?$expand=RootFolder&$filter=(LastItemModifiedDate ge datetime'{start_time}') and (LastItemModifiedDate le datetime'{end_time}') and (Hidden eq false)"
+            query = f"&$filter=(LastItemModifiedDate ge datetime'{start_time}') and (LastItemModifiedDate le datetime'{end_time}') and (Hidden eq false)"
         else:
             query = f"&$filter=(Modified ge datetime'{start_time}') and (Modified le datetime'{end_time}')"
         return query
@@ -3,77 +3,301 @@
 # or more contributor license agreements. Licensed under the Elastic License 2.0;
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
+import json
+import os
 import threading
+import time
+from datetime import datetime
+
+from elastic_enterprise_search import ConnectionError as TransportConnectionError
+from elastic_enterprise_search import ConnectionTimeout
 
 from .checkpointing import Checkpoint
-from .utils import split_documents_into_equal_chunks
+from .document import as_dict, serialize_document
+from .rate_limiter import backoff
 
+# Maximum number of documents accepted by a single indexing request
 BATCH_SIZE = 100
 CONNECTION_TIMEOUT = 1000
+# Batches taking longer than this number of seconds to be indexed shrink the following ones
+SLOW_BATCH_SECONDS = 30
+# Share of the configured payload size added to the byte limit after each fast batch
+BYTES_INCREASE_FACTOR = 0.1
+DOCUMENTS_INCREASE = 10
+MIN_BATCH_BYTES = 64 * 1024
+# Status codes of the indexing requests that may succeed when sent again
+TRANSIENT_STATUS_CODES = [408, 429, 500, 502, 503, 504]
+# Parts of the errors of the documents that may be indexed when sent again, such as an overloaded
+# server or a concurrent update of the document, the other errors being reported for good
+TRANSIENT_DOCUMENT_ERRORS = [
+    "internal", "unavailable", "timeout", "timed out", "too many requests", "rate limit", "rejected",
+    "version conflict", "version_conflict", "try again",
+]
+DEAD_LETTER_PATH = os.path.join(os.path.dirname(__file__), "dead_letter.jsonl")
+
+
+def get_status_code(exception):
+    """Returns the HTTP status code of an error raised by the Enterprise Search client, if any
+    :param exception: error raised while indexing
+    """
+    meta = getattr(exception, "meta", None)
+    return getattr(meta, "status", None) or getattr(exception, "status", None)
+
+
+def is_transient(exception):
+    """Returns whether an error raised while indexing may not happen again, such as a lost connection,
+    a timeout or an overloaded server
+    :param exception: error raised while indexing
+    """
+    status_code = get_status_code(exception)
+    if status_code is None:
+        return isinstance(exception, (TransportConnectionError, ConnectionTimeout))
+    return status_code in TRANSIENT_STATUS_CODES
+
+
+def is_transient_document_error(errors):
+    """Returns whether the errors of a document rejected by the Enterprise Search may not happen again
+    :param errors: errors of the document, either messages or objects holding a status code and a type
+    """
+    for error in errors:
+        if isinstance(error, dict):
+            if error.get("status") in TRANSIENT_STATUS_CODES + [409]:
+                return True
+            error = f"{error.get('type', '')} {error.get('reason') or error.get('message') or ''}"
+        if any(part in str(error).lower() for part in TRANSIENT_DOCUMENT_ERRORS):
+            return True
+    return False
+
+
+class BatchSizer:
+    """This class adapts the number of documents and of bytes of the indexing batches to the response
+    time of Enterprise Search. The limits grow additively while the batches are indexed promptly, and
+    they are halved when a batch is slow, times out or is rejected as too large."""
+
+    def __init__(self, max_bytes):
+        self.configured_max_bytes = max_bytes
+        self.max_bytes = max_bytes
+        self.max_documents = BATCH_SIZE
+        self.lock = threading.Lock()
+
+    def is_full(self, documents_count, bytes_count, document_size):
+        """Returns whether a batch must be sent before a document is added to it
+        :param documents_count: number of documents in the batch
+        :param bytes_count: size of the documents of the batch
+        :param document_size: size of the document to be added
+        """
+        return documents_count > 0 and (
+            documents_count >= self.max_documents or bytes_count + document_size > self.max_bytes
+        )
+
+    def observe(self, seconds):
+        """Adjusts the limits to the time taken by a batch to be indexed
+        :param seconds: number of seconds the indexing request took
+        """
+        if seconds > SLOW_BATCH_SECONDS:
+            self.shrink()
+            return
+        with self.lock:
+            self.max_documents = min(BATCH_SIZE, self.max_documents + DOCUMENTS_INCREASE)
+            self.max_bytes = min(
+                self.configured_max_bytes, self.max_bytes + int(self.configured_max_bytes * BYTES_INCREASE_FACTOR)
+            )
+
+    def shrink(self, bytes_count=None):
+        """Halves the limits, or the size of a batch that was rejected as too large if it is smaller
+        :param bytes_count: size of the documents of the rejected batch
+        """
+        with self.lock:
+            self.max_documents = max(1, self.max_documents // 2)
+            self.max_bytes = max(MIN_BATCH_BYTES, min(self.max_bytes, bytes_count or self.max_bytes) // 2)
 
 
 class SyncEnterpriseSearch:
     """This class allows ingesting documents to Elastic Enterprise Search."""
 
-    def __init__(self, config, logger, workplace_search_custom_client, queue):
+    def __init__(self, config, logger, workplace_search_custom_client, queue, fingerprint_storage=None):
         self.config = config
         self.logger = logger
         self.workplace_search_custom_client = workplace_search_custom_client
         self.queue = queue
+        self.fingerprint_storage = fingerprint_storage
+        self.checkpoints = []
+        self.batch_sizer = BatchSizer(int(config.get_value("max_batch_payload_size")) * 1024 * 1024)
+        self.retry_count = int(config.get_value("retry_count"))
+        self.dead_letter_path = DEAD_LETTER_PATH
+        self.stats_lock = threading.Lock()
+        self.stats = {"indexed": 0, "retried": 0, "dead_lettered": 0}
+        self.start_time = time.time()
 
-    def index_documents(self, documents):
-        """This method indexes the documents to the Enterprise Search.
+    def index_documents(self, documents, serialized_documents=None):
+        """This method indexes the documents to the Enterprise Search. The body of the request is
+        made of the JSON of the documents, which is not serialized again by the client.
         :param documents: documents to be indexed
+        :param serialized_documents: JSON of the documents, if already serialized
+        Returns:
+            List of the documents that could not be indexed, along with their errors
         """
-        total_documents_indexed = 0
+        failed_documents = []
         if documents:
+            if serialized_documents is None:
+                serialized_documents = [serialize_document(document) for document in documents]
             responses = self.workplace_search_custom_client.index_documents(
-                documents=documents,
+                documents=f"[{','.join(serialized_documents)}]",
                 timeout=CONNECTION_TIMEOUT,
             )
+            documents_by_id = {document["id"]: document for document in documents}
             for response in responses["results"]:
-                if not response["errors"]:
-                    total_documents_indexed += 1
-                else:
+                if response["errors"]:
+                    failed_documents.append((documents_by_id[response["id"]], response["errors"]))
+            self.logger.info(
+                f"[{threading.get_ident()}] Successfully indexed {len(documents) - len(failed_documents)} documents "
+                "to the workplace"
+            )
+        return failed_documents
+
+    def index_batch(self, documents, serialized_documents):
+        """Indexes a batch of documents and adjusts the size of the following batches to the outcome.
+        A batch rejected as too large is split in two halves, indexed one after the other. Transient
+        errors are retried with an exponential backoff, only the documents that failed with such errors
+        being sent again, and the documents still failing afterwards are written to the dead letter file
+        along with the documents rejected for good.
+        :param documents: documents to be indexed
+        :param serialized_documents: JSON of the documents
+        """
+        retry = 0
+        while True:
+            start_time = time.time()
+            try:
+                failed_documents = self.index_documents(documents, serialized_documents)
+            except Exception as exception:
+                if get_status_code(exception) == 413 and len(documents) > 1:
+                    bytes_count = sum(map(len, serialized_documents))
+                    self.logger.warning(
+                        f"The batch of {len(documents)} documents and {bytes_count} bytes is too large, splitting it"
+                    )
+                    self.batch_sizer.shrink(bytes_count)
+                    half = len(documents) // 2
+                    self.index_batch(documents[:half], serialized_documents[:half])
+                    self.index_batch(documents[half:], serialized_documents[half:])
+                    return
+                if isinstance(exception, ConnectionTimeout):
+                    self.batch_sizer.shrink()
+                if not is_transient(exception) or retry >= self.retry_count:
                     self.logger.error(
-                        "Error while indexing %s. Error: %s"
-                        % (response["id"], response["errors"])
+                        f"Error while indexing the documents to the Enterprise Search. Error {exception}"
                     )
-            self.logger.info(
-                f"[{threading.get_ident()}] Successfully indexed {total_documents_indexed} documents to the workplace"
+                    self.dead_letter([(document, [str(exception)]) for document in documents])
+                    return
+                self.logger.warning(
+                    f"Error while indexing the documents to the Enterprise Search. Retry Count: {retry}. Error {exception}"
+                )
+            else:
+                self.batch_sizer.observe(time.time() - start_time)
+                self.update_stats(indexed=len(documents) - len(failed_documents))
+                if self.fingerprint_storage:
+                    failed_ids = {document["id"] for document, _ in failed_documents}
+                    self.fingerprint_storage.commit(
+                        [document["id"] for document in documents if document["id"] not in failed_ids]
+                    )
+                if retry < self.retry_count:
+                    rejected_documents = [
+                        (document, errors) for document, errors in failed_documents
+                        if not is_transient_document_error(errors)
+                    ]
+                else:
+                    rejected_documents = failed_documents
+                for document, errors in rejected_documents:
+                    self.logger.error("Error while indexing %s. Error: %s" % (document["id"], errors))
+                if rejected_documents:
+                    self.dead_letter(rejected_documents)
+                if len(rejected_documents) == len(failed_documents):
+                    return
+                rejected_ids = {document["id"] for document, _ in rejected_documents}
+                failed_ids = {document["id"] for document, _ in failed_documents} - rejected_ids
+                serialized_documents = [
+                    serialized for document, serialized in zip(documents, serialized_documents)
+                    if document["id"] in failed_ids
+                ]
+                documents = [document for document in documents if document["id"] in failed_ids]
+            self.update_stats(retried=len(documents))
+            time.sleep(backoff(retry))
+            retry += 1
+
+    def dead_letter(self, failed_documents):
+        """Appends the documents that could not be indexed to the dead letter file, one json object per line
+        :param failed_documents: list of documents along with their errors
+        """
+        failed_at = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        lines = [
+            json.dumps(
+                {"id": document.get("id"), "errors": errors, "failed_at": failed_at, "document": as_dict(document)},
+                default=str,
             )
+            for document, errors in failed_documents
+        ]
+        with self.stats_lock:
+            self.stats["dead_lettered"] += len(failed_documents)
+            try:
+                with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter_file:
+                    dead_letter_file.writelines(f"{line}\n" for line in lines)
+            except OSError as exception:
+                self.logger.exception(f"Error while writing to the dead letter file. Error {exception}")
+
+    def update_stats(self, indexed=0, retried=0):
+        """Counts the documents indexed and the documents sent again"""
+        with self.stats_lock:
+            self.stats["indexed"] += indexed
+            self.stats["retried"] += retried
+
+    def get_stats(self):
+        """Returns the number of documents indexed, sent again and written to the dead letter file, along with
+        the number of documents indexed per second and the share of documents that could not be indexed"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        seconds = time.time() - self.start_time
+        processed = stats["indexed"] + stats["dead_lettered"]
+        stats["documents_per_second"] = round(stats["indexed"] / seconds, 1) if seconds else 0
+        stats["error_rate"] = round(stats["dead_lettered"] / processed, 4) if processed else 0
+        return stats
 
     def perform_sync(self):
-        """Pull documents from the queue and synchronize it to the Enterprise Search."""
-        try:
-            checkpoint = Checkpoint(self.config, self.logger)
-            signal_open = True
-            while signal_open:
-                documents_to_index = []
-                while len(documents_to_index) < BATCH_SIZE:
-                    documents = self.queue.get()
-                    if documents.get("type") == "signal_close":
-                        self.logger.info(
-                            f"Found an end signal in the queue. Closing Thread ID {threading.get_ident()}"
-                        )
-                        signal_open = False
-                        break
-                    elif documents.get("type") == "checkpoint":
-                        checkpoint.set_checkpoint(
-                            documents.get("data")[0],
-                            documents.get("data")[1],
-                            documents.get("data")[2],
-                        )
-                        break
-                    else:
-                        documents_to_index.extend(documents.get("data"))
-                # This loop is to ensure if the last document fetched from the queue exceeds the size of
-                # documents_to_index to more than the permitted chunk size, then we split the documents as per the limit
-                for chunk in split_documents_into_equal_chunks(
-                    documents_to_index, BATCH_SIZE
-                ):
-                    self.index_documents(chunk)
-        except Exception as exception:
-            self.logger.error(
-                f"Error while indexing the documents to the Enterprise Search. Error {exception}"
-            )
+        """Pull documents from the queue and synchronize it to the Enterprise Search.
+        Documents are sent in batches limited both in number of documents and in bytes, the limits
+        being adapted to the response time of Enterprise Search.
+        Checkpoints found in the queue are only collected here, they are saved by set_checkpoints
+        once every consumer thread has finished indexing the documents queued before them."""
+        documents_to_index, serialized_documents, bytes_count = [], [], 0
+        while True:
+            documents = self.queue.get()
+            if documents.get("type") == "signal_close":
+                self.logger.info(
+                    f"Found an end signal in the queue. Closing Thread ID {threading.get_ident()}"
+                )
+                break
+            elif documents.get("type") == "checkpoint":
+                self.checkpoints.append(documents.get("data"))
+                continue
+            # The queue is bounded, so the thread must keep draining it whatever happens to a batch
+            try:
+                for document in documents.get("data"):
+                    serialized = serialize_document(document)
+                    if self.batch_sizer.is_full(len(documents_to_index), bytes_count, len(serialized)):
+                        self.index_batch(documents_to_index, serialized_documents)
+                        documents_to_index, serialized_documents, bytes_count = [], [], 0
+                    documents_to_index.append(document)
+                    serialized_documents.append(serialized)
+                    bytes_count += len(serialized)
+            except Exception as exception:
+                self.logger.exception(f"Error while indexing the documents to the Enterprise Search. Error {exception}")
+                self.dead_letter([(document, [str(exception)]) for document in documents_to_index])
+                documents_to_index, serialized_documents, bytes_count = [], [], 0
+        if documents_to_index:
+            self.index_batch(documents_to_index, serialized_documents)
+
+    def set_checkpoints(self):
+        """Saves the checkpoints collected from the queue by the consumer threads."""
+        checkpoint = Checkpoint(self.config, self.logger)
+        for collection, checkpoint_time, indexing_type, change_token in self.checkpoints:
+            checkpoint.set_checkpoint(collection, checkpoint_time, indexing_type)
+            if change_token:
+                checkpoint.set_change_token(collection, change_token)
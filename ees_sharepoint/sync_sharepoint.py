@@ -6,19 +6,25 @@
 """sync_sharepoint module allows to sync data to Elastic Enterprise Search.
 
 It's possible to run full syncs and incremental syncs with this module."""
+import json
+import math
 import os
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 
 from dateutil.parser import parse
-from tika.tika import TikaException
 
-from . import adapter
+from . import adapter, async_engine
 from .checkpointing import Checkpoint
+from .connector_queue import BATCH_SIZE
+from .document import DocumentSchema
+from .sharepoint_client import PageFetchException
 from .usergroup_permissions import Permissions
-from .utils import encode, extract, split_documents_into_equal_chunks, split_list_into_buckets
+from .utils import encode, split_documents_into_equal_chunks, split_list_into_buckets
 
 IDS_PATH = os.path.join(os.path.dirname(__file__), "doc_id.json")
+SITE_TREE_PATH = os.path.join(os.path.dirname(__file__), "site_tree.json")
 
 SITE = "site"
 LIST = "list"
@@ -27,6 +33,36 @@ SITES = "sites"
 LISTS = "lists"
 LIST_ITEMS = "list_items"
 DRIVE_ITEMS = "drive_items"
+# Lists with more items are split into ranges of item Ids fetched by separate threads
+PARTITION_SIZE = 5000
+# Change types of the change log for objects that were deleted or moved away
+DELETE_CHANGE_TYPES = [3, 5]
+# Change types of the change log for lists that were added, moved into the site or restored, whose
+# items are all fetched as their modification dates may precede the sync
+CRAWLED_LIST_CHANGE_TYPES = [1, 6, 7]
+# Maximum number of ids of objects reported by the change log fetched by a single request
+CHANGED_IDS_BATCH_SIZE = 50
+# Fields read by the connector on top of the ones of the documents, for their ids, urls and permissions
+REQUIRED_FIELDS = {
+    SITES: ["Id", "ServerRelativeUrl", "LastItemModifiedDate", "Created"],
+    LISTS: [
+        "Id", "BaseType", "ParentWebUrl", "Title", "LastItemModifiedDate", "ItemCount", "HasUniqueRoleAssignments",
+        "RootFolder/ServerRelativeUrl",
+    ],
+    LIST_ITEMS: [
+        "GUID", "Id", "Modified", "FileRef", "FileDirRef", "HasUniqueRoleAssignments", "Attachments", "AttachmentFiles",
+    ],
+    DRIVE_ITEMS: [
+        "GUID", "Id", "ID", "Modified", "FileDirRef", "HasUniqueRoleAssignments", "File/TimeLastModified",
+        "File/ServerRelativeUrl", "File/UniqueId", "File/ETag", "Folder",
+    ],
+}
+# Properties holding objects or collections, which are only returned when they are expanded
+EXPANDED_FIELDS = {
+    LISTS: ["RootFolder"],
+    LIST_ITEMS: ["AttachmentFiles"],
+    DRIVE_ITEMS: ["File", "Folder"],
+}
 
 
 def get_results(logger, response, entity_name):
@@ -46,6 +82,33 @@ def get_results(logger, response, entity_name):
     return response.get("d", {}).get("results")
 
 
+def load_site_tree(logger):
+    """Loads the site trees of the collections cached by the previous syncs
+    Returns:
+        dictionary of collection and site tree, the site tree being a dictionary of site path and
+        its last updated time and subsites
+    """
+    try:
+        with open(SITE_TREE_PATH, encoding="utf-8") as site_tree_file:
+            return json.load(site_tree_file)
+    except FileNotFoundError:
+        logger.debug("Site tree cache was not found.")
+    except ValueError as exception:
+        logger.exception(f"Error while parsing the site tree cache from path: {SITE_TREE_PATH}. Error: {exception}")
+    return {}
+
+
+def save_site_tree(logger, collection, tree):
+    """Caches the site tree of a collection for the next syncs
+    :param collection: SharePoint server Collection name
+    :param tree: dictionary of site path and its last updated time and subsites
+    """
+    site_trees = load_site_tree(logger)
+    site_trees[collection] = tree
+    with open(SITE_TREE_PATH, "w", encoding="utf-8") as site_tree_file:
+        json.dump(site_trees, site_tree_file)
+
+
 class SyncSharepoint:
     """This class allows syncing objects from the SharePoint Server."""
 
@@ -58,11 +121,14 @@ class SyncSharepoint:
             start_time,
             end_time,
             queue,
+            extractor,
+            fingerprint_storage=None,
     ):
         self.config = config
         self.logger = logger
         self.workplace_search_custom_client = workplace_search_custom_client
         self.sharepoint_client = sharepoint_client
+        self.fingerprint_storage = fingerprint_storage
 
         self.ws_source = config.get_value("workplace_search.source_id")
         self.objects = config.get_value("objects")
@@ -73,11 +139,16 @@ class SyncSharepoint:
         self.sharepoint_thread_count = config.get_value("sharepoint_sync_thread_count")
         self.mapping_sheet_path = config.get_value("sharepoint_workplace_user_mapping")
         self.sharepoint_host = config.get_value("sharepoint.host_url")
+        self.max_file_size = config.get_value("max_file_size") * 1024 * 1024
+        self.file_size_policy = config.get_value("file_size_policy")
         self.checkpoint = Checkpoint(config, logger)
         self.permissions = Permissions(
             self.sharepoint_client, self.workplace_search_custom_client, logger
         )
         self.queue = queue
+        self.extractor = extractor
+        self.permissions_cache = {}
+        self.document_schemas = {}
 
     def get_schema_fields(self, document_name):
         """returns the schema of all the include_fields or exclude_fields specified in the configuration file.
@@ -106,67 +177,135 @@ class SyncSharepoint:
             adapter_schema["id"] = field_id
         return adapter_schema
 
-    def fetch_sites(self, parent_site_url, sites, ids, index, start_time, end_time):
-        """This method fetches sites from a collection and invokes the
-        index permission method to get the document level permissions.
-        If the fetching is not successful, it logs proper message.
+    def get_document_schema(self, document_name):
+        """Returns the layout of the fields of the documents of an object type, computed once per sync
+        :param document_name: document name from SITES, LISTS, LIST_ITEMS OR DRIVE_ITEMS
+        """
+        if document_name not in self.document_schemas:
+            self.document_schemas[document_name] = DocumentSchema(self.get_schema_fields(document_name))
+        return self.document_schemas[document_name]
+
+    def get_select_query(self, document_name):
+        """Returns the $select and $expand clauses fetching the fields of the documents of an object type
+        along with the fields the connector reads, rather than all the columns of the objects
+        :param document_name: document name from SITES, LISTS, LIST_ITEMS OR DRIVE_ITEMS
+        """
+        fields = self.get_document_schema(document_name).response_fields
+        if document_name == DRIVE_ITEMS:
+            # The fields of the drive item documents are taken from the file or folder of the items, the
+            # id being taken from the item itself
+            field_id = adapter.DEFAULT_SCHEMA[DRIVE_ITEMS]["id"]
+            fields = tuple(f"File/{field}" for field in fields if field != field_id)
+        query = "$select=" + ",".join(dict.fromkeys(fields + tuple(REQUIRED_FIELDS[document_name])))
+        if document_name in EXPANDED_FIELDS:
+            query += "&$expand=" + ",".join(EXPANDED_FIELDS[document_name])
+        return query
+
+    def discover_sites(self, collection, thread_count, ids):
+        """Walks the site tree of a collection breadth first, the subsites of all the sites of a level being
+        fetched concurrently by thread_count threads, and indexes the sites modified in the sync time range.
+        The subsites of every site are fetched along with their current LastItemModifiedDate, as the date of
+        a site does not change when one of its subsites does. The site tree is cached in the site tree file,
+        and the cached subsites of a site are only used when its subsites can not be fetched.
+        :param collection: SharePoint server Collection name
+        :param thread_count: Thread count
+        :param ids: structure containing id's of all objects
+        Returns:
+            sites: dictionary of site path and it's last updated time, for all the subsites of the collection
+        """
+        cached_tree = load_site_tree(self.logger).get(collection, {})
+        root_url = f"/sites/{collection}"
+        tree = {root_url: {"modified": None, "children": []}}
+        level = [root_url]
+        with ThreadPoolExecutor(max_workers=thread_count) as executor:
+            while level:
+                next_level = []
+                for parent_url, subsites in zip(level, executor.map(self.fetch_subsites, level, [ids] * len(level))):
+                    if subsites is None:
+                        subsites = {
+                            site_url: cached_tree[site_url]["modified"]
+                            for site_url in cached_tree.get(parent_url, {}).get("children", [])
+                            if site_url in cached_tree
+                        }
+                        self.logger.warning(
+                            f"Taking the {len(subsites)} subsites of {parent_url} from the cached site tree, "
+                            "the changes of these subsites since the previous sync may be missed"
+                        )
+                    for site_url, modified in subsites.items():
+                        if site_url in tree:
+                            continue
+                        tree[parent_url]["children"].append(site_url)
+                        tree[site_url] = {"modified": modified, "children": []}
+                        next_level.append(site_url)
+                level = next_level
+        save_site_tree(self.logger, collection, tree)
+        return {site_url: site["modified"] for site_url, site in tree.items() if site_url != root_url}
+
+    def fetch_subsites(self, parent_site_url, ids):
+        """This method fetches the subsites of a site, and indexes the ones modified in the sync time range
+        along with their document level permissions.
         :param parent_site_url: parent site relative path
-        :param sites: dictionary of site path and it's last updated time
         :param ids: structure containing id's of all objects
-        :param index: index, boolean value
-        :param start_time: start time for fetching the data
-        :param end_time: end time for fetching the data
         Returns:
-            sites: list of site paths
-            documents: response of sharepoint GET call with fields specified in the schema
+            sites: dictionary of site path and it's last updated time, None if the subsites could not be fetched
         """
         rel_url = f"{parent_site_url}/_api/web/webs"
         self.logger.info("Fetching the sites detail from url: %s" % (rel_url))
-        query = self.sharepoint_client.get_query(start_time, end_time, SITES)
-        response = self.sharepoint_client.get(rel_url, query, SITES)
-        document_list = []
-
+        response = self.sharepoint_client.get(rel_url, f"?{self.get_select_query(SITES)}", SITES)
+        # A failed page yields None rather than an empty list, so that it is not mistaken for a site without subsites
         response_data = get_results(self.logger, response, SITES)
-        if not response_data:
-            self.logger.info(
-                "No sites were created in %s for this interval: start time: %s and end time: %s"
-                % (parent_site_url, start_time, end_time)
-            )
-            return sites, []
+        if response_data is None:
+            self.logger.error(f"Could not fetch the subsites of {parent_site_url}")
+            return None
         self.logger.info(
             "Successfully fetched and parsed %s sites response from SharePoint"
             % len(response_data)
         )
-        schema = self.get_schema_fields(SITES)
-
-        if index:
-            for i, _ in enumerate(response_data):
-                doc = {"type": SITE}
-                # need to convert date to iso else workplace search throws error on date format Invalid field
-                # value: Value '2021-09-29T08:13:00' cannot be parsed as a date (RFC 3339)"]}
-                response_data[i]["Created"] += "Z"
-                for field, response_field in schema.items():
-                    doc[field] = response_data[i].get(response_field)
-                if self.enable_permission is True:
-                    doc["_allow_permissions"] = self.fetch_permissions(
-                        key=SITES, site=response_data[i]["ServerRelativeUrl"]
-                    )
-                document_list.append(doc)
-                ids["sites"].update({doc["id"]: response_data[i]["ServerRelativeUrl"]})
-        for result in response_data:
-            site_server_url = result.get("ServerRelativeUrl")
-            sites.update({site_server_url: result.get("LastItemModifiedDate")})
-            _, documents = self.fetch_sites(site_server_url, sites, ids, index, start_time, end_time)
-            document_list.extend(documents)
-        return sites, document_list
-
-    def fetch_lists(self, sites, ids, index):
+        sites = {result.get("ServerRelativeUrl"): result.get("LastItemModifiedDate") for result in response_data}
+        if SITES not in self.objects:
+            return sites
+        schema = self.get_document_schema(SITES)
+        document_list = [
+            self.get_site_document(result, schema, ids)
+            for result in response_data
+            if parse(self.start_time) <= parse(result["LastItemModifiedDate"]) <= parse(self.end_time)
+        ]
+        if document_list:
+            self.append_to_queue(SITES, document_list)
+            self.logger.debug(
+                f"Thread ID {threading.get_ident()} added list of {len(document_list)} sites into the queue"
+            )
+        return sites
+
+    def get_site_document(self, result, schema, ids):
+        """Builds the document of a site and stores its id
+        :param result: site fetched from sharepoint
+        :param schema: schema of the site documents
+        :param ids: structure containing id's of all objects
+        Returns:
+            doc: site document with fields specified in the schema
+        """
+        # need to convert date to iso else workplace search throws error on date format Invalid field
+        # value: Value '2021-09-29T08:13:00' cannot be parsed as a date (RFC 3339)"]}
+        result["Created"] += "Z"
+        doc = schema.new_document(SITE, result)
+        if self.enable_permission is True:
+            doc["_allow_permissions"] = self.fetch_permissions(
+                key=SITES, site=result["ServerRelativeUrl"]
+            )
+            self.cache_permissions((SITES, result["ServerRelativeUrl"]), doc["_allow_permissions"])
+        ids["sites"].update({doc["id"]: result["ServerRelativeUrl"]})
+        return doc
+
+    def fetch_lists(self, sites, ids, index, list_ids=None):
         """This method fetches lists from all sites in a collection and invokes the
         index permission method to get the document level permissions.
         If the fetching is not successful, it logs proper message.
         :param sites: dictionary of site path and it's last updated time
         :param ids: structure containing id's of all objects
         :param index: index, boolean value
+        :param list_ids: ids of the lists to be fetched whatever their modification date, instead of
+            the lists modified in the sync time range
         Returns:
             document: response of sharepoint GET call, with fields specified in the schema
         """
@@ -179,19 +318,24 @@ class SyncSharepoint:
                 % (self.start_time, self.end_time)
             )
             return [], [], {}
-        schema_list = self.get_schema_fields(LISTS)
+        schema_list = self.get_document_schema(LISTS)
         for site_details in sites:
             for site, time_modified in site_details.items():
                 if parse(self.start_time) > parse(time_modified):
                     continue
-                rel_url = f"{site}/_api/web/lists"
+                rel_url = f"{site}/_api/web/lists?{self.get_select_query(LISTS)}"
                 self.logger.info(
                     "Fetching the lists for site: %s from url: %s" % (site, rel_url)
                 )
 
-                query = self.sharepoint_client.get_query(
-                    self.start_time, self.end_time, LISTS
-                )
+                if list_ids is None:
+                    query = self.sharepoint_client.get_query(
+                        self.start_time, self.end_time, LISTS
+                    )
+                else:
+                    query = "&$filter=(Hidden eq false) and (%s)" % " or ".join(
+                        f"(Id eq guid'{list_id}')" for list_id in list_ids
+                    )
                 response = self.sharepoint_client.get(rel_url, query, LISTS)
 
                 response_data = get_results(self.logger, response, LISTS)
@@ -210,9 +354,7 @@ class SyncSharepoint:
                     if not ids["lists"].get(site):
                         ids["lists"].update({site: {}})
                     for i, _ in enumerate(response_data):
-                        doc = {"type": LIST}
-                        for field, response_field in schema_list.items():
-                            doc[field] = response_data[i].get(response_field)
+                        doc = schema_list.new_document(LIST, response_data[i])
                         relative_url = response_data[i]["RootFolder"].get('ServerRelativeUrl')
                         if self.enable_permission is True:
                             doc["_allow_permissions"] = self.fetch_permissions(
@@ -221,7 +363,10 @@ class SyncSharepoint:
                                 list_id=doc["id"],
                                 list_url=response_data[i]["ParentWebUrl"],
                                 itemid=None,
+                                parent=self.get_parent(response_data[i], (SITES, response_data[i]["ParentWebUrl"])),
                             )
+                            # Items stored at the root of the list inherit the permissions of the list
+                            self.cache_permissions((LISTS, doc["id"], relative_url), doc["_allow_permissions"])
 
                         doc["url"] = urljoin(
                             self.sharepoint_host,
@@ -242,12 +387,14 @@ class SyncSharepoint:
                             result.get("ParentWebUrl"),
                             result.get("Title"),
                             result.get("LastItemModifiedDate"),
+                            result.get("ItemCount"),
                         ]
                     else:
                         lists[result.get("Id")] = [
                             result.get("ParentWebUrl"),
                             result.get("Title"),
                             result.get("LastItemModifiedDate"),
+                            result.get("ItemCount"),
                         ]
         documents = {"type": LISTS, "data": document}
         return lists, libraries, documents
@@ -255,13 +402,14 @@ class SyncSharepoint:
     def fetch_items(self, lists, ids):
         """This method fetches items from all the lists in a collection and
         invokes theindex permission method to get the document level permissions.
+        The items are fetched page by page, so that the documents of a page can be
+        indexed before the next page is fetched.
         If the fetching is not successful, it logs proper message.
         :param lists: document lists
         :param ids: structure containing id's of all objects
-        Returns:
-            document: response of sharepoint GET call, with fields specified in the schema
+        Yields:
+            document: page of sharepoint GET call responses, with fields specified in the schema
         """
-        responses = []
         #  here value is a list of url and title
         self.logger.info("Fetching all the items for the lists")
         if not lists:
@@ -269,105 +417,157 @@ class SyncSharepoint:
                 "No item was created in this interval: start time: %s and end time: %s"
                 % (self.start_time, self.end_time)
             )
-        else:
-            for value in lists.values():
-                if not ids["list_items"].get(value[0]):
-                    ids["list_items"].update({value[0]: {}})
-            schema_item = self.get_schema_fields(LIST_ITEMS)
-            for list_content, value in lists.items():
-                if parse(self.start_time) > parse(value[2]):
-                    continue
-                rel_url = f"{value[0]}/_api/web/lists(guid'{list_content}')/items?$select=*,FileRef"
-                self.logger.info(
-                    "Fetching the items for list: %s from url: %s" % (value[1], rel_url)
-                )
-
-                query = self.sharepoint_client.get_query(
-                    self.start_time, self.end_time, LIST_ITEMS
-                )
-                response = self.sharepoint_client.get(rel_url, query, LIST_ITEMS)
-
-                response_data = get_results(self.logger, response, LIST_ITEMS)
-                if not response_data:
+            return
+        for value in lists.values():
+            ids["list_items"].setdefault(value[0], {})
+        schema_item = self.get_document_schema(LIST_ITEMS)
+        for list_content, value in lists.items():
+            if parse(self.start_time) > parse(value[2]):
+                continue
+            rel_url, query = self.get_items_request(LIST_ITEMS, list_content, value, ids)
+            self.logger.info(
+                "Fetching the items for list: %s from url: %s" % (value[1], rel_url)
+            )
+            total_items = 0
+            try:
+                for response_data in self.sharepoint_client.get_pages(rel_url, query, LIST_ITEMS):
+                    if not response_data:
+                        continue
+                    total_items += len(response_data)
                     self.logger.info(
-                        "No item was created for the list %s in this interval: start time: %s and end time: %s"
-                        % (value[1], self.start_time, self.end_time)
+                        "Successfully fetched and parsed %s listitem response for list: %s from SharePoint"
+                        % (len(response_data), value[1])
                     )
-                    continue
+                    yield self.get_list_item_documents(response_data, list_content, value, ids, schema_item)
+            except PageFetchException as exception:
+                self.logger.error(f"The items of the list {value[1]} could not all be fetched. Error: {exception}")
+                continue
+            if not total_items:
                 self.logger.info(
-                    "Successfully fetched and parsed %s listitem response for list: %s from SharePoint"
-                    % (len(response_data), value[1])
+                    "No item was created for the list %s in this interval: start time: %s and end time: %s"
+                    % (value[1], self.start_time, self.end_time)
                 )
 
-                document = []
-                if not ids["list_items"][value[0]].get(list_content):
-                    ids["list_items"][value[0]].update({list_content: []})
-                rel_url = f"{value[0]}/_api/web/lists(guid'{list_content}')/items?$select=Attachments,AttachmentFiles,Title&$expand=AttachmentFiles"
+    def get_items_request(self, key, list_id, value, ids):
+        """Returns the url and query fetching the items of a list modified in the sync time range or reported
+        by the change log, and prepares the set of the ids of its items
+        :param key: LIST_ITEMS or DRIVE_ITEMS
+        :param list_id: list guid
+        :param value: list path, name, last modified date, item count and either the range of item Ids of the
+            list, or the Ids of the items reported by the change log, None standing for all its items
+        :param ids: structure containing id's of all objects
+        Returns:
+            rel_url: relative url of the items of the list
+            query: query filtering the items
+        """
+        rel_url = f"{value[0]}/_api/web/lists(guid'{list_id}')/items?{self.get_select_query(key)}"
+        if len(value) > 4 and not isinstance(value[4], tuple):
+            # The items reported by the change log are fetched by id, whatever their modification date
+            query = self.get_item_ids_filter(value[4])
+        else:
+            query = self.sharepoint_client.get_query(
+                self.start_time, self.end_time, key
+            ) + self.get_id_range_filter(value)
+        # Several threads may fetch ranges of items of the same list
+        ids[key].setdefault(value[0], {}).setdefault(list_id, set())
+        return rel_url, query
 
-                file_response_data = self.sharepoint_client.get(
-                    rel_url, query=query, param_name="attachment"
-                )
-                if file_response_data:
-                    file_response_data = get_results(
-                        self.logger, file_response_data.json(), "attachment"
-                    )
+    def get_list_item_documents(self, response_data, list_content, value, ids, schema_item):
+        """Builds the documents of a page of list items, along with their permissions and attachments
+        :param response_data: page of list items fetched from sharepoint
+        :param list_content: list guid
+        :param value: list path, name, last modified date and item count of the list
+        :param ids: structure containing id's of all objects
+        :param schema_item: schema of the list item documents
+        Returns:
+            document: list of documents with fields specified in the schema
+        """
+        document = []
+        item_permissions = []
+        extractions = []
+        for i, _ in enumerate(response_data):
+            doc = schema_item.new_document(ITEM, response_data[i])
+            attachment_files = response_data[i].get("AttachmentFiles", {}).get("results")
+            if response_data[i].get("Attachments") and attachment_files:
+                file_relative_url = attachment_files[0]["ServerRelativeUrl"]
+                # Attachments have no version of their own, adding or removing one updates the item
+                cache_key = None
+                if response_data[i].get("GUID") and response_data[i].get("Modified"):
+                    cache_key = f"{response_data[i]['GUID']}:{response_data[i]['Modified']}:{file_relative_url}"
+                self.fetch_file_content(value[0], file_relative_url, cache_key, doc, extractions)
+            if self.enable_permission is True:
+                item_permissions.append((
+                    doc,
+                    str(response_data[i]["Id"]),
+                    self.get_parent(response_data[i], (LISTS, list_content, response_data[i].get("FileDirRef"))),
+                ))
+            relative_url = response_data[i].get("FileRef")
 
-                for i, _ in enumerate(response_data):
-                    doc = {"type": ITEM}
-                    if response_data[i].get("Attachments") and file_response_data:
-                        for data in file_response_data:
-                            if response_data[i].get("Title") == data["Title"]:
-                                file_relative_url = data["AttachmentFiles"]["results"][
-                                    0
-                                ]["ServerRelativeUrl"]
-                                url_s = f"{value[0]}/_api/web/GetFileByServerRelativeUrl('{encode(file_relative_url)}')/$value"
-                                response = self.sharepoint_client.get(
-                                    url_s, query="", param_name="attachment"
-                                )
-                                doc["body"] = {}
-                                if response and response.ok:
-                                    try:
-                                        doc["body"] = extract(response.content)
-                                    except TikaException as exception:
-                                        self.logger.error(
-                                            "Error while extracting the contents from the attachment, Error %s"
-                                            % (exception)
-                                        )
-
-                                break
-                    for field, response_field in schema_item.items():
-                        doc[field] = response_data[i].get(response_field)
-                    if self.enable_permission is True:
-                        doc["_allow_permissions"] = self.fetch_permissions(
-                            key=LIST_ITEMS,
-                            list_id=list_content,
-                            list_url=value[0],
-                            itemid=str(response_data[i]["Id"]),
-                        )
-                    relative_url = response_data[i].get("FileRef")
+            doc["url"] = urljoin(self.sharepoint_host, relative_url)
 
-                    doc["url"] = urljoin(self.sharepoint_host, relative_url)
+            document.append(doc)
+            ids["list_items"][value[0]][list_content].add(response_data[i].get("GUID"))
+        self.fetch_items_permissions(LIST_ITEMS, value[0], list_content, item_permissions)
+        self.set_extracted_bodies(extractions)
+        return document
 
-                    document.append(doc)
-                    if (
-                            response_data[i].get("GUID")
-                            not in ids["list_items"][value[0]][list_content]
-                    ):
-                        ids["list_items"][value[0]][list_content].append(
-                            response_data[i].get("GUID")
-                        )
-                responses.extend(document)
-        documents = {"type": LIST_ITEMS, "data": responses}
-        return documents
+    def get_drive_item_documents(self, response_data, lib_content, value, ids, schema_drive):
+        """Builds the documents of a page of drive items, along with their permissions and content
+        :param response_data: page of drive items fetched from sharepoint
+        :param lib_content: library guid
+        :param value: library path, name, last modified date and item count of the library
+        :param ids: structure containing id's of all objects
+        :param schema_drive: schema of the drive item documents
+        Returns:
+            document: list of documents with fields specified in the schema
+        """
+        document = []
+        item_permissions = []
+        extractions = []
+        for i, _ in enumerate(response_data):
+            # Without the verbose metadata, the File of a folder is null rather than an empty object
+            if (response_data[i]["File"] or {}).get("TimeLastModified"):
+                obj_type = "File"
+                doc = schema_drive.new_document("file", response_data[i][obj_type])
+                file_relative_url = response_data[i]["File"][
+                    "ServerRelativeUrl"
+                ]
+                # The ETag of a file changes with every new version of its content
+                cache_key = None
+                if response_data[i]["File"].get("UniqueId") and response_data[i]["File"].get("ETag"):
+                    cache_key = f"{response_data[i]['File']['UniqueId']}:{response_data[i]['File']['ETag']}"
+                self.fetch_file_content(value[0], file_relative_url, cache_key, doc, extractions)
+            else:
+                obj_type = "Folder"
+                doc = schema_drive.new_document("folder", response_data[i][obj_type])
+            doc["id"] = response_data[i].get("GUID")
+            if self.enable_permission is True:
+                item_permissions.append((
+                    doc,
+                    str(response_data[i].get("ID")),
+                    self.get_parent(response_data[i], (LISTS, lib_content, response_data[i].get("FileDirRef"))),
+                ))
+            doc["url"] = urljoin(
+                self.sharepoint_host,
+                response_data[i][obj_type]["ServerRelativeUrl"],
+            )
+            document.append(doc)
+            ids["drive_items"][value[0]][lib_content].add(doc["id"])
+        self.fetch_items_permissions(DRIVE_ITEMS, value[0], lib_content, item_permissions)
+        self.set_extracted_bodies(extractions)
+        return document
 
     def fetch_drive_items(self, libraries, ids):
         """This method fetches items from all the lists in a collection and
         invokes the index permission method to get the document level permissions.
+        The files are fetched page by page, so that the documents of a page can be
+        indexed before the next page is fetched.
         If the fetching is not successful, it logs proper message.
         :param libraries: document lists
         :param ids: structure containing id's of all objects
+        Yields:
+            document: page of sharepoint GET call responses, with fields specified in the schema
         """
-        responses = []
         #  here value is a list of url and title of the library
         self.logger.info("Fetching all the files for the library")
         if not libraries:
@@ -375,79 +575,63 @@ class SyncSharepoint:
                 "No file was created in this interval: start time: %s and end time: %s"
                 % (self.start_time, self.end_time)
             )
-        else:
-            schema_drive = self.get_schema_fields(DRIVE_ITEMS)
-            for lib_content, value in libraries.items():
-                if parse(self.start_time) > parse(value[2]):
-                    continue
-                if not ids["drive_items"].get(value[0]):
-                    ids["drive_items"].update({value[0]: {}})
-                rel_url = f"{value[0]}/_api/web/lists(guid'{lib_content}')/items?$select=Modified,Id,GUID,File,Folder&$expand=File,Folder"
-                self.logger.info(
-                    "Fetching the items for libraries: %s from url: %s"
-                    % (value[1], rel_url)
-                )
-                query = self.sharepoint_client.get_query(
-                    self.start_time, self.end_time, DRIVE_ITEMS
-                )
-                response = self.sharepoint_client.get(rel_url, query, DRIVE_ITEMS)
-                response_data = get_results(self.logger, response, DRIVE_ITEMS)
-                if not response_data:
+            return
+        schema_drive = self.get_document_schema(DRIVE_ITEMS)
+        for lib_content, value in libraries.items():
+            if parse(self.start_time) > parse(value[2]):
+                continue
+            rel_url, query = self.get_items_request(DRIVE_ITEMS, lib_content, value, ids)
+            self.logger.info(
+                "Fetching the items for libraries: %s from url: %s"
+                % (value[1], rel_url)
+            )
+            total_items = 0
+            try:
+                for response_data in self.sharepoint_client.get_pages(rel_url, query, DRIVE_ITEMS):
+                    if not response_data:
+                        continue
+                    total_items += len(response_data)
                     self.logger.info(
-                        "No item was created for the library %s in this interval: start time: %s and end time: %s"
-                        % (value[1], self.start_time, self.end_time)
+                        "Successfully fetched and parsed %s drive item response for library: %s from SharePoint"
+                        % (len(response_data), value[1])
                     )
-                    continue
+                    yield self.get_drive_item_documents(response_data, lib_content, value, ids, schema_drive)
+            except PageFetchException as exception:
+                self.logger.error(f"The items of the library {value[1]} could not all be fetched. Error: {exception}")
+                continue
+            if not total_items:
                 self.logger.info(
-                    "Successfully fetched and parsed %s drive item response for library: %s from SharePoint"
-                    % (len(response_data), value[1])
+                    "No item was created for the library %s in this interval: start time: %s and end time: %s"
+                    % (value[1], self.start_time, self.end_time)
                 )
-                document = []
-                if not ids["drive_items"][value[0]].get(lib_content):
-                    ids["drive_items"][value[0]].update({lib_content: []})
-                for i, _ in enumerate(response_data):
-                    if response_data[i]["File"].get("TimeLastModified"):
-                        obj_type = "File"
-                        doc = {"type": "file"}
-                        file_relative_url = response_data[i]["File"][
-                            "ServerRelativeUrl"
-                        ]
-                        url_s = f"{value[0]}/_api/web/GetFileByServerRelativeUrl('{encode(file_relative_url)}')/$value"
-                        response = self.sharepoint_client.get(
-                            url_s, query="", param_name="attachment"
-                        )
-                        doc["body"] = {}
-                        if response and response.ok:
-                            try:
-                                doc["body"] = extract(response.content)
-                            except TikaException as exception:
-                                self.logger.error(
-                                    "Error while extracting the contents from the file at %s, Error %s"
-                                    % (response_data[i].get("Url"), exception)
-                                )
-                    else:
-                        obj_type = "Folder"
-                        doc = {"type": "folder"}
-                    for field, response_field in schema_drive.items():
-                        doc[field] = response_data[i][obj_type].get(response_field)
-                    doc["id"] = response_data[i].get("GUID")
-                    if self.enable_permission is True:
-                        doc["_allow_permissions"] = self.fetch_permissions(
-                            key=DRIVE_ITEMS,
-                            list_id=lib_content,
-                            list_url=value[0],
-                            itemid=str(response_data[i].get("ID")),
-                        )
-                    doc["url"] = urljoin(
-                        self.sharepoint_host,
-                        response_data[i][obj_type]["ServerRelativeUrl"],
-                    )
-                    document.append(doc)
-                    if doc["id"] not in ids["drive_items"][value[0]][lib_content]:
-                        ids["drive_items"][value[0]][lib_content].append(doc["id"])
-                responses.extend(document)
-        documents = {"type": DRIVE_ITEMS, "data": responses}
-        return documents
+
+    def fetch_file_content(self, site_url, file_relative_url, cache_key, doc, extractions):
+        """Sets the body of a document to the content of a file. The file is only downloaded and
+        submitted for extraction if its content was not cached for its current version.
+        :param site_url: url of the site the file belongs to
+        :param file_relative_url: server relative url of the file
+        :param cache_key: identity and version of the file, None if it can not be determined
+        :param doc: document the body is set for
+        :param extractions: list of pending extractions, the extraction of the file is appended to
+        """
+        doc["body"] = self.extractor.get_cached(cache_key)
+        if doc["body"] is not None:
+            return
+        doc["body"] = {}
+        url_s = f"{site_url}/_api/web/GetFileByServerRelativeUrl('{encode(file_relative_url)}')/$value"
+        content = self.sharepoint_client.download(
+            url_s, self.max_file_size, truncate=(self.file_size_policy == "truncate")
+        )
+        if content:
+            extractions.append((doc, self.extractor.submit(content, file_relative_url, cache_key)))
+
+    @staticmethod
+    def set_extracted_bodies(extractions):
+        """Waits for the contents of the files of a page to be extracted and sets them as the body of their documents
+        :param extractions: list of (document, future holding the extracted content)
+        """
+        for doc, future in extractions:
+            doc["body"] = future.result()
 
     def get_roles(self, key, site, list_url, list_id, itemid):
         """Checks the permissions and returns the user roles.
@@ -482,21 +666,69 @@ class SyncSharepoint:
             list_id=None,
             list_url=None,
             itemid=None,
+            parent=None,
     ):
         """This method when invoked, checks the permission inheritance of each object.
         If the object has unique permissions, the list of users having access to it
         is fetched using sharepoint api else the permission levels of the that object
-        is taken same as the permission level of the site collection.
+        is taken same as the permission level of the parent it inherits from, which
+        are only fetched once per parent.
         :param key: key, a string value
         :param site: site name to index the permission for the site
         :param list_id: list id to index the permission for the list
         :param list_url: url of the list
         :param itemid: item id to index the permission for the item
+        :param parent: cache key of the securable object the permissions are inherited from, None if they are unique
         Returns:
             groups: list of users having access to the given object
         """
+        if parent:
+            groups = self.permissions_cache.get(parent)
+            if groups is not None:
+                return groups
+
         roles = self.get_roles(key, site, list_url, list_id, itemid)
+        groups = self.get_groups(roles)
+        if parent:
+            self.cache_permissions(parent, groups)
+        return groups
+
+    def fetch_items_permissions(self, key, list_url, list_id, item_permissions):
+        """Sets the permissions of a page of items. Only the items with unique permissions, and one item per
+        parent that is not cached yet, have their permissions fetched, using $batch requests.
+        :param key: key, LIST_ITEMS or DRIVE_ITEMS
+        :param list_url: url of the list
+        :param list_id: list id of the items
+        :param item_permissions: list of (document, item id, parent cache key) of the items
+        """
+        pending = []
+        for doc, itemid, parent in item_permissions:
+            groups = self.permissions_cache.get(parent) if parent else None
+            if groups is not None:
+                doc["_allow_permissions"] = groups
+            else:
+                pending.append((doc, itemid, parent))
+        if not pending:
+            return
+        # Items inheriting from the same parent share its permissions, fetching one of them is enough
+        items_to_fetch = {}
+        for _, itemid, parent in pending:
+            items_to_fetch.setdefault(parent or itemid, itemid)
+        responses = self.permissions.fetch_users_batch(key, list_url, list_id, list(items_to_fetch.values()))
+        groups_by_key = {}
+        for cache_key, roles in zip(items_to_fetch, responses):
+            groups_by_key[cache_key] = self.get_groups(roles)
+            if isinstance(cache_key, tuple):
+                self.cache_permissions(cache_key, groups_by_key[cache_key])
+        for doc, itemid, parent in pending:
+            doc["_allow_permissions"] = groups_by_key[parent or itemid]
 
+    def get_groups(self, roles):
+        """Returns the titles of the members having a role assigned
+        :param roles: response of the roleassignments GET call
+        Returns:
+            groups: list of users having access to the object
+        """
         groups = []
 
         if not roles:
@@ -508,33 +740,26 @@ class SyncSharepoint:
             groups.append(title)
         return groups
 
-    def fetch_and_append_sites_to_queue(
-            self, ids, collection, duration
-    ):
-        """Fetches and appends site details to queue
-        :param ids: id collection of the all the objects
-        :param collection: collection name
-        :param duration: List of time range consisting of the [start_time, end_time]
-        """
-        start_time, end_time = duration[0], duration[1]
-        parent_site_url = f"/sites/{collection}"
-        sites_path = []
-        sites, document_list = self.fetch_sites(
-            parent_site_url,
-            {},
-            ids,
-            (SITES in self.objects),
-            start_time,
-            end_time,
-        )
-        documents = {"type": SITES, "data": document_list}
-        if documents:
-            self.queue.put(documents)
-            self.logger.debug(
-                f"Thread ID {threading.get_ident()} added list of {len(documents.get('data'))} sites into the queue"
-            )
-        sites_path.append(sites)
-        return sites_path
+    @staticmethod
+    def get_parent(response, parent):
+        """Returns the cache key of the parent an object inherits its permissions from
+        :param response: sharepoint object fetched along with its HasUniqueRoleAssignments property
+        :param parent: cache key of the parent securable object
+        Returns:
+            parent: the cache key, or None if the object has unique permissions
+        """
+        if response.get("HasUniqueRoleAssignments", True):
+            return None
+        return parent
+
+    def cache_permissions(self, key, groups):
+        """Stores the permissions of a securable object for the objects inheriting from it.
+        Both sites and lists are cached, lists by their root folder, as well as the folders of the items.
+        :param key: cache key of the securable object
+        :param groups: list of users having access to the object
+        """
+        if groups:
+            self.permissions_cache[key] = groups
 
     def fetch_and_append_lists_to_queue(self, ids, sites_path):
         """Fetches and appends list details to queue
@@ -545,69 +770,327 @@ class SyncSharepoint:
             sites_path, ids, (LISTS in self.objects)
         )
         if documents:
-            self.queue.put(documents)
+            self.append_to_queue(documents["type"], documents["data"])
             self.logger.debug(
                 f"Thread ID {threading.get_ident()} added list of {len(documents.get('data'))} lists into the queue"
             )
         return [lists_details, libraries_details]
 
+    def fetch_and_append_changed_lists_to_queue(self, ids, changed_lists):
+        """Fetches and appends the lists reported by the change log to the queue
+        :param ids: id collection of the all the objects
+        :param changed_lists: dictionary of a site path and ids of its changed lists
+        """
+        site, list_ids = next(iter(changed_lists.items()))
+        lists_details, libraries_details, documents = self.fetch_lists(
+            [{site: self.end_time}], ids, (LISTS in self.objects), list_ids
+        )
+        if documents:
+            self.append_to_queue(documents["type"], documents["data"])
+        return [lists_details, libraries_details]
+
     def fetch_and_append_list_items_to_queue(self, ids, lists_details):
-        """Fetches and appends list_items to the queue
+        """Fetches and appends list_items to the queue, page by page
         :param ids: id collection of the all the objects
         :param lists_details: dictionary containing list name, list path and id
         """
-        documents = self.fetch_items(lists_details, ids)
-        if documents:
-            self.queue.put(documents)
-            self.logger.debug(
-                f"Thread ID {threading.get_ident()} added list of {len(documents.get('data'))} list items into the queue"
-            )
+        for document in self.fetch_items(lists_details, ids):
+            self.append_to_queue(LIST_ITEMS, document)
 
     def fetch_and_append_drive_items_to_queue(self, ids, libraries_details):
-        """Fetches and appends the drive items to the queue
+        """Fetches and appends the drive items to the queue, page by page
         :param ids: id collection of the all the objects
         :param libraries_details: dictionary containing library name, library path and id
         """
-        documents = self.fetch_drive_items(libraries_details, ids)
-        if documents:
-            self.queue.put(documents)
-            self.logger.debug(
-                f"Thread ID {threading.get_ident()} added list of {len(documents.get('data'))} drive items into the queue"
-            )
+        for document in self.fetch_drive_items(libraries_details, ids):
+            self.append_to_queue(DRIVE_ITEMS, document)
+
+    def append_to_queue(self, document_type, document):
+        """Appends the documents to the queue in batches that can be indexed by a single request.
+        Documents unchanged since they were last indexed are skipped when their fingerprints are kept.
+        :param document_type: type of the documents, SITES, LISTS, LIST_ITEMS or DRIVE_ITEMS
+        :param document: list of documents
+        """
+        if self.fingerprint_storage:
+            document = self.fingerprint_storage.get_changed_documents(document)
+        for chunk in split_documents_into_equal_chunks(document, BATCH_SIZE):
+            self.queue.put({"type": document_type, "data": chunk})
+        self.logger.debug(
+            f"Thread ID {threading.get_ident()} added list of {len(document)} {document_type} into the queue"
+        )
 
-    def fetch_records_from_sharepoint(self, producer, date_ranges, thread_count, ids, collection):
+    def fetch_records_from_sharepoint(self, producer, thread_count, ids, collection):
         """Fetches Sites, Lists, List Items and Drive Items from sharepoint.
         :param producer: Producer function
-        :param date_ranges: Partition of time range
         :param thread_count: Thread count
         :param ids: Content of the local storage
         :param collection: SharePoint server Collection name
         """
         # Fetch sites
-        time_range_list = [(date_ranges[num], date_ranges[num + 1]) for num in range(0, thread_count)]
-        sites = producer(thread_count, self.fetch_and_append_sites_to_queue,
-                         [ids, collection], time_range_list, wait=True)
+        sites = self.discover_sites(collection, thread_count, ids)
         all_sites = [{f"/sites/{collection}": self.end_time}]
-        for site in sites:
-            all_sites.extend(site)
+        all_sites.extend({site_url: modified} for site_url, modified in sites.items())
 
         # Fetch lists
         partitioned_sites = split_list_into_buckets(all_sites, thread_count)
 
         lists = producer(thread_count, self.fetch_and_append_lists_to_queue, [ids], partitioned_sites, wait=True)
 
-        # Fetch list items
         lists_details, libraries_details = {}, {}
         for result in lists:
             lists_details.update(result[0])
             libraries_details.update(result[1])
 
+        self.fetch_and_append_items_to_queue(producer, thread_count, ids, lists_details, libraries_details)
+        return ids
+
+    def fetch_and_append_items_to_queue(self, producer, thread_count, ids, lists_details, libraries_details):
+        """Fetches and appends the list items and drive items of the given lists and libraries to the queue
+        :param producer: Producer function
+        :param thread_count: Thread count
+        :param ids: Content of the local storage
+        :param lists_details: dictionary containing list name, list path and id
+        :param libraries_details: dictionary containing library name, library path and id
+        """
+        list_items = self.partition_lists(lists_details, thread_count) if LIST_ITEMS in self.objects else []
+        libraries_items = self.partition_lists(libraries_details, thread_count) if DRIVE_ITEMS in self.objects else []
+        self.crawl_items(producer, thread_count, ids, list_items, libraries_items)
+
+    def crawl_items(self, producer, thread_count, ids, list_items, libraries_items):
+        """Fetches and appends the list items and drive items of the given partitions of lists to the queue
+        :param producer: Producer function
+        :param thread_count: Thread count
+        :param ids: Content of the local storage
+        :param list_items: partitions of the lists
+        :param libraries_items: partitions of the libraries
+        """
+        crawler = None
+        if self.config.get_value("sharepoint_sync_engine") == "asyncio":
+            if async_engine.is_available():
+                crawler = async_engine.AsyncItemCrawler(self.config, self.logger, self, thread_count)
+            else:
+                self.logger.warning("The asyncio engine requires the aiohttp package, falling back to the threads engine")
+
+        # Each partition is a task of the thread pool, so a thread that is done picks the next pending partition
+        # Fetch list items
         if LIST_ITEMS in self.objects:
-            list_items = split_documents_into_equal_chunks(lists_details, thread_count)
-            producer(thread_count, self.fetch_and_append_list_items_to_queue, [ids], list_items, wait=True)
+            if crawler:
+                stats = crawler.crawl(LIST_ITEMS, list_items, ids)
+                self.logger.info(f"Asyncio engine usage for the list items: {stats}")
+            else:
+                producer(thread_count, self.fetch_and_append_list_items_to_queue, [ids], list_items, wait=True)
 
         # Fetch library details
         if DRIVE_ITEMS in self.objects:
-            libraries_items = split_documents_into_equal_chunks(libraries_details, thread_count)
-            producer(thread_count, self.fetch_and_append_drive_items_to_queue, [ids], libraries_items, wait=True)
-        return ids
+            if crawler:
+                stats = crawler.crawl(DRIVE_ITEMS, libraries_items, ids)
+                self.logger.info(f"Asyncio engine usage for the drive items: {stats}")
+            else:
+                producer(thread_count, self.fetch_and_append_drive_items_to_queue, [ids], libraries_items, wait=True)
+
+    def partition_lists(self, lists_details, thread_count):
+        """Splits the lists into the partitions fetched by the threads, one partition per list.
+        Lists with more than PARTITION_SIZE items are split into up to thread_count ranges of item Ids,
+        so that a large list is fetched by several threads at once. The largest partitions come first
+        so that none of them is left to a single thread at the end of the sync.
+        :param lists_details: dictionary containing list name, list path, id and item count
+        :param thread_count: Thread count
+        Returns:
+            partitions: list of dictionaries holding a list, along with the range of item Ids to be fetched
+        """
+        partitions = []
+        for list_id, value in lists_details.items():
+            item_count = value[3] or 0
+            partition_count = min(math.ceil(item_count / PARTITION_SIZE), thread_count)
+            last_id = None
+            if partition_count > 1:
+                last_id = self.sharepoint_client.get_last_item_id(value[0], list_id)
+            if not last_id:
+                partitions.append((item_count, {list_id: value}))
+                continue
+            width = math.ceil(last_id / partition_count)
+            for low in range(1, last_id + 1, width):
+                partitions.append((item_count / partition_count, {list_id: value[:4] + [(low, low + width)]}))
+        partitions.sort(key=lambda partition: partition[0], reverse=True)
+        return [partition for _, partition in partitions]
+
+    @staticmethod
+    def get_id_range_filter(value):
+        """Returns the filter restricting the items fetched to the range of Ids of a partition
+        :param value: list path, name, last modified date, item count and range of item Ids of a list
+        """
+        if len(value) < 5:
+            return ""
+        return f" and (Id ge {value[4][0]}) and (Id lt {value[4][1]})"
+
+    @staticmethod
+    def get_item_ids_filter(item_ids):
+        """Returns the filter restricting the items fetched to the items reported by the change log
+        :param item_ids: ids of the items, or None for all the items of the list
+        """
+        if item_ids is None:
+            return ""
+        return "&$filter=%s" % " or ".join(f"(Id eq {item_id})" for item_id in item_ids)
+
+    def fetch_records_from_change_log(self, producer, thread_count, ids, collection, change_token):
+        """Fetches the Sites, Lists, List Items and Drive Items changed since the change token, using the
+        change log of the collection instead of walking all of its sites, and deindexes the deleted ones.
+        :param producer: Producer function
+        :param thread_count: Thread count
+        :param ids: Content of the local storage
+        :param collection: SharePoint server Collection name
+        :param change_token: change token of the last change synced
+        Returns:
+            change_token: change token of the end of the sync time range, or None if the change log could not be fetched
+        """
+        collection_url = f"/sites/{collection}"
+        # The change log is read up to the end of the sync time range, the later changes being left to the next sync
+        end_change_token = self.sharepoint_client.get_change_token(f"sites/{collection}", self.end_time)
+        if end_change_token is None:
+            return None
+        changes = self.sharepoint_client.get_changes(f"sites/{collection}", change_token, end_change_token)
+        if changes is None:
+            return None
+        self.logger.info(f"Fetched {len(changes)} changes from the change log of the collection: {collection}")
+
+        changed_webs, changed_sites, deleted_item_lists, deleted_lists = set(), set(), set(), set()
+        # Ids of the changed lists of each site, ids of the changed items of each list and lists fetched entirely
+        changed_lists, changed_items, crawled_lists = {}, {}, set()
+        for change in changes:
+            change_type = change.get("__metadata", {}).get("type")
+            deleted = change.get("ChangeType") in DELETE_CHANGE_TYPES
+            list_id = (change.get("ListId") or "").lower()
+            if change_type == "SP.ChangeWeb":
+                # Deleted sites are left to the deletion sync
+                if not deleted:
+                    changed_sites.add(change.get("WebId"))
+                    changed_webs.add(change.get("WebId"))
+            elif change_type == "SP.ChangeList":
+                if deleted:
+                    deleted_lists.add(list_id)
+                else:
+                    changed_lists.setdefault(change.get("WebId"), set()).add(list_id)
+                    if change.get("ChangeType") in CRAWLED_LIST_CHANGE_TYPES:
+                        crawled_lists.add(list_id)
+            elif change_type == "SP.ChangeItem":
+                if deleted:
+                    deleted_item_lists.add(list_id)
+                else:
+                    changed_lists.setdefault(change.get("WebId"), set()).add(list_id)
+                    if change.get("ItemId") is not None:
+                        changed_items.setdefault(list_id, set()).add(change.get("ItemId"))
+        changed_webs.update(changed_lists)
+
+        web_urls = self.get_web_urls(collection_url, changed_webs, ids)
+
+        # Fetch changed sites, the root site of the collection is not indexed as a site
+        if SITES in self.objects:
+            schema = self.get_document_schema(SITES)
+            document_list = []
+            for web_id in changed_sites:
+                if web_id not in web_urls or web_urls[web_id] == collection_url:
+                    continue
+                response = self.sharepoint_client.get(
+                    f"{web_urls[web_id]}/_api/web", f"?{self.get_select_query(SITES)}", "site"
+                )
+                if response:
+                    document_list.append(self.get_site_document(response.json().get("d", {}), schema, ids))
+            if document_list:
+                self.append_to_queue(SITES, document_list)
+
+        # Fetch the changed lists by id, then their changed items by id, whatever their modification dates
+        # as restored and moved objects keep theirs
+        sites = []
+        for web_id, list_ids in changed_lists.items():
+            if web_id not in web_urls:
+                continue
+            list_ids = sorted(list_ids)
+            sites.extend(
+                {web_urls[web_id]: list_ids[index: index + CHANGED_IDS_BATCH_SIZE]}
+                for index in range(0, len(list_ids), CHANGED_IDS_BATCH_SIZE)
+            )
+        lists = producer(thread_count, self.fetch_and_append_changed_lists_to_queue, [ids], sites, wait=True)
+        list_items, libraries_items = [], []
+        for result in lists:
+            for partitions, details in [(list_items, result[0]), (libraries_items, result[1])]:
+                for list_id, value in details.items():
+                    value = [value[0], value[1], self.end_time, value[3]]
+                    if list_id.lower() in crawled_lists:
+                        partitions.append({list_id: value + [None]})
+                        continue
+                    item_ids = sorted(changed_items.get(list_id.lower(), []))
+                    partitions.extend(
+                        {list_id: value + [item_ids[index: index + CHANGED_IDS_BATCH_SIZE]]}
+                        for index in range(0, len(item_ids), CHANGED_IDS_BATCH_SIZE)
+                    )
+        self.crawl_items(producer, thread_count, ids, list_items, libraries_items)
+
+        self.deindex_removed_items(ids, deleted_item_lists | deleted_lists)
+        self.deindex_removed_lists(ids, deleted_lists)
+        return end_change_token
+
+    def get_web_urls(self, collection_url, web_ids, ids):
+        """Returns the server relative urls of the sites of a collection
+        :param collection_url: server relative url of the collection
+        :param web_ids: ids of the sites
+        :param ids: Content of the local storage, containing the urls of the indexed sites
+        Returns:
+            web_urls: dictionary of site id and server relative url
+        """
+        web_urls = {}
+        response = self.sharepoint_client.get(f"{collection_url}/_api/web", "?$select=Id,ServerRelativeUrl", "site")
+        if response:
+            root_web = response.json().get("d", {})
+            web_urls[root_web.get("Id")] = root_web.get("ServerRelativeUrl")
+        for web_id in web_ids:
+            if web_id in web_urls:
+                continue
+            if web_id in ids["sites"]:
+                web_urls[web_id] = ids["sites"][web_id]
+                continue
+            response = self.sharepoint_client.post(
+                f"{collection_url}/_api/site/openWebById('{web_id}')", None, "sites"
+            )
+            if response:
+                web_urls[web_id] = response.json().get("d", {}).get("ServerRelativeUrl")
+        return web_urls
+
+    def deindex_removed_items(self, ids, list_ids):
+        """Deindexes the stored items of the given lists that are not present in SharePoint anymore
+        :param ids: Content of the local storage
+        :param list_ids: ids of the lists whose items were deleted
+        """
+        for key in [LIST_ITEMS, DRIVE_ITEMS]:
+            for site_url, lists in ids[key].items():
+                for list_id, item_ids in lists.items():
+                    if list_id.lower() not in list_ids:
+                        continue
+                    current_item_ids = self.sharepoint_client.get_list_item_ids(site_url, list_id)
+                    if current_item_ids is None:
+                        continue
+                    self.delete_documents(list(item_ids - current_item_ids))
+                    lists[list_id] = item_ids & current_item_ids
+
+    def deindex_removed_lists(self, ids, list_ids):
+        """Deindexes the stored lists that were deleted from SharePoint
+        :param ids: Content of the local storage
+        :param list_ids: ids of the deleted lists
+        """
+        for site_url, lists in ids[LISTS].items():
+            deleted_ids = [list_id for list_id in lists if list_id.lower() in list_ids]
+            self.delete_documents(deleted_ids)
+            for list_id in deleted_ids:
+                lists.pop(list_id)
+                for key in [LIST_ITEMS, DRIVE_ITEMS]:
+                    ids[key].get(site_url, {}).pop(list_id, None)
+
+    def delete_documents(self, document_ids):
+        """Deletes documents from Enterprise Search
+        :param document_ids: ids of the documents to be deleted
+        """
+        if document_ids:
+            self.logger.info(f"Deindexing {len(document_ids)} documents deleted from SharePoint")
+        for chunk in split_documents_into_equal_chunks(document_ids, BATCH_SIZE):
+            self.workplace_search_custom_client.delete_documents(document_ids=chunk)
+            if self.fingerprint_storage:
+                self.fingerprint_storage.remove(chunk)
@@ -38,6 +38,7 @@ def test_sharepoint(settings):
     sharepoint_client = SharePoint(configs, logger)
     collection = configs.get_value("sharepoint.site_collections")[0]
     response = sharepoint_client.get(f"/sites/{collection}/_api/web/webs", query="?", param_name="sites")
+    sharepoint_client.close()
     if not response:
         assert False, "Error while connecting to the Sharepoint server at %s" % (
             configs.get_value("sharepoint.host_url"))
@@ -31,15 +31,41 @@ class Permissions:
                 Response of the GET call
         """
         self.logger.info("Fetching the user roles for key: %s" % (key))
+        if not rel_url.endswith("/"):
+            rel_url = rel_url + "/"
+        return self.sharepoint_client.get(rel_url, self.get_roles_query(key, list_id, item_id), "permission_users")
+
+    def fetch_users_batch(self, key, rel_url, list_id, item_ids):
+        """ Invokes $batch calls to fetch unique permissions assigned to the items of a list
+            :param key: object key, LIST_ITEMS or DRIVE_ITEMS
+            :param rel_url: relative url to the sharepoint farm
+            :param list_id: list guid
+            :param item_ids: item ids
+            Returns:
+                Responses of the GET calls, in the same order as the item ids
+        """
+        self.logger.info("Fetching the user roles of %s objects for key: %s" % (len(item_ids), key))
+        rel_url = rel_url.rstrip("/")
+        return self.sharepoint_client.get_batch(
+            rel_url,
+            [f"{rel_url}/{self.get_roles_query(key, list_id, item_id)}" for item_id in item_ids],
+            "permission_users",
+        )
+
+    @staticmethod
+    def get_roles_query(key, list_id="", item_id=""):
+        """ Returns the relative url of the role assignments of an object
+            :param key: object key
+            :param list_id: list guid
+            :param item_id: item id
+        """
         maps = {
             SITES: "_api/web/roleassignments?$expand=Member/users,RoleDefinitionBindings",
             LISTS: f"_api/web/lists(guid\'{list_id}\')/roleassignments?$expand=Member/users,RoleDefinitionBindings",
             LIST_ITEMS: f"_api/web/lists(guid\'{list_id}\')/items({item_id})/roleassignments?$expand=Member/users,RoleDefinitionBindings",
             DRIVE_ITEMS: f"_api/web/lists(guid\'{list_id}\')/items({item_id})/roleassignments?$expand=Member/users,RoleDefinitionBindings"
         }
-        if not rel_url.endswith("/"):
-            rel_url = rel_url + "/"
-        return self.sharepoint_client.get(rel_url, maps[key], "permission_users")
+        return maps[key]
 
     def remove_all_permissions(self):
         """ Removes all the permissions present in the workplace"""
@@ -62,3 +88,15 @@ class Permissions:
         self.logger.info("Fetching the group roles for userid: %s" % (userid))
         return self.sharepoint_client.get(
             rel_url, f"_api/web/GetUserById({userid})/groups", "permission_groups")
+
+    def fetch_groups_batch(self, rel_url, userids):
+        """ Invokes $batch calls to fetch the group roles of several users
+            :param rel_url: relative url to the sharepoint farm
+            :param userids: user ids for fetching the roles
+            Returns:
+                Responses of the GET calls, in the same order as the user ids
+        """
+        self.logger.info("Fetching the group roles for %s users" % (len(userids)))
+        rel_url = rel_url.rstrip("/")
+        return self.sharepoint_client.get_batch(
+            rel_url, [f"{rel_url}/_api/web/GetUserById({userid})/groups" for userid in userids], "permission_groups")
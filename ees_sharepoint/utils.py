@@ -6,19 +6,17 @@
 """This module contains uncategorized utility methods."""
 
 import urllib.parse
-from datetime import datetime
 
 from tika import parser
 
-DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
-
-def extract(content):
+def extract(content, timeout=60):
     """Extracts the contents
     :param content: content to be extracted
+    :param timeout: time in seconds to wait for the Tika server to parse the content
     Returns:
         parsed_test: parsed text"""
-    parsed = parser.from_buffer(content)
+    parsed = parser.from_buffer(content, requestOptions={"timeout": timeout})
     parsed_text = parsed["content"]
     return parsed_text
 
@@ -63,22 +61,3 @@ def split_documents_into_equal_chunks(documents, chunk_size):
         else:
             list_of_chunks.append(documents[i: i + chunk_size])
     return list_of_chunks
-
-
-def split_date_range_into_chunks(start_time, end_time, number_of_threads):
-    """Divides the timerange in equal partitions by number of threads
-    :param start_time: start time of the interval
-    :param end_time: end time of the interval
-    :param number_of_threads: number of threads defined by user in config file
-    """
-    start_time = datetime.strptime(start_time, DATETIME_FORMAT)
-    end_time = datetime.strptime(end_time, DATETIME_FORMAT)
-
-    diff = (end_time - start_time) / number_of_threads
-    datelist = []
-    for idx in range(number_of_threads):
-        date_time = start_time + diff * idx
-        datelist.append(date_time.strftime(DATETIME_FORMAT))
-    formatted_end_time = end_time.strftime(DATETIME_FORMAT)
-    datelist.append(formatted_end_time)
-    return datelist
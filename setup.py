@@ -54,6 +54,7 @@ setup(
     zip_safe=False,
     classifiers=classifiers,
     install_requires=install_requires,
+    extras_require={"asyncio": ["aiohttp"], "orjson": ["orjson"]},
     data_files=[("config", ["sharepoint_server_connector.yml"])],
     entry_points="""
       [console_scripts]
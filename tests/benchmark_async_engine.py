@@ -0,0 +1,40 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""Compares the throughput of the threads and asyncio engines against a local mock of SharePoint.
+
+Usage: PYTHONPATH=. python tests/benchmark_async_engine.py [list count] [items per list] [latency in seconds]"""
+import sys
+import time
+
+from mock_sharepoint import MockSharePoint
+from test_async_engine import create_sync_sharepoint
+
+from ees_sharepoint import async_engine
+from ees_sharepoint.base_command import BaseCommand
+
+
+def main(list_count=20, item_count=2000, latency=0.05):
+    lists = {
+        f"list-{index}": ["/sites/collection", f"List {index}", "2022-01-10T00:00:00Z", item_count]
+        for index in range(list_count)
+    }
+    with MockSharePoint(item_count=item_count, latency=latency) as mock:
+        sync_sharepoint, documents = create_sync_sharepoint(mock.host)
+        start = time.perf_counter()
+        ids = {"list_items": {}}
+        partitions = sync_sharepoint.partition_lists(lists, 2)
+        BaseCommand.producer(2, sync_sharepoint.fetch_and_append_list_items_to_queue, [ids], partitions, wait=True)
+        print(f"threads: {len(documents)} documents in {time.perf_counter() - start:.2f}s")
+
+        sync_sharepoint, documents = create_sync_sharepoint(mock.host)
+        start = time.perf_counter()
+        crawler = async_engine.AsyncItemCrawler(sync_sharepoint.config, sync_sharepoint.logger, sync_sharepoint, 2)
+        stats = crawler.crawl("list_items", partitions, {"list_items": {}})
+        print(f"asyncio: {len(documents)} documents in {time.perf_counter() - start:.2f}s, {stats}")
+
+
+if __name__ == "__main__":
+    main(*(float(arg) if "." in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,70 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""Compares the size and the parse time of a page of list items in the OData metadata formats, with
+the json module and with orjson, along with the time taken to serialize the documents of the page
+for the Enterprise Search.
+
+Usage: PYTHONPATH=. python tests/benchmark_json.py [items per page] [repeats]"""
+import json
+import sys
+import time
+import unittest.mock
+
+from mock_sharepoint import MockSharePoint
+
+from ees_sharepoint import json_codec
+from ees_sharepoint.adapter import DEFAULT_SCHEMA
+from ees_sharepoint.document import DocumentSchema
+from ees_sharepoint.sharepoint_client import parse_page
+from ees_sharepoint.sync_sharepoint import LIST_ITEMS, REQUIRED_FIELDS
+
+HOST = "http://sharepoint"
+PATH = "/sites/collection/_api/web/lists(guid'list-1')/items"
+
+
+def measure(function, repeats):
+    """Returns the best time of a function over a number of runs, in milliseconds"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(item_count=5000, repeats=5):
+    mock = MockSharePoint(item_count=item_count, page_size=item_count)
+    schema = DocumentSchema(DEFAULT_SCHEMA["list_items"])
+    selected = ",".join(dict.fromkeys(schema.response_fields + tuple(REQUIRED_FIELDS[LIST_ITEMS])))
+    formats = [
+        ("verbose, $select=*", "verbose", "*,FileRef,FileDirRef,HasUniqueRoleAssignments,AttachmentFiles"),
+        ("verbose, projected", "verbose", selected),
+        ("minimal, projected", "minimal", selected),
+        ("nometadata, projected", "nometadata", selected),
+    ]
+    codecs = [("json", None)]
+    if json_codec.orjson is not None:
+        codecs.append(("orjson", json_codec.orjson))
+    print(f"{'format':<24}{'bytes':>12}" + "".join(f"{name + ' parse ms':>18}" for name, _ in codecs))
+    for name, metadata, select in formats:
+        body = json.dumps(mock.get_page(f"{PATH}?$select={select}", HOST, metadata)).encode("utf-8")
+        timings = []
+        for _, package in codecs:
+            with unittest.mock.patch.object(json_codec, "orjson", package):
+                timings.append(measure(lambda: parse_page(body), repeats))
+        print(f"{name:<24}{len(body):>12,}" + "".join(f"{timing:>18.1f}" for timing in timings))
+
+    results, _ = parse_page(json.dumps(mock.get_page(f"{PATH}?$select={selected}", HOST, "nometadata")))
+    documents = [schema.new_document("item", result) for result in results]
+    for name, package in codecs:
+        with unittest.mock.patch.object(json_codec, "orjson", package):
+            timing = measure(lambda: [document.__setitem__("url", HOST) or document.to_json() for document in documents], repeats)
+        print(f"serializing the {len(documents)} documents of the page with {name}: {timing:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,131 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""Local mock of the SharePoint REST api serving the items of lists, page by page."""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Columns returned along with the ones read by the connector when all the fields of the items are selected
+EXTRA_COLUMNS = {
+    "FileSystemObjectType": 0,
+    "ServerRedirectedEmbedUri": None,
+    "ServerRedirectedEmbedUrl": "",
+    "ContentTypeId": "0x0100E8A4E5A8C4B0B64B8E2F8F6B7A9C1D2E",
+    "ComplianceAssetId": None,
+    "EditorId": 1,
+    "OData__UIVersionString": "1.0",
+}
+# Links of the properties that are not expanded, in the verbose format
+DEFERRED_FIELDS = [
+    "FirstUniqueAncestorSecurableObject", "RoleAssignments", "ContentType", "GetDlpPolicyTip",
+    "FieldValuesAsHtml", "FieldValuesAsText", "FieldValuesForEdit", "File", "Folder", "ParentList",
+    "Properties", "Versions",
+]
+
+
+class MockSharePoint:
+    """Serves item_count items for every list, page_size items per page, after latency seconds, in the
+    OData metadata format given by the accept header of the requests"""
+
+    def __init__(self, item_count, page_size=100, latency=0):
+        self.item_count = item_count
+        self.page_size = page_size
+        self.latency = latency
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                match = re.search(r"odata=(\w+)", self.headers.get("Accept", ""))
+                metadata = match.group(1) if match else "verbose"
+                page = mock.get_page(self.path, f"http://{self.headers['Host']}", metadata)
+                body = json.dumps(page).encode("utf-8")
+                time.sleep(mock.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_page(self, path, host, metadata="verbose"):
+        """Returns a page of items, with the link of the following page, in the given OData metadata format"""
+        url = urlparse(path)
+        list_id = re.search(r"lists\(guid'([^']+)'\)", url.path).group(1)
+        query = parse_qs(url.query)
+        select = query.get("$select", ["*"])[0].split(",")
+        page = int(query.get("page", ["0"])[0])
+        first_id = page * self.page_size + 1
+        last_id = min(first_id + self.page_size, self.item_count + 1)
+        results = [self.get_item(list_id, item_id, host, metadata, select) for item_id in range(first_id, last_id)]
+        next_url = None
+        if last_id <= self.item_count:
+            query["page"] = [str(page + 1)]
+            next_url = f"{host}{url.path}?{urlencode(query, doseq=True)}"
+        if metadata == "verbose":
+            response = {"d": {"results": results}}
+            if next_url:
+                response["d"]["__next"] = next_url
+        else:
+            response = {"value": results}
+            if metadata == "minimal":
+                response["odata.metadata"] = f"{host}/sites/collection/_api/$metadata#SP.ListData.ListItems"
+            if next_url:
+                response["odata.nextLink"] = next_url
+        return response
+
+    @staticmethod
+    def get_item(list_id, item_id, host, metadata, select):
+        """Returns an item with the selected fields, along with the columns and links of all the
+        fields when every field is selected, as SharePoint does"""
+        item = {
+            "GUID": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{list_id}/{item_id}")),
+            "Id": item_id,
+            "Title": f"Item {item_id}",
+            "Created": "2022-01-01T00:00:00Z",
+            "Modified": "2022-01-02T00:00:00Z",
+            "AuthorId": 1,
+            "FileRef": f"/sites/collection/Lists/{list_id}/{item_id}_.000",
+            "FileDirRef": f"/sites/collection/Lists/{list_id}",
+            "HasUniqueRoleAssignments": False,
+            "Attachments": False,
+        }
+        if "*" in select:
+            item.update(EXTRA_COLUMNS, ID=item_id)
+        else:
+            item = {field: value for field, value in item.items() if field in select}
+        uri = f"{host}/sites/collection/_api/Web/Lists(guid'{list_id}')/Items({item_id})"
+        if metadata == "verbose":
+            item["AttachmentFiles"] = {"results": []}
+            item["__metadata"] = {"id": uri, "uri": uri, "etag": '"1"', "type": "SP.Data.ListItem"}
+            if "*" in select:
+                item.update({field: {"__deferred": {"uri": f"{uri}/{field}"}} for field in DEFERRED_FIELDS})
+        else:
+            item["AttachmentFiles"] = []
+            if metadata == "minimal":
+                item.update({
+                    "odata.type": "SP.Data.ListItem", "odata.id": uri, "odata.etag": '"1"', "odata.editLink": uri
+                })
+        return item
@@ -0,0 +1,116 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import datetime
+import hashlib
+import logging
+import unittest
+import unittest.mock
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.x509.oid import NameOID
+
+from mock_sharepoint import MockSharePoint
+
+from ees_sharepoint import async_engine
+from ees_sharepoint.sharepoint_client import SharePoint
+from ees_sharepoint.sync_sharepoint import SyncSharepoint
+
+LISTS = {
+    "list-1": ["/sites/collection", "List 1", "2022-01-10T00:00:00Z", 250],
+    "list-2": ["/sites/collection", "List 2", "2022-01-10T00:00:00Z", 250],
+}
+
+
+def create_sync_sharepoint(host, odata_metadata="verbose"):
+    config = unittest.mock.Mock()
+    config.get_value.side_effect = {
+        "objects": {},
+        "enable_document_permission": False,
+        "sharepoint_sync_thread_count": 2,
+        "sharepoint_async_concurrency": 10,
+        "sharepoint_max_requests_per_second": 0,
+        "sharepoint_odata_metadata": odata_metadata,
+        "sharepoint.host_url": host,
+        "sharepoint.domain": "domain",
+        "sharepoint.username": "username",
+        "sharepoint.password": "password",
+        "sharepoint.secure_connection": False,
+        "sharepoint.certificate_path": "",
+        "retry_count": 1,
+        "max_file_size": 10,
+        "file_size_policy": "skip",
+    }.get
+    logger = logging.getLogger("test")
+    documents = []
+    queue = unittest.mock.Mock()
+    queue.put.side_effect = lambda message: documents.extend(message["data"])
+    sync_sharepoint = SyncSharepoint(
+        config, logger, unittest.mock.Mock(), SharePoint(config, logger),
+        "2022-01-01T00:00:00Z", "2022-02-01T00:00:00Z", queue, unittest.mock.Mock(),
+    )
+    return sync_sharepoint, documents
+
+
+@unittest.skipUnless(async_engine.is_available(), "the asyncio engine requires aiohttp")
+class TestAsyncItemCrawler(unittest.TestCase):
+    def test_crawl_produces_the_documents_of_the_threads_engine(self):
+        with MockSharePoint(item_count=250) as mock:
+            sync_sharepoint, threaded_documents = create_sync_sharepoint(mock.host)
+            threaded_ids = {"list_items": {}}
+            for list_id, value in LISTS.items():
+                sync_sharepoint.fetch_and_append_list_items_to_queue(threaded_ids, {list_id: value})
+
+            sync_sharepoint, async_documents = create_sync_sharepoint(mock.host)
+            async_ids = {"list_items": {}}
+            crawler = async_engine.AsyncItemCrawler(sync_sharepoint.config, sync_sharepoint.logger, sync_sharepoint, 2)
+            stats = crawler.crawl("list_items", [{list_id: value} for list_id, value in LISTS.items()], async_ids)
+
+        assert len(async_documents) == 500
+        assert sorted(async_documents, key=lambda doc: doc["id"]) == sorted(threaded_documents, key=lambda doc: doc["id"])
+        assert async_ids == threaded_ids
+        assert stats["requests"] == 6
+
+    def test_crawl_with_light_metadata_produces_the_same_documents(self):
+        with MockSharePoint(item_count=250) as mock:
+            sync_sharepoint, verbose_documents = create_sync_sharepoint(mock.host)
+            sync_sharepoint.fetch_and_append_list_items_to_queue({"list_items": {}}, LISTS)
+
+            sync_sharepoint, light_documents = create_sync_sharepoint(mock.host, "nometadata")
+            sync_sharepoint.fetch_and_append_list_items_to_queue({"list_items": {}}, LISTS)
+
+            sync_sharepoint, async_documents = create_sync_sharepoint(mock.host, "minimal")
+            crawler = async_engine.AsyncItemCrawler(sync_sharepoint.config, sync_sharepoint.logger, sync_sharepoint, 2)
+            crawler.crawl("list_items", [LISTS], {"list_items": {}})
+
+        assert len(verbose_documents) == 500
+        assert light_documents == verbose_documents
+        assert sorted(async_documents, key=lambda doc: doc["id"]) == sorted(verbose_documents, key=lambda doc: doc["id"])
+
+
+class TestCertificateHash(unittest.TestCase):
+    def create_certificate(self, key, algorithm, **kwargs):
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "sharepoint")])
+        builder = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        builder = builder.serial_number(1).not_valid_before(datetime.datetime(2022, 1, 1))
+        builder = builder.not_valid_after(datetime.datetime(2032, 1, 1))
+        return builder.sign(key, algorithm, **kwargs).public_bytes(serialization.Encoding.DER)
+
+    def test_certificate_hash_follows_the_signature_algorithm(self):
+        rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        ec_key = ec.generate_private_key(ec.SECP256R1())
+        pss = padding.PSS(mgf=padding.MGF1(hashes.SHA384()), salt_length=32)
+        certificates = [
+            (self.create_certificate(rsa_key, hashes.SHA256()), hashlib.sha256),
+            (self.create_certificate(rsa_key, hashes.SHA512()), hashlib.sha512),
+            (self.create_certificate(ec_key, hashes.SHA384()), hashlib.sha384),
+            (self.create_certificate(rsa_key, hashes.SHA384(), rsa_padding=pss), hashlib.sha384),
+        ]
+
+        for certificate, hash_function in certificates:
+            assert async_engine.get_certificate_hash(certificate) == hash_function(certificate).hexdigest().upper()
+        assert async_engine.get_certificate_hash(b"\x30\x03\x02") is None
@@ -0,0 +1,36 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import logging
+import queue
+import unittest
+
+import pytest
+
+from ees_sharepoint.connector_queue import ConnectorQueue
+
+
+class TestConnectorQueue(unittest.TestCase):
+    def test_put_waits_for_low_watermark(self):
+        connector_queue = ConnectorQueue(logging.getLogger("test"), maxsize=4, low_watermark=1)
+        for i in range(4):
+            connector_queue.put(i)
+
+        connector_queue.get()
+        # a slot is free, but the queue has not been drained to the low watermark yet
+        with pytest.raises(queue.Full):
+            connector_queue.put(4, block=False)
+
+        connector_queue.get()
+        connector_queue.get()
+        connector_queue.put(4, block=False)
+        assert connector_queue.qsize() == 2
+
+    def test_documents_are_not_copied(self):
+        connector_queue = ConnectorQueue(logging.getLogger("test"), maxsize=2)
+        documents = {"type": "list_items", "data": [{"id": "1"}]}
+        connector_queue.put(documents)
+
+        assert connector_queue.get() is documents
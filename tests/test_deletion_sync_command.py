@@ -0,0 +1,50 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import logging
+import unittest
+import unittest.mock
+
+from ees_sharepoint.deletion_sync_command import DeletionSyncCommand
+
+
+class TestDeletionSyncCommand(unittest.TestCase):
+    def setUp(self):
+        self.command = DeletionSyncCommand(unittest.mock.Mock())
+        self.command.logger = logging.getLogger("test")
+        self.command.sharepoint_client = unittest.mock.Mock()
+        self.command.workplace_search_custom_client = unittest.mock.Mock()
+        self.command.config = unittest.mock.Mock()
+        self.command.config.get_value.return_value = 2
+        self.command.fingerprint_storage = unittest.mock.Mock()
+
+    def test_deindex_objects_deletes_missing_items(self):
+        ids = {
+            "global_keys": {"collection": {"sites": {"site-1": "/sites/collection/site"}, "list_items": {
+                "/sites/collection": {"list-1": {"a", "b", "c"}, "list-2": {"d"}, "list-3": {"e"}}
+            }}},
+            "delete_keys": {"collection": {"sites": {"site-1": "/sites/collection/site"}, "list_items": {
+                "/sites/collection": {"list-1": {"a", "b"}, "list-2": {"d"}, "list-3": {"e"}}
+            }}},
+        }
+        self.command.sharepoint_client.get.return_value = unittest.mock.Mock(status_code=404)
+        # list-2 does not exist anymore and the items of list-3 could not be fetched
+        self.command.sharepoint_client.get_list_item_ids.side_effect = lambda site_url, list_id: {
+            "list-1": {"a", "c"}, "list-2": set(), "list-3": None
+        }[list_id]
+
+        deleted_count = self.command.deindex_objects(ids, self.command.get_deletion_tasks("collection", ids))
+
+        assert deleted_count == 3
+        deleted_ids = [
+            call.args[0] for call in self.command.workplace_search_custom_client.delete_documents.call_args_list
+        ]
+        assert sorted(deleted_ids) == [["b"], ["d"], ["site-1"]]
+        removed_ids = [call.args[0] for call in self.command.fingerprint_storage.remove.call_args_list]
+        assert sorted(removed_ids) == [["b"], ["d"], ["site-1"]]
+        assert ids["global_keys"]["collection"]["sites"] == {}
+        assert ids["global_keys"]["collection"]["list_items"] == {
+            "/sites/collection": {"list-1": {"a", "c"}, "list-3": {"e"}}
+        }
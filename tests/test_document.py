@@ -0,0 +1,52 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import json
+import unittest
+import unittest.mock
+
+from ees_sharepoint import json_codec
+from ees_sharepoint.adapter import DEFAULT_SCHEMA
+from ees_sharepoint.document import DocumentSchema, serialize_document
+
+RESULT = {"Title": "Item", "GUID": "guid", "Created": "2022-01-01T00:00:00Z", "Modified": None, "AuthorId": 1}
+
+
+class TestDocument(unittest.TestCase):
+    def test_document_holds_the_fields_of_its_schema(self):
+        document = DocumentSchema(DEFAULT_SCHEMA["list_items"]).new_document("list_item", RESULT)
+        document["url"] = "http://sharepoint/item"
+
+        assert document == {
+            "title": "Item",
+            "id": "guid",
+            "created_at": "2022-01-01T00:00:00Z",
+            "last_updated": None,
+            "author_id": 1,
+            "type": "list_item",
+            "url": "http://sharepoint/item",
+        }
+        assert "body" not in document
+        assert document.get("body") is None
+        with self.assertRaises(KeyError):
+            document["_allow_permissions"]
+
+    def test_to_json_serializes_the_values_set(self):
+        document = DocumentSchema(DEFAULT_SCHEMA["list_items"]).new_document("list_item", RESULT)
+        assert json.loads(serialize_document(document)) == document.to_dict()
+
+        document["body"] = "contenu extrait"
+
+        assert json.loads(serialize_document(document)) == dict(document.to_dict(), body="contenu extrait")
+        assert serialize_document(document).endswith('"body":"contenu extrait"}')
+
+    def test_to_json_is_the_same_without_orjson(self):
+        document = DocumentSchema(DEFAULT_SCHEMA["list_items"]).new_document("list_item", dict(RESULT, Title="Été \"1\""))
+        document["_allow_permissions"] = ["group"]
+        encoded = serialize_document(document)
+
+        document["body"] = None
+        with unittest.mock.patch.object(json_codec, "orjson", None):
+            assert serialize_document(document) == encoded.replace('"_allow', '"body":null,"_allow')
@@ -0,0 +1,59 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import logging
+import unittest
+import unittest.mock
+
+from tika.tika import TikaException
+
+from ees_sharepoint.extraction import Extractor
+
+CONFIG = {"extraction_thread_count": 2, "extraction_timeout": 10, "max_file_size": 1}
+
+
+class TestExtractor(unittest.TestCase):
+    def setUp(self):
+        config = unittest.mock.Mock()
+        config.get_value.side_effect = CONFIG.get
+        self.extractor = Extractor(config, logging.getLogger("test"))
+
+    def tearDown(self):
+        self.extractor.shutdown()
+
+    @unittest.mock.patch("ees_sharepoint.extraction.extract")
+    def test_submit_extracts_on_the_pool(self, extract):
+        extract.side_effect = lambda content, timeout: content.decode()
+
+        futures = [self.extractor.submit(b"content %d" % i, "file") for i in range(10)]
+
+        assert [future.result() for future in futures] == ["content %d" % i for i in range(10)]
+        assert self.extractor.get_stats()["files"] == 10
+
+    @unittest.mock.patch("ees_sharepoint.extraction.extract")
+    def test_submit_skips_large_files_and_failures(self, extract):
+        extract.side_effect = TikaException("timeout")
+
+        assert self.extractor.submit(b"0" * (1024 * 1024 + 1), "large file").result() == {}
+        assert self.extractor.submit(b"content", "file").result() == {}
+        stats = self.extractor.get_stats()
+        assert (stats["skipped"], stats["failed"]) == (1, 1)
+
+    @unittest.mock.patch("ees_sharepoint.extraction.extract")
+    def test_unexpected_errors_are_reported_as_failures(self, extract):
+        extract.side_effect = ValueError("corrupted")
+
+        with self.assertLogs("test", level="ERROR") as logs:
+            assert self.extractor.submit(b"content", "http://sharepoint/file.docx").result() == {}
+        assert "http://sharepoint/file.docx" in logs.output[0]
+        assert self.extractor.get_stats()["failed"] == 1
+
+    @unittest.mock.patch("ees_sharepoint.extraction.extract")
+    def test_files_holding_no_text_are_cached(self, extract):
+        extract.return_value = None
+        self.extractor.cache = unittest.mock.Mock()
+
+        assert self.extractor.submit(b"image", "file", "file:1").result() == ""
+        self.extractor.cache.set.assert_called_once_with("file:1", "")
@@ -0,0 +1,56 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+
+from ees_sharepoint.extraction_cache import ExtractionCache
+
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "extraction_cache.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cache_persists_between_syncs(self):
+        ExtractionCache(logging.getLogger("test"), 100, self.path).set("file:1", "content")
+
+        cache = ExtractionCache(logging.getLogger("test"), 100, self.path)
+
+        assert cache.get("file:1") == "content"
+        assert cache.get("file:2") is None
+        assert cache.get_stats() == {"hits": 1, "misses": 1, "size": 7}
+
+    def test_least_recently_used_files_are_evicted(self):
+        cache = ExtractionCache(logging.getLogger("test"), 25, self.path)
+        cache.set("file:1", "0123456789")
+        cache.set("file:2", "0123456789")
+        cache.get("file:1")
+
+        cache.set("file:3", "0123456789")
+
+        assert cache.get("file:2") is None
+        assert cache.get("file:1") == "0123456789"
+        assert cache.size == 20
+
+    def test_access_times_are_written_in_batches(self):
+        cache = ExtractionCache(logging.getLogger("test"), 100, self.path)
+        with unittest.mock.patch("time.time", return_value=1.0):
+            cache.set("file:1", "content")
+        with unittest.mock.patch("time.time", return_value=2.0):
+            assert cache.get("file:1") == "content"
+
+        connection = sqlite3.connect(self.path)
+        assert connection.execute("SELECT accessed_at FROM extraction_cache").fetchone()[0] == 1.0
+        cache.flush()
+        assert connection.execute("SELECT accessed_at FROM extraction_cache").fetchone()[0] == 2.0
+        connection.close()
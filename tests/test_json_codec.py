@@ -0,0 +1,20 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import json
+from datetime import datetime
+
+from ees_sharepoint import json_codec
+
+
+def test_dumps_matches_the_json_module():
+    value = {"title": "Été \"quoted\"", "created": datetime(2022, 1, 1), "size": 2 ** 70, "tags": [1.5, None, True]}
+
+    assert json_codec.dumps(value) == json.dumps(value, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+def test_loads_bytes_and_strings():
+    assert json_codec.loads(b'{"d": {"results": [1]}}') == {"d": {"results": [1]}}
+    assert json_codec.loads('{"title": "\\u00e9"}') == {"title": "é"}
@@ -0,0 +1,218 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import copy
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+import uuid
+
+from ees_sharepoint import local_storage
+from ees_sharepoint.local_storage import BinaryStorage, FingerprintStorage, GuidBlock, LocalStorage, SqliteStorage
+
+IDS = {
+    "sites": {"site-1": "/sites/collection/site"},
+    "lists": {"/sites/collection/site": {"list-1": "Documents"}},
+    "list_items": {"/sites/collection/site": {"list-1": {"item-1", "item-2"}}},
+    "drive_items": {},
+}
+
+
+class TestSqliteStorage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "doc_id.db")
+        self.json_path = os.path.join(self.directory.name, "doc_id.json")
+        patcher = unittest.mock.patch.object(local_storage, "IDS_PATH", self.json_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sync_marks_stored_ids_for_deletion_check(self):
+        storage = SqliteStorage(logging.getLogger("test"), self.path)
+        storage.update_storage({"global_keys": {"collection": IDS}, "delete_keys": {"collection": IDS}})
+
+        storage = SqliteStorage(logging.getLogger("test"), self.path)
+        storage_with_collection = storage.get_storage_with_collection("collection")
+        ids = storage_with_collection["global_keys"]["collection"]
+        assert ids == IDS
+        ids["list_items"]["/sites/collection/site"]["list-1"] = {"item-2", "item-3"}
+        storage.update_storage(storage_with_collection)
+
+        loaded = storage.load_storage()
+        assert loaded["global_keys"]["collection"]["list_items"] == {
+            "/sites/collection/site": {"list-1": {"item-2", "item-3"}}
+        }
+        # Only the ids stored before the last sync are checked by the deletion sync
+        assert loaded["delete_keys"]["collection"]["list_items"] == {"/sites/collection/site": {"list-1": {"item-2"}}}
+
+        loaded["delete_keys"] = {}
+        storage.update_storage(loaded)
+        assert storage.load_storage()["delete_keys"] == {}
+
+    def test_imports_json(self):
+        with open(self.json_path, "w") as ids_file:
+            json.dump({"global_keys": {"collection": IDS}, "delete_keys": {}}, ids_file, default=sorted)
+
+        storage = SqliteStorage(logging.getLogger("test"), self.path)
+
+        assert storage.load_storage() == {"global_keys": {"collection": IDS}, "delete_keys": {}}
+
+    def test_writes_only_the_ids_added_and_removed(self):
+        storage = SqliteStorage(logging.getLogger("test"), self.path)
+        storage.update_storage({"global_keys": {"collection": IDS}, "delete_keys": {}})
+        storage_with_collection = storage.get_storage_with_collection("collection")
+        ids = storage_with_collection["global_keys"]["collection"]
+
+        storage.update_storage(storage_with_collection)
+        # The rows of the unchanged ids keep the generation they were written with
+        assert storage.connection.execute("SELECT MAX(generation) FROM ids").fetchone()[0] == 1
+
+        ids["list_items"]["/sites/collection/site"]["list-1"].add("item-3")
+        ids["list_items"]["/sites/collection/site"]["list-1"].discard("item-1")
+        ids["lists"]["/sites/collection/site"].pop("list-1")
+        ids["drive_items"].setdefault("/sites/collection/site", {}).setdefault("list-2", set()).add("file-1")
+        upserts, deletes = {}, set()
+        local_storage.diff_ids(storage.stored_ids["collection"], ids, upserts, deletes)
+        assert upserts == {
+            ("list_items", "/sites/collection/site", "list-1", "item-3"): None,
+            ("drive_items", "/sites/collection/site", "list-2", "file-1"): None,
+        }
+        assert deletes == {
+            ("list_items", "/sites/collection/site", "list-1", "item-1"),
+            ("lists", "/sites/collection/site", "", "list-1"),
+        }
+        storage.update_storage(storage_with_collection)
+
+        assert storage.connection.execute("SELECT COUNT(*) FROM ids WHERE generation = 3").fetchone()[0] == 2
+        assert SqliteStorage(logging.getLogger("test"), self.path).load_storage()["global_keys"]["collection"] == {
+            "sites": {"site-1": "/sites/collection/site"},
+            "lists": {},
+            "list_items": {"/sites/collection/site": {"list-1": {"item-2", "item-3"}}},
+            "drive_items": {"/sites/collection/site": {"list-2": {"file-1"}}},
+        }
+
+    def test_replaces_the_ids_of_a_collection_in_a_single_transaction(self):
+        storage = SqliteStorage(logging.getLogger("test"), self.path)
+        storage.update_storage({"global_keys": {"collection": IDS}, "delete_keys": {}})
+        storage.stored_ids = {}
+
+        with unittest.mock.patch.object(local_storage, "flatten_ids", return_value={("sites", "", "", "site-2"): object()}):
+            with self.assertRaises(sqlite3.Error):
+                storage.update_storage({"global_keys": {"collection": IDS}, "delete_keys": {}})
+
+        assert storage.load_storage()["global_keys"]["collection"] == IDS
+
+
+class TestLocalStorage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = unittest.mock.patch.object(local_storage, "IDS_PATH", os.path.join(self.directory.name, "doc_id.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_item_ids_are_loaded_as_sets(self):
+        storage = LocalStorage(logging.getLogger("test"))
+        storage_with_collection = storage.get_storage_with_collection("collection")
+        storage_with_collection["global_keys"]["collection"] = IDS
+        storage.update_storage(storage_with_collection)
+
+        ids = storage.get_storage_with_collection("collection")["global_keys"]["collection"]
+
+        assert ids["list_items"]["/sites/collection/site"]["list-1"] == {"item-1", "item-2"}
+
+
+class TestBinaryStorage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "doc_id.idx")
+        patcher = unittest.mock.patch.object(local_storage, "IDS_PATH", os.path.join(self.directory.name, "doc_id.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_guid_block(self):
+        guids = [str(uuid.uuid4()) for _ in range(10)]
+        block = GuidBlock.from_ids(guids + ["not-a-guid"])
+
+        assert len(block) == 11
+        assert set(block) == set(guids) | {"not-a-guid"}
+        assert all(guid in block for guid in guids)
+        assert str(uuid.uuid4()) not in block
+
+        block.difference_update(guids[:5] + ["not-a-guid"])
+        assert set(block) == set(guids[5:])
+
+    def test_ids_round_trip_through_the_index(self):
+        storage = BinaryStorage(logging.getLogger("test"), self.path)
+        item_ids = {str(uuid.uuid4()) for _ in range(3)}
+        ids = copy.deepcopy(IDS)
+        ids["drive_items"] = {"/sites/collection/site": {"list-2": item_ids}}
+        storage.update_storage({"global_keys": {"collection": ids}, "delete_keys": {}})
+
+        storage_with_collection = storage.get_storage_with_collection("collection")
+        assert storage_with_collection["global_keys"]["collection"] == ids
+        storage.update_storage(storage_with_collection)
+
+        loaded = storage.load_storage()
+        block = loaded["delete_keys"]["collection"]["drive_items"]["/sites/collection/site"]["list-2"]
+        assert isinstance(block, GuidBlock)
+        assert set(block) == item_ids
+        storage.close()
+
+    def test_unchanged_blocks_are_written_once(self):
+        storage = BinaryStorage(logging.getLogger("test"), self.path)
+        ids = copy.deepcopy(IDS)
+        ids["drive_items"] = {"/sites/collection/site": {"list-2": {str(uuid.uuid4()) for _ in range(1000)}}}
+        storage.update_storage({"global_keys": {"collection": ids}, "delete_keys": {}})
+        size = os.path.getsize(self.path)
+
+        for _ in range(2):
+            storage.update_storage(storage.get_storage_with_collection("collection"))
+            # Only the header grows with the delete_keys, the 16 bytes GUIDs are not written again
+            assert os.path.getsize(self.path) < size + 1000
+        loaded = storage.load_storage()
+        blocks = [loaded[key]["collection"]["drive_items"]["/sites/collection/site"]["list-2"] for key in loaded]
+        assert blocks[0].start == blocks[1].start and set(blocks[0]) == set(blocks[1])
+        storage.close()
+
+
+class TestFingerprintStorage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "doc_fingerprint.db")
+
+    def test_unchanged_documents_are_skipped_once_indexed(self):
+        documents = [{"id": "1", "title": "a", "_allow_permissions": ["user"]}, {"id": "2", "title": "b"}]
+        storage = FingerprintStorage(logging.getLogger("test"), self.path)
+        assert storage.get_changed_documents(documents) == documents
+        storage.commit(["1"])
+
+        storage = FingerprintStorage(logging.getLogger("test"), self.path)
+        changed_permissions = {"id": "1", "title": "a", "_allow_permissions": ["user", "group"]}
+        assert storage.get_changed_documents(documents) == [documents[1]]
+        assert storage.get_changed_documents([changed_permissions]) == [changed_permissions]
+        assert storage.get_stats() == {"skipped": 1, "sent": 2}
+
+    def test_removed_documents_are_sent_again(self):
+        storage = FingerprintStorage(logging.getLogger("test"), self.path)
+        storage.get_changed_documents([{"id": "1"}])
+        storage.commit(["1"])
+
+        storage.remove(["1"])
+
+        assert storage.get_changed_documents([{"id": "1"}]) == [{"id": "1"}]
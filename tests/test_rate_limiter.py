@@ -0,0 +1,73 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import unittest
+import unittest.mock
+
+from ees_sharepoint.rate_limiter import RateLimiter, get_request_class, get_retry_after, is_throttled
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_get_retry_after(self):
+        assert get_retry_after({"Retry-After": "12"}) == 12
+        assert get_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+        assert get_retry_after({"Retry-After": "soon"}) is None
+        assert get_retry_after({}) is None
+
+    def test_is_throttled(self):
+        assert is_throttled(429, None)
+        assert is_throttled(503, 10)
+        assert not is_throttled(503, None)
+        assert not is_throttled(200, None)
+
+    def test_throttled_response_pauses_requests_and_halves_the_limit(self):
+        rate_limiter = RateLimiter(8)
+        assert rate_limiter.try_acquire() is None
+
+        rate_limiter.release(0.1, 429, 30)
+
+        assert 30 <= rate_limiter.try_acquire() <= 36
+        assert rate_limiter.get_stats()["concurrency_limit"] == 4
+        assert rate_limiter.get_stats()["throttled"] == 1
+
+    def test_limit_grows_while_the_latency_is_steady(self):
+        rate_limiter = RateLimiter(8)
+        rate_limiter.limit = 2.0
+        for _ in range(4):
+            assert rate_limiter.try_acquire() is None
+            rate_limiter.release(0.1, 200)
+
+        assert rate_limiter.get_stats()["concurrency_limit"] == 3
+
+    def test_slow_classes_of_requests_do_not_halve_the_limit(self):
+        rate_limiter = RateLimiter(8)
+        for _ in range(30):
+            rate_limiter.try_acquire()
+            rate_limiter.release(0.1, 200, request_class=get_request_class("http://host/_api/web/lists"))
+            rate_limiter.try_acquire()
+            rate_limiter.release(3, 200, request_class=get_request_class("http://host/_api/web/lists(guid'1')/items"))
+
+        assert rate_limiter.get_stats()["concurrency_decreases"] == 0
+        assert get_request_class("http://host/_api/web/lists(guid'1')/items(2)/roleassignments") == "permissions"
+        assert get_request_class("http://host/_api/web/GetFileByServerRelativeUrl('/a.docx')/$value") == "downloads"
+
+    def test_limit_caps_the_requests_in_flight(self):
+        rate_limiter = RateLimiter(2)
+        assert rate_limiter.try_acquire() is None
+        assert rate_limiter.try_acquire() is None
+        assert rate_limiter.try_acquire() is not None
+
+        rate_limiter.release(0.1, 200)
+
+        assert rate_limiter.try_acquire() is None
+
+    def test_token_bucket_caps_the_request_rate(self):
+        with unittest.mock.patch("time.monotonic", return_value=100.0):
+            rate_limiter = RateLimiter(10, max_rate=2)
+            assert rate_limiter.try_acquire() is None
+            assert rate_limiter.try_acquire() is None
+            assert rate_limiter.try_acquire() == 0.5
+        with unittest.mock.patch("time.monotonic", return_value=100.5):
+            assert rate_limiter.try_acquire() is None
@@ -0,0 +1,223 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import json
+import logging
+import unittest
+import unittest.mock
+
+import requests
+
+from ees_sharepoint.sharepoint_client import PAGE_SIZE, BatchResponseException, SharePoint, parse_page
+
+CONFIG = {
+    "retry_count": 1,
+    "sharepoint.host_url": "http://sharepoint",
+    "sharepoint.domain": "domain",
+    "sharepoint.username": "username",
+    "sharepoint.password": "password",
+    "sharepoint.secure_connection": False,
+    "sharepoint.certificate_path": "",
+    "sharepoint_sync_thread_count": 2,
+    "sharepoint_max_requests_per_second": 0,
+    "sharepoint_odata_metadata": "verbose",
+}
+
+
+def mock_response(data):
+    response = unittest.mock.Mock(ok=True, status_code=200, headers={})
+    response.json.return_value = data
+    response.content = json.dumps(data).encode("utf-8")
+    return response
+
+
+class TestSharePoint(unittest.TestCase):
+    def setUp(self):
+        config = unittest.mock.Mock()
+        config.get_value.side_effect = CONFIG.get
+        self.sharepoint = SharePoint(config, logging.getLogger("test"))
+
+    def test_get_pages_follows_next_links(self):
+        self.sharepoint.fetch = unittest.mock.Mock(side_effect=[
+            mock_response({"d": {"results": [{"Id": 1}], "__next": "http://sharepoint/next"}}),
+            mock_response({"d": {"results": [{"Id": 2}]}}),
+        ])
+
+        pages = self.sharepoint.get_pages("sites/collection/_api/web/lists(guid'1')/items?$select=*", "", "list_items")
+
+        assert next(pages) == [{"Id": 1}]
+        # the next page is only requested once the first one was consumed
+        assert self.sharepoint.fetch.call_count == 1
+        assert list(pages) == [[{"Id": 2}]]
+        self.sharepoint.fetch.assert_called_with("http://sharepoint/next", "list_items", headers=None)
+
+    def test_parse_page_lays_out_light_formats_as_verbose(self):
+        verbose = {"d": {"results": [{"Id": 1, "AttachmentFiles": {"results": [{"FileName": "a"}]}}], "__next": "next"}}
+        light = {"value": [{"Id": 1, "AttachmentFiles": [{"FileName": "a"}]}], "odata.nextLink": "next"}
+
+        assert parse_page(json.dumps(verbose).encode("utf-8")) == (verbose["d"]["results"], "next")
+        assert parse_page(json.dumps(light).encode("utf-8")) == (verbose["d"]["results"], "next")
+        assert parse_page(b'{"value": []}') == ([], None)
+
+    def test_get_pages_requests_light_metadata(self):
+        config = unittest.mock.Mock()
+        config.get_value.side_effect = dict(CONFIG, sharepoint_odata_metadata="nometadata").get
+        sharepoint = SharePoint(config, logging.getLogger("test"))
+        sharepoint.fetch = unittest.mock.Mock(return_value=mock_response({"value": [{"Id": 1}]}))
+
+        assert list(sharepoint.get_pages("sites/collection/_api/web/lists", "?$select=Id", "list_items")) == [[{"Id": 1}]]
+        sharepoint.fetch.assert_called_with(
+            "http://sharepoint/sites/collection/_api/web/lists?$select=Id&$top=5000",
+            "list_items",
+            headers={"accept": "application/json;odata=nometadata"},
+        )
+
+    def test_send_retries_throttled_requests(self):
+        throttled = unittest.mock.Mock(ok=False, status_code=429, headers={"Retry-After": "0"})
+        session = unittest.mock.Mock()
+        session.request.side_effect = [throttled, mock_response({})]
+        self.sharepoint.session_pool.put(session)
+
+        response = self.sharepoint.send("GET", "http://sharepoint/_api/web")
+
+        assert response.ok
+        assert session.request.call_count == 2
+        assert self.sharepoint.rate_limiter.get_stats()["throttled"] == 1
+
+    def test_get_accumulates_pages(self):
+        self.sharepoint.fetch = unittest.mock.Mock(side_effect=[
+            mock_response({"d": {"results": [{"Id": 1}], "__next": "http://sharepoint/next"}}),
+            mock_response({"d": {"results": [{"Id": 2}]}}),
+        ])
+
+        response = self.sharepoint.get("sites/collection/_api/web/lists(guid'1')/items?$select=*", "", "list_items")
+
+        assert response == {"d": {"results": [{"Id": 1}, {"Id": 2}]}}
+
+    def test_get_skips_to_the_next_page_of_sites_after_a_full_page(self):
+        full_page = [{"Id": index} for index in range(PAGE_SIZE)]
+        self.sharepoint.fetch = unittest.mock.Mock(side_effect=[
+            mock_response({"d": {"results": full_page}}),
+            mock_response({"d": {"results": [{"Id": PAGE_SIZE}]}}),
+        ])
+
+        response = self.sharepoint.get("sites/collection/_api/web/webs", "?$select=Id", "sites")
+
+        assert len(response["d"]["results"]) == PAGE_SIZE + 1
+        self.sharepoint.fetch.assert_called_with(
+            f"http://sharepoint/sites/collection/_api/web/webs?$select=Id&$skip={PAGE_SIZE}&$top={PAGE_SIZE}",
+            "sites",
+            headers=None,
+        )
+
+    def test_parse_batch_response(self):
+        response = unittest.mock.Mock(
+            headers={"content-type": "multipart/mixed; boundary=batchresponse_1"},
+            text=(
+                "--batchresponse_1\r\n"
+                "Content-Type: application/http\r\n"
+                "Content-Transfer-Encoding: binary\r\n\r\n"
+                "HTTP/1.1 200 OK\r\n"
+                "CONTENT-TYPE: application/json;odata=verbose;charset=utf-8\r\n\r\n"
+                '{"d": {"results": [{"Title": "Owners"}]}}\r\n'
+                "--batchresponse_1\r\n"
+                "Content-Type: application/http\r\n"
+                "Content-Transfer-Encoding: binary\r\n\r\n"
+                "HTTP/1.1 404 Not Found\r\n"
+                "CONTENT-TYPE: application/json;odata=verbose;charset=utf-8\r\n\r\n"
+                '{"error": {}}\r\n'
+                "--batchresponse_1--\r\n"
+            ),
+        )
+
+        responses = SharePoint.parse_batch_response(response)
+
+        assert [sub_response.status_code for sub_response in responses] == [200, 404]
+        assert responses[0].json() == {"d": {"results": [{"Title": "Owners"}]}}
+        assert not responses[1]
+
+    def test_parse_batch_response_checks_the_number_of_responses(self):
+        response = unittest.mock.Mock(
+            headers={"content-type": "multipart/mixed; boundary=batchresponse_1"},
+            text=(
+                "--batchresponse_1\r\n"
+                "Content-Type: application/http\r\n\r\n"
+                "HTTP/1.1 200 OK\r\n\r\n"
+                "{}\r\n"
+                "--batchresponse_1--\r\n"
+            ),
+        )
+
+        with self.assertRaises(BatchResponseException):
+            SharePoint.parse_batch_response(response, 2)
+
+    def test_send_batch_falls_back_only_for_the_rejected_request(self):
+        self.sharepoint.get_form_digest = unittest.mock.Mock(return_value="digest")
+        self.sharepoint.send = unittest.mock.Mock(return_value=unittest.mock.Mock(ok=False, status_code=400))
+
+        assert self.sharepoint.send_batch("sites/collection", ["a", "b"]) is None
+        assert self.sharepoint.batch_supported
+        self.sharepoint.send.assert_called_once()
+
+    def test_get_returns_a_falsy_result_when_a_page_fails(self):
+        rejected = requests.Response()
+        rejected.status_code, rejected.reason = 401, "Unauthorized"
+        self.sharepoint.send = unittest.mock.Mock(return_value=rejected)
+
+        assert not self.sharepoint.get("sites/collection/_api/web/webs", "?", "sites")
+
+        self.sharepoint.fetch = unittest.mock.Mock(side_effect=[
+            mock_response({"d": {"results": [{"Id": 1}], "__next": "http://sharepoint/next"}}),
+            False,
+        ])
+        assert self.sharepoint.get("sites/collection/_api/web/lists(guid'1')/items", "?$select=Id", "list_items") is False
+
+    def test_get_batch_retries_failed_sub_requests(self):
+        ok, error = mock_response({}), unittest.mock.Mock(ok=False, status_code=503, headers={})
+        self.sharepoint.send_batch = unittest.mock.Mock(side_effect=[[ok, error], [ok]])
+
+        with unittest.mock.patch("time.sleep"):
+            responses = self.sharepoint.get_batch("sites/collection", ["a", "b"], "permission_users")
+
+        assert responses == [ok, ok]
+        self.sharepoint.send_batch.assert_called_with("sites/collection", ["b"])
+
+    def test_get_batch_falls_back_to_single_requests(self):
+        self.sharepoint.send_batch = unittest.mock.Mock(return_value=None)
+        self.sharepoint.fetch = unittest.mock.Mock(return_value=mock_response({}))
+
+        responses = self.sharepoint.get_batch("sites/collection", ["a", "b"], "permission_users")
+
+        assert len(responses) == 2
+        assert self.sharepoint.fetch.call_count == 2
+
+    def test_spool_skips_or_truncates_large_files(self):
+        response = unittest.mock.Mock(headers={})
+        response.iter_content.side_effect = lambda chunk_size: iter([b"0123", b"4567", b"89"])
+
+        assert self.sharepoint.spool(response, "file", 10, truncate=False).read() == b"0123456789"
+        assert self.sharepoint.spool(response, "file", 6, truncate=False) is None
+        assert self.sharepoint.spool(response, "file", 6, truncate=True).read() == b"012345"
+
+    def test_get_change_token(self):
+        self.sharepoint.fetch = unittest.mock.Mock(return_value=mock_response({"d": {"Id": "site-id"}}))
+
+        change_token = self.sharepoint.get_change_token("sites/collection", "2022-01-01T00:00:00Z")
+
+        assert change_token == "1;1;site-id;637765920000000000;-1"
+
+    def test_get_list_item_ids(self):
+        not_found = unittest.mock.Mock(ok=False, status_code=404)
+        not_found.__bool__ = lambda self: False
+        self.sharepoint.fetch = unittest.mock.Mock(side_effect=[
+            mock_response({"d": {"results": [{"GUID": "a"}], "__next": "http://sharepoint/next"}}),
+            mock_response({"d": {"results": [{"GUID": "b"}]}}),
+            not_found,
+            False,
+        ])
+
+        assert self.sharepoint.get_list_item_ids("sites/collection", "list-id") == {"a", "b"}
+        assert self.sharepoint.get_list_item_ids("sites/collection", "list-id") == set()
+        assert self.sharepoint.get_list_item_ids("sites/collection", "list-id") is None
@@ -0,0 +1,156 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+import unittest.mock
+
+from elastic_enterprise_search import BadRequestError, ConnectionTimeout, PayloadTooLargeError, ServiceUnavailableError
+
+from ees_sharepoint.sync_enterprise_search import MIN_BATCH_BYTES, SyncEnterpriseSearch
+
+
+class TestSyncEnterpriseSearch(unittest.TestCase):
+    def setUp(self):
+        self.queue = queue.Queue()
+        self.client = unittest.mock.Mock()
+        self.client.index_documents.side_effect = lambda documents, timeout: {
+            "results": [{"id": document["id"], "errors": []} for document in json.loads(documents)]
+        }
+        config = unittest.mock.Mock()
+        config.get_value.side_effect = {"max_batch_payload_size": 1, "retry_count": 2}.get
+        self.sync_es = SyncEnterpriseSearch(config, logging.getLogger("test"), self.client, self.queue)
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.sync_es.dead_letter_path = os.path.join(temporary_directory.name, "dead_letter.jsonl")
+        sleep = unittest.mock.patch("time.sleep")
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def index_batch(self, documents):
+        self.sync_es.index_batch(documents, [json.dumps(document) for document in documents])
+
+    def get_batches(self):
+        return [json.loads(call.kwargs["documents"]) for call in self.client.index_documents.call_args_list]
+
+    def read_dead_letter(self):
+        with open(self.sync_es.dead_letter_path, encoding="utf-8") as dead_letter_file:
+            return [json.loads(line) for line in dead_letter_file]
+
+    def test_perform_sync_collects_checkpoints_until_end_signal(self):
+        self.queue.put({"type": "list_items", "data": [{"id": "1"}, {"id": "2"}]})
+        self.queue.put({"type": "checkpoint", "data": ("collection", "2022-01-01T00:00:00Z", "full", None)})
+        self.queue.put({"type": "signal_close"})
+
+        self.sync_es.perform_sync()
+
+        self.client.index_documents.assert_called_once()
+        assert self.sync_es.checkpoints == [("collection", "2022-01-01T00:00:00Z", "full", None)]
+
+    def test_perform_sync_keeps_consuming_after_failed_batch(self):
+        self.client.index_documents.side_effect = [Exception("timeout"), {"results": [{"id": "2", "errors": []}]}]
+        self.queue.put({"type": "list_items", "data": [{"id": str(i)} for i in range(100)]})
+        self.queue.put({"type": "list_items", "data": [{"id": "2"}]})
+        self.queue.put({"type": "signal_close"})
+
+        self.sync_es.perform_sync()
+
+        assert self.client.index_documents.call_count == 2
+        assert self.queue.empty()
+
+    def test_perform_sync_limits_the_bytes_of_a_batch(self):
+        body = "x" * 400 * 1024
+        self.queue.put({"type": "list_items", "data": [{"id": str(i), "body": body} for i in range(5)]})
+        self.queue.put({"type": "list_items", "data": [{"id": str(i)} for i in range(5, 155)]})
+        self.queue.put({"type": "signal_close"})
+
+        self.sync_es.perform_sync()
+
+        batch_sizes = [len(batch) for batch in self.get_batches()]
+        assert batch_sizes == [2, 2, 100, 51]
+
+    def test_index_batch_splits_batches_too_large(self):
+        def index_documents(documents, timeout):
+            if len(json.loads(documents)) > 2:
+                raise PayloadTooLargeError("too large", status=413)
+            return {"results": []}
+
+        self.client.index_documents.side_effect = index_documents
+        documents = [{"id": str(i)} for i in range(4)]
+
+        self.index_batch(documents)
+
+        batch_sizes = [len(batch) for batch in self.get_batches()]
+        assert batch_sizes == [4, 2, 2]
+        assert self.sync_es.batch_sizer.max_documents == 70
+        assert self.sync_es.batch_sizer.max_bytes == MIN_BATCH_BYTES + 2 * 104857
+
+    def test_index_batch_shrinks_and_retries_after_a_timeout(self):
+        self.client.index_documents.side_effect = [ConnectionTimeout("timeout"), {"results": [{"id": "1", "errors": []}]}]
+
+        self.index_batch([{"id": "1"}])
+
+        assert self.client.index_documents.call_count == 2
+        assert self.sync_es.batch_sizer.max_documents == 60
+        assert self.sync_es.batch_sizer.max_bytes == max(MIN_BATCH_BYTES, 1024 * 1024 // 2) + 104857
+
+    def test_index_batch_retries_only_the_failed_documents(self):
+        self.client.index_documents.side_effect = [
+            {"results": [{"id": "1", "errors": []}, {"id": "2", "errors": ["internal error"]}]},
+            {"results": [{"id": "2", "errors": []}]},
+        ]
+
+        self.index_batch([{"id": "1"}, {"id": "2"}])
+
+        assert self.get_batches()[-1] == [{"id": "2"}]
+        assert not os.path.exists(self.sync_es.dead_letter_path)
+        stats = self.sync_es.get_stats()
+        assert (stats["indexed"], stats["retried"], stats["dead_lettered"], stats["error_rate"]) == (2, 1, 0, 0)
+
+    def test_index_batch_retries_transient_errors_then_dead_letters(self):
+        self.client.index_documents.side_effect = ServiceUnavailableError("unavailable", status=503)
+
+        self.index_batch([{"id": "1"}])
+
+        assert self.client.index_documents.call_count == 3
+        assert [entry["id"] for entry in self.read_dead_letter()] == ["1"]
+        assert self.sync_es.get_stats()["error_rate"] == 1
+
+    def test_index_batch_dead_letters_permanent_errors_right_away(self):
+        self.client.index_documents.side_effect = BadRequestError("invalid", status=400)
+
+        self.index_batch([{"id": "1"}, {"id": "2"}])
+
+        assert self.client.index_documents.call_count == 1
+        assert [entry["document"] for entry in self.read_dead_letter()] == [{"id": "1"}, {"id": "2"}]
+
+    def test_index_batch_does_not_retry_documents_failing_validation(self):
+        self.client.index_documents.side_effect = [
+            {"results": [{"id": "1", "errors": ["Title is too long"]}, {"id": "2", "errors": ["Rate limit exceeded"]}]},
+            {"results": [{"id": "2", "errors": []}]},
+        ]
+
+        self.index_batch([{"id": "1"}, {"id": "2"}])
+
+        assert self.client.index_documents.call_count == 2
+        assert self.get_batches()[-1] == [{"id": "2"}]
+        assert [entry["errors"] for entry in self.read_dead_letter()] == [["Title is too long"]]
+        stats = self.sync_es.get_stats()
+        assert (stats["indexed"], stats["retried"], stats["dead_lettered"]) == (1, 1, 1)
+
+    def test_index_batch_stores_the_fingerprints_of_indexed_documents(self):
+        self.sync_es.fingerprint_storage = unittest.mock.Mock()
+        self.sync_es.retry_count = 0
+        self.client.index_documents.side_effect = [
+            {"results": [{"id": "1", "errors": []}, {"id": "2", "errors": ["invalid"]}]},
+        ]
+
+        self.index_batch([{"id": "1"}, {"id": "2"}])
+
+        self.sync_es.fingerprint_storage.commit.assert_called_once_with(["1"])
@@ -0,0 +1,164 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import logging
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from ees_sharepoint import sync_sharepoint as sync_sharepoint_module
+from ees_sharepoint.base_command import BaseCommand
+from ees_sharepoint.sync_sharepoint import SyncSharepoint
+
+CONFIG = {
+    "objects": {},
+    "sharepoint.site_collections": ["collection"],
+    "enable_document_permission": False,
+    "sharepoint_sync_thread_count": 4,
+    "sharepoint.host_url": "http://sharepoint",
+    "max_file_size": 10,
+    "file_size_policy": "skip",
+}
+
+
+def create_sync_sharepoint():
+    config = unittest.mock.Mock()
+    config.get_value.side_effect = CONFIG.get
+    return SyncSharepoint(
+        config,
+        logging.getLogger("test"),
+        unittest.mock.Mock(),
+        unittest.mock.Mock(),
+        "2022-01-01T00:00:00Z",
+        "2022-02-01T00:00:00Z",
+        unittest.mock.Mock(),
+        unittest.mock.Mock(),
+    )
+
+
+class TestSyncSharepoint(unittest.TestCase):
+    def test_partition_lists_splits_large_lists_into_id_ranges(self):
+        sync_sharepoint = create_sync_sharepoint()
+        sync_sharepoint.sharepoint_client.get_last_item_id.return_value = 24000
+        lists = {
+            "small": ["/sites/collection", "Small", "2022-01-10T00:00:00Z", 10],
+            "large": ["/sites/collection", "Large", "2022-01-10T00:00:00Z", 20000],
+        }
+
+        partitions = sync_sharepoint.partition_lists(lists, 4)
+
+        assert partitions[-1] == {"small": lists["small"]}
+        assert [partition["large"][4] for partition in partitions[:-1]] == [
+            (1, 6001), (6001, 12001), (12001, 18001), (18001, 24001)
+        ]
+        assert sync_sharepoint.get_id_range_filter(partitions[0]["large"]) == " and (Id ge 1) and (Id lt 6001)"
+        assert sync_sharepoint.get_id_range_filter(partitions[-1]["small"]) == ""
+
+    def test_get_select_query_selects_the_synced_and_required_fields(self):
+        sync_sharepoint = create_sync_sharepoint()
+        sync_sharepoint.objects = {
+            "sites": {"include_fields": ["Title"]},
+            "lists": {"exclude_fields": ["Created"]},
+            "list_items": {"include_fields": ["Title", "AuthorId"]},
+            "drive_items": {"include_fields": ["Name"]},
+        }
+
+        assert sync_sharepoint.get_select_query("sites") == (
+            "$select=Title,Id,ServerRelativeUrl,LastItemModifiedDate,Created"
+        )
+        assert sync_sharepoint.get_select_query("lists") == (
+            "$select=Id,LastItemModifiedDate,ParentWebUrl,Title,BaseType,ItemCount,HasUniqueRoleAssignments,"
+            "RootFolder/ServerRelativeUrl&$expand=RootFolder"
+        )
+        assert sync_sharepoint.get_select_query("list_items") == (
+            "$select=Title,AuthorId,GUID,Id,Modified,FileRef,FileDirRef,HasUniqueRoleAssignments,Attachments,"
+            "AttachmentFiles&$expand=AttachmentFiles"
+        )
+        assert sync_sharepoint.get_select_query("drive_items") == (
+            "$select=File/Name,GUID,Id,ID,Modified,FileDirRef,HasUniqueRoleAssignments,File/TimeLastModified,"
+            "File/ServerRelativeUrl,File/UniqueId,File/ETag,Folder&$expand=File,Folder"
+        )
+
+    def test_discover_sites_fetches_the_subsites_of_unchanged_sites(self):
+        webs = {
+            "/sites/collection": [("/sites/collection/a", "2022-01-10T00:00:00Z"), ("/sites/collection/b", "2021-06-01T00:00:00Z")],
+            "/sites/collection/a": [("/sites/collection/a/c", "2021-06-01T00:00:00Z")],
+            "/sites/collection/b": [("/sites/collection/b/d", "2021-06-01T00:00:00Z")],
+            "/sites/collection/a/c": [],
+            "/sites/collection/b/d": [],
+        }
+
+        def get(rel_url, query, param_name):
+            # the subsites are fetched page by page, so that no subsite is left out
+            assert param_name == "sites"
+            site_url = rel_url.split("/_api/")[0]
+            if site_url not in webs:
+                return False
+            return {"d": {"results": [
+                {"ServerRelativeUrl": url, "LastItemModifiedDate": modified} for url, modified in webs[site_url]
+            ]}}
+
+        with tempfile.TemporaryDirectory() as directory:
+            with unittest.mock.patch.object(sync_sharepoint_module, "SITE_TREE_PATH", os.path.join(directory, "tree.json")):
+                sync_sharepoint = create_sync_sharepoint()
+                sync_sharepoint.sharepoint_client.get.side_effect = get
+                sites = sync_sharepoint.discover_sites("collection", 2, {})
+                assert sites == {url: modified for children in webs.values() for url, modified in children}
+
+                # The date of a site does not change along with the one of its subsites
+                webs["/sites/collection/b"] = [("/sites/collection/b/d", "2022-01-10T00:00:00Z")]
+                sites = sync_sharepoint.discover_sites("collection", 2, {})
+                assert sites["/sites/collection/b/d"] == "2022-01-10T00:00:00Z"
+
+                # The cached subsites are used when the subsites of a site can not be fetched
+                webs.pop("/sites/collection/a")
+                sites = sync_sharepoint.discover_sites("collection", 2, {})
+                assert sites["/sites/collection/a/c"] == "2021-06-01T00:00:00Z"
+
+    def test_change_log_is_read_up_to_the_end_time(self):
+        sync_sharepoint = create_sync_sharepoint()
+        client = sync_sharepoint.sharepoint_client
+        client.get_change_token.return_value = "end-token"
+        client.get_changes.return_value = []
+
+        change_token = sync_sharepoint.fetch_records_from_change_log(
+            BaseCommand.producer, 2, {"sites": {}, "lists": {}, "list_items": {}, "drive_items": {}}, "collection", "start-token"
+        )
+
+        client.get_change_token.assert_called_with("sites/collection", "2022-02-01T00:00:00Z")
+        client.get_changes.assert_called_with("sites/collection", "start-token", "end-token")
+        # changes made after the end time are left to the next sync, which starts from the end time
+        assert change_token == "end-token"
+
+    def test_change_log_items_are_fetched_by_id_whatever_their_modification_date(self):
+        sync_sharepoint = create_sync_sharepoint()
+        sync_sharepoint.objects = {"lists": {}, "list_items": {}}
+        client = sync_sharepoint.sharepoint_client
+        client.get_change_token.return_value = "end-token"
+        client.get_changes.return_value = [{
+            "__metadata": {"type": "SP.ChangeItem"}, "ChangeType": 7, "WebId": "web", "ListId": "LIST", "ItemId": 7,
+        }]
+        root_web = unittest.mock.Mock()
+        root_web.json.return_value = {"d": {"Id": "web", "ServerRelativeUrl": "/sites/collection"}}
+        lists = {"d": {"results": [{
+            "Id": "list", "BaseType": 0, "Title": "List", "ParentWebUrl": "/sites/collection",
+            "LastItemModifiedDate": "2021-01-01T00:00:00Z", "ItemCount": 1, "Created": "2020-01-01T00:00:00Z",
+            "RootFolder": {"ServerRelativeUrl": "/sites/collection/Lists/List"},
+        }]}}
+        client.get.side_effect = lambda rel_url, query, param_name: root_web if param_name == "site" else lists
+        # the restored item was last modified long before the sync time range
+        client.get_pages.return_value = [[{
+            "GUID": "item", "Id": 7, "Title": "Item", "Modified": "2020-06-01T00:00:00Z", "FileRef": "/item",
+        }]]
+        ids = {"sites": {}, "lists": {}, "list_items": {}, "drive_items": {}}
+
+        sync_sharepoint.fetch_records_from_change_log(BaseCommand.producer, 2, ids, "collection", "start-token")
+
+        assert "(Id eq guid'list')" in client.get.call_args_list[-1].args[1]
+        assert "LastItemModifiedDate" not in client.get.call_args_list[-1].args[1]
+        rel_url, query, _ = client.get_pages.call_args.args
+        assert query == "&$filter=(Id eq 7)"
+        assert ids["list_items"] == {"/sites/collection": {"list": {"item"}}}